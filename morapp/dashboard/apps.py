@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class DashboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dashboard'
+
+    def ready(self):
+        # Only the pre-warm, ingestion, blob refcount, search, typeahead, counter and catalog cache receivers are
+        # wired up; the email handlers in signals.py stay dormant because the views already send those emails themselves.
+        from . import prewarm, ingestion, storage, search, typeahead, counters, catalog_cache  # noqa: F401
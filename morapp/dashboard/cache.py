@@ -0,0 +1,208 @@
+import os
+import hashlib
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+from django.conf import settings
+
+logger = logging.getLogger('dashboard')
+
+class DiskCache:
+    """
+    Content-addressed file cache with a byte budget.
+    Keys are tuples hashed into sharded file names under the cache directory.
+    Files are written to a temp file and atomically renamed into place, and the
+    file mtime doubles as the last-access time so LRU eviction works across
+    worker processes sharing the same directory.
+    """
+    def __init__(self, subdir, max_bytes, suffix=''):
+        self.subdir = subdir
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self):
+        return os.path.join(settings.MEDIA_ROOT, 'cache', self.subdir)
+
+    def make_key(self, *parts):
+        return hashlib.sha256('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}{self.suffix}')
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    @contextmanager
+    def open_for_write(self, key):
+        """Yield a binary file object; the entry only becomes visible once the block completes."""
+        tmp_path = self.reserve(key)
+        try:
+            with open(tmp_path, 'wb') as fh:
+                yield fh
+        except BaseException:
+            self.discard(tmp_path)
+            raise
+        self.commit(key, tmp_path)
+
+    def reserve(self, key):
+        """Create and return a temp file next to the entry, for writers in other processes."""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        os.close(fd)
+        return tmp_path
+
+    def commit(self, key, tmp_path):
+        """Atomically publish a reserved temp file as the entry for key."""
+        path = self.path_for(key)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            self.discard(tmp_path)
+            raise
+        self._account(os.path.getsize(path))
+        return path
+
+    def discard(self, tmp_path):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    def put(self, key, data):
+        with self.open_for_write(key) as fh:
+            fh.write(data)
+        return self.path_for(key)
+
+    def delete(self, key):
+        path = self.path_for(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return False
+        with self._lock:
+            if self._size is not None:
+                self._size -= size
+        return True
+
+    def clear(self):
+        for path, _, size in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        entries = list(self._entries())
+        with self._lock:
+            return {
+                'entries': len(entries),
+                'bytes': sum(size for _, _, size in entries),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _entries(self):
+        if not os.path.isdir(self.directory):
+            return
+        for shard in os.listdir(self.directory):
+            shard_dir = os.path.join(self.directory, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for filename in os.listdir(shard_dir):
+                if filename.startswith('.tmp-'):
+                    continue
+                path = os.path.join(shard_dir, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def _account(self, added):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, _, size in self._entries())
+            else:
+                self._size += added
+            over_budget = self._size > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache is under its byte budget."""
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        evicted = 0
+        for path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._size = total
+            self.evictions += evicted
+        if evicted:
+            logger.info(f"Evicted {evicted} entries from {self.subdir} cache")
+        return evicted
+
+_file_digests = {}
+_file_digests_lock = threading.Lock()
+
+def get_file_digest(path):
+    """SHA-256 of a file, memoised per (path, mtime, size) so unchanged files are hashed once."""
+    from .storage import blob_digest
+    digest = blob_digest(path)
+    if digest:
+        # Content-addressed blobs are named by their hash and never rewritten
+        return digest
+    stat = os.stat(path)
+    memo_key = (path, stat.st_mtime_ns, stat.st_size)
+    with _file_digests_lock:
+        digest = _file_digests.get(memo_key)
+    if digest:
+        return digest
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    with _file_digests_lock:
+        if len(_file_digests) > 4096:
+            _file_digests.clear()
+        _file_digests[memo_key] = digest
+    return digest
+
+watermarked_pdf_cache = DiskCache(
+    'watermarked',
+    max_bytes=getattr(settings, 'WATERMARKED_PDF_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024),
+    suffix='.pdf'
+)
@@ -0,0 +1,118 @@
+import time
+import hashlib
+import logging
+import threading
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.response import Response
+from website.models import Report, ReportCategory
+
+logger = logging.getLogger('dashboard')
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+def bump_catalog_version():
+    # A new unique value rather than incr(): the database cache increments with a
+    # read and a write, so two concurrent bumps could land on the same number
+    cache.set(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+def normalize_query(query_params):
+    """Sorted, blank-free query string, so ?b=2&a=1 and ?a=1&b=2&c= share an entry."""
+    items = sorted(
+        (key, value.strip()) for key in query_params for value in query_params.getlist(key) if value.strip()
+    )
+    return urlencode(items)
+
+class CatalogResponseCache:
+    """
+    Caches the data of anonymous catalog responses in the Django cache, keyed
+    by URL (host included, pagination links are absolute) and normalized query
+    string. Each entry records the catalog version it was built at; a
+    different version or an age over CATALOG_RESPONSE_CACHE_TTL makes it
+    stale. A stale entry is rebuilt by the one request that wins the rebuild
+    lock while the others keep being answered from it, so a burst of traffic
+    right after a catalog change runs the queries once. Entries are dropped
+    CATALOG_RESPONSE_CACHE_STALE_SECONDS after going stale.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, attr):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+    def make_key(self, request):
+        url = f'{request.build_absolute_uri(request.path)}?{normalize_query(request.GET)}'
+        return 'catalog:response:' + hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def respond(self, request, build):
+        ttl = getattr(settings, 'CATALOG_RESPONSE_CACHE_TTL', 60)
+        if not ttl:
+            return build()
+        key = self.make_key(request)
+        version = get_catalog_version()
+        entry = cache.get(key)
+        if entry is not None and entry['version'] == version and time.time() - entry['built_at'] < ttl:
+            self._count('hits')
+            return self._cached_response(entry, 'hit')
+        lock_key = f'{key}:lock'
+        locked = entry is not None
+        if locked and not cache.add(lock_key, 1, getattr(settings, 'CATALOG_RESPONSE_CACHE_LOCK_SECONDS', 30)):
+            # Another request is rebuilding this entry
+            self._count('stale_hits')
+            return self._cached_response(entry, 'stale')
+        self._count('misses')
+        try:
+            response = build()
+            if response.status_code == 200:
+                entry = {'version': version, 'built_at': time.time(), 'data': response.data}
+                cache.set(key, entry, ttl + getattr(settings, 'CATALOG_RESPONSE_CACHE_STALE_SECONDS', 300))
+        finally:
+            if locked:
+                cache.delete(lock_key)
+        response['X-Catalog-Cache'] = 'miss'
+        return response
+
+    def _cached_response(self, entry, state):
+        response = Response(entry['data'])
+        response['X-Catalog-Cache'] = state
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'stale_hits': self.stale_hits, 'misses': self.misses}
+
+catalog_response_cache = CatalogResponseCache()
+
+class CatalogResponseCacheMixin:
+    """For anonymous catalog list views whose output is the same for every visitor."""
+    def list(self, request, *args, **kwargs):
+        return catalog_response_cache.respond(request, lambda: super(CatalogResponseCacheMixin, self).list(request, *args, **kwargs))
+
+def catalog_changed():
+    # Inside a transaction, bump now so later reads in it miss, and again on
+    # commit so entries built from the pre-commit rows in between are not kept
+    if connection.in_atomic_block:
+        bump_catalog_version()
+    transaction.on_commit(bump_catalog_version)
+
+@receiver(post_save, sender=Report, dispatch_uid='dashboard.catalog_cache_report_saved')
+@receiver(post_delete, sender=Report, dispatch_uid='dashboard.catalog_cache_report_deleted')
+@receiver(post_save, sender=ReportCategory, dispatch_uid='dashboard.catalog_cache_category_saved')
+@receiver(post_delete, sender=ReportCategory, dispatch_uid='dashboard.catalog_cache_category_deleted')
+def catalog_changed_handler(sender, **kwargs):
+    catalog_changed()
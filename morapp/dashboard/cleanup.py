@@ -6,8 +6,9 @@ from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
-from .models import Order, Transaction, PurchasedReport, UserProfile
+from website.models import Order, Transaction, PurchasedReport, UserProfile
 from django.db.models import Sum, Count
+from .utils import date_window
 
 logger = logging.getLogger('dashboard')
 
@@ -47,7 +48,7 @@ def cleanup_temp_files():
 
 def generate_monthly_report():
     try:
-        today = timezone.now().date()
+        today = timezone.localdate()
         first_day_current_month = today.replace(day=1)
         last_day_previous_month = first_day_current_month - timedelta(days=1)
         first_day_previous_month = last_day_previous_month.replace(day=1)
@@ -55,19 +56,19 @@ def generate_monthly_report():
         monthly_data = {
             'period': first_day_previous_month.strftime('%B %Y'),
             'revenue': Transaction.objects.filter(
-                confirmed=True,
-                paid_at__date__range=[first_day_previous_month, last_day_previous_month]
+                date_window('paid_at', first_day_previous_month, last_day_previous_month),
+                confirmed=True
             ).aggregate(total=Sum('amount'))['total'] or 0,
             'orders': Order.objects.filter(
-                status='paid',
-                created_at__date__range=[first_day_previous_month, last_day_previous_month]
+                date_window('created_at', first_day_previous_month, last_day_previous_month),
+                status='paid'
             ).count(),
             'new_clients': UserProfile.objects.filter(
-                profile_type='Client',
-                join_date__date__range=[first_day_previous_month, last_day_previous_month]
+                date_window('join_date', first_day_previous_month, last_day_previous_month),
+                profile_type='Client'
             ).count(),
             'reports_sold': PurchasedReport.objects.filter(
-                purchased_on__date__range=[first_day_previous_month, last_day_previous_month]
+                date_window('purchased_on', first_day_previous_month, last_day_previous_month)
             ).count(),
         }
         
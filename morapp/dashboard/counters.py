@@ -0,0 +1,99 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.dispatch import receiver
+from website.models import Report, ReportCategory, PurchasedReport
+from .catalog_cache import bump_catalog_version, catalog_changed
+
+# Report.purchase_count and ReportCategory.active_report_count are stored so the
+# catalog serializers do not count rows per object. Changes made through model
+# save/delete keep them current with F() updates; queryset.update() bypasses
+# these receivers, so run rebuild_counters after bulk edits.
+
+def _adjust_purchase_count(report_id, delta):
+    # Never below zero: rows written with bulk_create were never counted, and deleting them must not fail
+    Report.objects.filter(pk=report_id, purchase_count__gte=-delta).update(purchase_count=F('purchase_count') + delta)
+
+def _adjust_active_report_count(category_id, delta):
+    if category_id is not None:
+        ReportCategory.objects.filter(pk=category_id, active_report_count__gte=-delta).update(
+            active_report_count=F('active_report_count') + delta
+        )
+
+def _adjust_cached(instance, relation, attname, delta):
+    # Keep a related object the caller holds in step with the row, so it can be serialized or saved as is
+    related = instance._state.fields_cache.get(relation)
+    if related is not None:
+        setattr(related, attname, getattr(related, attname) + delta)
+
+def _counted_category(is_active, category_id):
+    # The category whose active_report_count includes this report, if any
+    return category_id if is_active else None
+
+@receiver(post_init, sender=Report, dispatch_uid='dashboard.track_report_counters')
+def report_loaded_counter_handler(sender, instance, **kwargs):
+    # Read __dict__ so deferred fields are not loaded just for this
+    if 'is_active' in instance.__dict__ and 'category_id' in instance.__dict__:
+        instance._counted_category = _counted_category(instance.is_active, instance.category_id)
+
+@receiver(pre_save, sender=Report, dispatch_uid='dashboard.load_report_counters')
+def report_saving_counter_handler(sender, instance, **kwargs):
+    if not instance._state.adding and not hasattr(instance, '_counted_category'):
+        stored = Report.objects.filter(pk=instance.pk).values_list('is_active', 'category_id').first()
+        instance._counted_category = _counted_category(*stored) if stored else None
+
+@receiver(post_save, sender=Report, dispatch_uid='dashboard.count_report_in_category')
+def report_saved_counter_handler(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_counted_category', None)
+    current = _counted_category(instance.is_active, instance.category_id)
+    if previous != current:
+        _adjust_active_report_count(previous, -1)
+        _adjust_active_report_count(current, 1)
+        if current is not None:
+            _adjust_cached(instance, 'category', 'active_report_count', 1)
+    instance._counted_category = current
+
+@receiver(post_delete, sender=Report, dispatch_uid='dashboard.uncount_report_in_category')
+def report_deleted_counter_handler(sender, instance, **kwargs):
+    counted = _counted_category(instance.is_active, instance.category_id)
+    _adjust_active_report_count(counted, -1)
+    if counted is not None:
+        _adjust_cached(instance, 'category', 'active_report_count', -1)
+
+@receiver(post_save, sender=PurchasedReport, dispatch_uid='dashboard.count_purchase')
+def purchase_created_counter_handler(sender, instance, created, **kwargs):
+    if created:
+        _adjust_purchase_count(instance.report_id, 1)
+        _adjust_cached(instance, 'report', 'purchase_count', 1)
+        catalog_changed()  # Cached catalog pages show purchase_count
+
+@receiver(post_delete, sender=PurchasedReport, dispatch_uid='dashboard.uncount_purchase')
+def purchase_deleted_counter_handler(sender, instance, **kwargs):
+    _adjust_purchase_count(instance.report_id, -1)
+    _adjust_cached(instance, 'report', 'purchase_count', -1)
+    catalog_changed()
+
+def rebuild_counters(fix=True):
+    """
+    Recompute both counters from the source tables. Returns the number of
+    reports and categories whose stored value was wrong; with fix=False they
+    are only counted.
+    """
+    purchases = PurchasedReport.objects.filter(report=OuterRef('pk')).order_by().values('report')
+    reports = Report.objects.annotate(
+        actual=Coalesce(Subquery(purchases.annotate(n=Count('id')).values('n')), 0)
+    ).exclude(purchase_count=F('actual'))
+    active = Report.objects.filter(category=OuterRef('pk'), is_active=True).order_by().values('category')
+    categories = ReportCategory.objects.annotate(
+        actual=Coalesce(Subquery(active.annotate(n=Count('id')).values('n')), 0)
+    ).exclude(active_report_count=F('actual'))
+    wrong_reports = list(reports.values_list('id', 'actual'))
+    wrong_categories = list(categories.values_list('id', 'actual'))
+    if fix:
+        for report_id, actual in wrong_reports:
+            Report.objects.filter(pk=report_id).update(purchase_count=actual)
+        for category_id, actual in wrong_categories:
+            ReportCategory.objects.filter(pk=category_id).update(active_report_count=actual)
+        if wrong_reports or wrong_categories:
+            bump_catalog_version()
+    return len(wrong_reports), len(wrong_categories)
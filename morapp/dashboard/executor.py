@@ -0,0 +1,195 @@
+import os
+import signal
+import threading
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from .cache import watermarked_pdf_cache
+
+logger = logging.getLogger('dashboard')
+
+class WatermarkJobTimeout(Exception):
+    pass
+
+class WatermarkJobCancelled(Exception):
+    pass
+
+def _init_worker():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'morapp.settings')
+    import django
+    django.setup()
+
+_job_state = {'active': False, 'expired': False}
+
+def _on_job_timeout(signum, frame):
+    if not _job_state['active']:
+        return
+    _job_state['expired'] = True
+    # PyPDF2 swallows some exceptions while parsing, so keep firing until the job unwinds
+    signal.setitimer(signal.ITIMER_REAL, 0.5)
+    raise WatermarkJobTimeout('watermark job exceeded its time limit')
+
+def _watermark_job(input_path, output_path, watermark_text, engine, linearize, timeout):
+    """Runs in a pool process: write the watermarked copy of input_path to output_path."""
+    from .utils import write_watermarked_pdf
+    _job_state.update(active=bool(timeout), expired=False)
+    if timeout:
+        # Pool workers run jobs on their main thread, so an interval timer can abort a stuck job
+        signal.signal(signal.SIGALRM, _on_job_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        with open(output_path, 'wb') as output_file:
+            write_watermarked_pdf(input_path, watermark_text, output_file, linearize=linearize, engine=engine)
+    except Exception:
+        if not _job_state['expired']:
+            raise
+    finally:
+        _job_state['active'] = False
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    if _job_state['expired']:
+        raise WatermarkJobTimeout('watermark job exceeded its time limit')
+    return output_path
+
+class WatermarkExecutor:
+    """
+    Runs watermarking on a pool of worker processes so the CPU-bound PyPDF2
+    work does not hold the GIL of the web process.
+    Jobs are keyed by watermarked cache key: concurrent requests for the same
+    copy share one job, and the finished file is committed to the watermarked
+    PDF cache. Each job is aborted inside its worker after job_timeout seconds.
+    A job nobody waits for any more is dropped if it has not started yet; a
+    running one is left to finish so its result still lands in the cache.
+    """
+    def __init__(self, max_workers=2, job_timeout=120, start_method='spawn'):
+        self.max_workers = max_workers
+        self.job_timeout = job_timeout
+        self.start_method = start_method
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self._pool = None
+        self._jobs = {}
+        self._lock = threading.RLock()
+
+    @property
+    def enabled(self):
+        return self.max_workers > 0
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_worker
+                )
+            return self._pool
+
+    def submit(self, cache_key, input_path, watermark_text, engine, linearize=False):
+        """Return a Future resolving to the cached path of the watermarked copy."""
+        with self._lock:
+            job = self._jobs.get(cache_key)
+            if job is not None:
+                job['waiters'] += 1
+                return job['future']
+            tmp_path = watermarked_pdf_cache.reserve(cache_key)
+            result = Future()
+            pool = self._get_pool()
+            try:
+                pool_future = pool.submit(
+                    _watermark_job, input_path, tmp_path, watermark_text, engine, linearize, self.job_timeout
+                )
+            except BrokenProcessPool:
+                watermarked_pdf_cache.discard(tmp_path)
+                self._reset(pool)
+                raise
+            self._jobs[cache_key] = {'future': result, 'pool_future': pool_future, 'waiters': 1}
+            self.submitted += 1
+        pool_future.add_done_callback(lambda done: self._finish(cache_key, tmp_path, pool, done, result))
+        return result
+
+    def run(self, cache_key, input_path, watermark_text, engine, linearize=False, timeout=None):
+        """Submit a job and wait for it; on timeout the caller's interest in the job is cancelled."""
+        future = self.submit(cache_key, input_path, watermark_text, engine, linearize)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self.cancel(cache_key)
+            raise WatermarkJobTimeout(f'watermark job did not finish within {timeout}s')
+
+    def cancel(self, cache_key):
+        """Withdraw one waiter from the job; drops the job if it is unclaimed and not yet running."""
+        with self._lock:
+            job = self._jobs.get(cache_key)
+            if job is None:
+                return False
+            job['waiters'] -= 1
+            if job['waiters'] > 0:
+                return False
+            return job['pool_future'].cancel()
+
+    def _finish(self, cache_key, tmp_path, pool, pool_future, result):
+        with self._lock:
+            self._jobs.pop(cache_key, None)
+        if pool_future.cancelled():
+            watermarked_pdf_cache.discard(tmp_path)
+            with self._lock:
+                self.cancelled += 1
+            result.set_exception(WatermarkJobCancelled('watermark job was cancelled'))
+            return
+        error = pool_future.exception()
+        if error is None:
+            try:
+                path = watermarked_pdf_cache.commit(cache_key, tmp_path)
+            except OSError as e:
+                error = e
+            else:
+                with self._lock:
+                    self.completed += 1
+                result.set_result(path)
+                return
+        watermarked_pdf_cache.discard(tmp_path)
+        with self._lock:
+            if isinstance(error, WatermarkJobTimeout):
+                self.timeouts += 1
+            else:
+                self.failed += 1
+        if isinstance(error, BrokenProcessPool):
+            self._reset(pool)
+        logger.error(f"Watermark job failed: {str(error) or type(error).__name__}")
+        result.set_exception(error)
+
+    def _reset(self, pool):
+        # A worker died; start a fresh pool for the next job
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'in_flight': len(self._jobs),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'timeouts': self.timeouts,
+                'cancelled': self.cancelled,
+            }
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+watermark_executor = WatermarkExecutor(
+    max_workers=getattr(settings, 'WATERMARK_PROCESS_POOL_SIZE', 2),
+    job_timeout=getattr(settings, 'WATERMARK_JOB_TIMEOUT', 120),
+    start_method=getattr(settings, 'WATERMARK_PROCESS_START_METHOD', 'spawn')
+)
@@ -0,0 +1,68 @@
+from rest_framework import permissions
+
+# Sparse fieldsets for read endpoints. A list view mixing in
+# SparseFieldsetViewMixin takes
+#
+#   ?fields=id,title,category.name    only these fields (dotted names reach into nested serializers)
+#   ?omit=description,purchase_count  every field but these
+#   ?fieldset=card                    a preset from the serializer's Meta.fieldsets
+#
+# and serializers mixing in SparseFieldsetMixin drop the other fields before
+# rendering. Since the query plan is built from the same serializer instance
+# (see query_plan), dropped nested serializers are not joined or prefetched,
+# their Meta lookups and annotations are skipped and Meta.deferrable columns
+# are not loaded. Unknown names are ignored.
+
+def parse_field_names(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+class SparseFieldsetMixin:
+    """For serializers: keeps only the fields selected by the view's fieldset context."""
+    def get_fieldset_path(self):
+        # 'category.' for the category serializer nested in a report, '' at the root
+        names, node = [], self
+        while node.parent is not None:
+            if node.field_name:
+                names.append(node.field_name)
+            node = node.parent
+        return ''.join(f'{name}.' for name in reversed(names))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self.context.get('fieldset')
+        if not selection:
+            return fields
+        requested, omitted = selection
+        path = self.get_fieldset_path()
+        if requested is not None and path.rstrip('.') not in requested:
+            fields = {
+                name: field for name, field in fields.items()
+                if f'{path}{name}' in requested or any(item.startswith(f'{path}{name}.') for item in requested)
+            }
+        return {name: field for name, field in fields.items() if f'{path}{name}' not in omitted}
+
+class SparseFieldsetViewMixin:
+    """For generic views: passes ?fields=, ?omit= and ?fieldset= of safe requests to the serializer."""
+    def get_fieldset_selection(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in permissions.SAFE_METHODS:
+            return None
+        params = request.query_params
+        requested = parse_field_names(params.get('fields')) or None
+        preset = params.get('fieldset')
+        if preset:
+            serializer_class = self.get_serializer_class()
+            presets = getattr(getattr(serializer_class, 'Meta', None), 'fieldsets', {})
+            if preset in presets:
+                requested = (requested or set()) | set(presets[preset])
+        omitted = parse_field_names(params.get('omit'))
+        if requested is None and not omitted:
+            return None
+        return requested, omitted
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        selection = self.get_fieldset_selection()
+        if selection:
+            context['fieldset'] = selection
+        return context
@@ -0,0 +1,97 @@
+import os
+import shutil
+import logging
+import PyPDF2
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from website.models import Report
+from .cache import get_file_digest
+from .storage import blob_digest, replace_thumbnail_refs
+from .workers import BoundedWorkerPool
+from .page_images import generate_preview_thumbnails, THUMBNAIL_DIR
+from .search import extract_page_texts, index_report_text
+from .catalog_cache import bump_catalog_version
+
+logger = logging.getLogger('dashboard')
+
+def extract_pdf_metadata(path):
+    """Read the metadata stored on Report by ingestion from the file at path."""
+    reader = PyPDF2.PdfReader(path)
+    if reader.is_encrypted:
+        reader.decrypt('')
+    page_boxes = []
+    for page in reader.pages:
+        box = page.mediabox
+        page_boxes.append([float(box.left), float(box.bottom), float(box.width), float(box.height)])
+    return {
+        'file_sha256': get_file_digest(path),
+        'file_byte_size': os.path.getsize(path),
+        'page_count': len(page_boxes),
+        'page_boxes': page_boxes,
+        'pdf_version': (reader.pdf_header or '').replace('%PDF-', '')[:10],
+    }
+
+def ingest_report(report_id):
+    """
+    Compute and store the file metadata for a report.
+    Results are written with queryset updates keyed on the file name, so a
+    file replaced while ingestion ran is left pending for the next pass.
+    """
+    report = Report.objects.filter(id=report_id).only('id', 'file', 'original_file_name').first()
+    if report is None or not report.file:
+        return False
+    file_name = report.file.name
+    rows = Report.objects.filter(id=report_id, file=file_name)
+    rows.update(ingestion_status='processing', ingestion_error=None)
+    if not report.original_file_name and not blob_digest(file_name):
+        # Stored before content addressing, under the name it was uploaded with
+        rows.update(original_file_name=os.path.basename(file_name)[:255])
+    try:
+        metadata = extract_pdf_metadata(report.file.path)
+    except Exception as e:
+        logger.error(f"Error ingesting report {report_id}: {str(e)}")
+        rows.update(ingestion_status='failed', ingestion_error=str(e)[:1000])
+        return False
+    try:
+        metadata['preview_thumbnails'] = generate_preview_thumbnails(report.file.path)
+    except Exception as e:
+        # Previews are optional; the card falls back to the placeholder image
+        logger.error(f"Error generating preview thumbnails for report {report_id}: {str(e)}")
+    try:
+        index_report_text(report_id, extract_page_texts(report.file.path))
+    except Exception as e:
+        # The report stays listed and searchable by title; only its contents are missing from q= search
+        logger.error(f"Error indexing text of report {report_id}: {str(e)}")
+    with transaction.atomic():
+        # Thumbnail blob references move with the update; none are taken if the file was replaced meanwhile
+        previous = rows.select_for_update().values_list('preview_thumbnails', flat=True).first()
+        updated = previous is not None and rows.update(ingestion_status='ready', ingested_at=timezone.now(), **metadata)
+        if updated:
+            replace_thumbnail_refs(previous, metadata.get('preview_thumbnails', previous))
+    if updated:
+        # Previews written before they were stored as blobs
+        shutil.rmtree(os.path.join(settings.MEDIA_ROOT, THUMBNAIL_DIR, str(report_id)), ignore_errors=True)
+    bump_catalog_version()  # Cached catalog pages still point at the placeholder preview
+    logger.info(f"Ingested report {report_id}: {metadata['page_count']} pages, {metadata['file_byte_size']} bytes")
+    return True
+
+class IngestionPool(BoundedWorkerPool):
+    name = 'report-ingestion'
+
+    def handle(self, report_id):
+        ingest_report(report_id)
+
+ingestion_pool = IngestionPool(
+    workers=getattr(settings, 'REPORT_INGESTION_WORKERS', 1),
+    max_queue=getattr(settings, 'REPORT_INGESTION_MAX_QUEUE', 100),
+    enqueue_timeout=getattr(settings, 'REPORT_INGESTION_ENQUEUE_TIMEOUT', 0.5)
+)
+
+@receiver(post_save, sender=Report, dispatch_uid='dashboard.ingest_report')
+def report_saved_handler(sender, instance, **kwargs):
+    # New reports and replaced files are saved with status pending (see Report.save)
+    if instance.ingestion_status == 'pending' and instance.file:
+        transaction.on_commit(lambda: ingestion_pool.submit(instance.id))
@@ -0,0 +1,117 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from website.models import Report, ReportCategory
+from dashboard.search import content_search_available, search_catalog
+
+SYLLABLES = ['ka', 'ri', 'mo', 'ten', 'sa', 'lu', 'ber', 'no', 'vi', 'dra', 'pe', 'xo', 'gan', 'ti', 'ume', 'shi']
+DOMAIN_WORDS = [
+    'market', 'outlook', 'agriculture', 'tea', 'coffee', 'exports', 'banking', 'fintech', 'mobile', 'payments',
+    'energy', 'solar', 'logistics', 'retail', 'insurance', 'housing', 'tourism', 'manufacturing', 'telecom',
+    'healthcare', 'education', 'mining', 'county', 'survey', 'consumer', 'forecast', 'annual', 'quarterly',
+]
+
+class Command(BaseCommand):
+    help = 'Compares the indexed catalog search with the icontains scan on a synthetic catalog (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reports', type=int, default=100000, help='Synthetic reports to generate')
+        parser.add_argument('--queries', type=int, default=40, help='Queries to time per search mode')
+        parser.add_argument('--page-size', type=int, default=12, help='Rows fetched per query, like one list page')
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--min-speedup', type=float, default=None,
+                            help='Fail unless the index beats the scan by this factor at the median and at p95')
+
+    def handle(self, *args, **options):
+        if not content_search_available():
+            raise CommandError('The catalog index needs SQLite with FTS5')
+        rng = random.Random(options['seed'])
+        words = DOMAIN_WORDS + [
+            ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(3000)
+        ]
+        with transaction.atomic():
+            started = time.perf_counter()
+            self.build_catalog(rng, words, options['reports'])
+            self.stdout.write(f"Generated {options['reports']} reports in {time.perf_counter() - started:.1f}s")
+
+            queries = self.build_queries(rng, words, options['queries'])
+            page_size = options['page_size']
+            active = Report.objects.filter(is_active=True)
+
+            def scan(text):
+                queryset = active.filter(Q(title__icontains=text) | Q(description__icontains=text)).order_by('-created_at')
+                return queryset.count(), list(queryset.values_list('id', flat=True)[:page_size])
+
+            def indexed(text):
+                queryset = search_catalog(active, text)
+                return queryset.count(), list(queryset.values_list('id', flat=True)[:page_size])
+
+            scan_times = self.time_queries(scan, queries)
+            index_times = self.time_queries(indexed, queries)
+            transaction.set_rollback(True)
+
+        for label, timings in (('icontains scan', scan_times), ('catalog index', index_times)):
+            self.stdout.write(
+                f"{label:15} median {statistics.median(timings):8.2f}ms  "
+                f"p95 {self.percentile(timings, 95):8.2f}ms  max {max(timings):8.2f}ms"
+            )
+        speedup = statistics.median(scan_times) / max(statistics.median(index_times), 0.001)
+        tail_speedup = self.percentile(scan_times, 95) / max(self.percentile(index_times, 95), 0.001)
+        minimum = options['min_speedup']
+        if minimum is not None and min(speedup, tail_speedup) < minimum:
+            raise CommandError(
+                f"The catalog index is {speedup:.1f}x the scan at the median and {tail_speedup:.1f}x at p95, "
+                f"below the required {minimum:.1f}x"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Median speedup: {speedup:.1f}x, p95 speedup: {tail_speedup:.1f}x over {len(queries)} queries"
+        ))
+
+    def build_catalog(self, rng, words, count):
+        categories = [
+            ReportCategory.objects.create(name=f'Benchmark {word.title()}', slug=f'benchmark-{word}')
+            for word in DOMAIN_WORDS[:12]
+        ]
+        batch = []
+        for i in range(count):
+            batch.append(Report(
+                title=' '.join(rng.choice(words) for _ in range(rng.randint(3, 7))).title(),
+                slug=f'benchmark-report-{i}',
+                description=' '.join(rng.choice(words) for _ in range(rng.randint(20, 40))),
+                category=rng.choice(categories),
+                price=rng.randint(5, 500) * 100,
+                file='reports/benchmark.pdf',
+                is_active=rng.random() > 0.05,
+            ))
+            if len(batch) == 5000:
+                Report.objects.bulk_create(batch)
+                batch = []
+        Report.objects.bulk_create(batch)
+
+    def build_queries(self, rng, words, count):
+        # Whole words, two-word queries and prefixes as typed in the search box
+        queries = []
+        for i in range(count):
+            word = rng.choice(words)
+            if i % 3 == 0:
+                queries.append(word)
+            elif i % 3 == 1:
+                queries.append(f'{rng.choice(DOMAIN_WORDS)} {word}')
+            else:
+                queries.append(word[:max(3, len(word) - 2)])
+        return queries
+
+    def time_queries(self, search, queries):
+        timings = []
+        for text in queries:
+            started = time.perf_counter()
+            search(text)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def percentile(self, values, percent):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
@@ -0,0 +1,51 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from website.models import Report
+from dashboard.typeahead import TypeaheadIndex
+
+PREFIXES = ['sec', 'market r', 'number 12', 'rep', 'sector 4', 'zzz']
+
+class Command(BaseCommand):
+    help = 'Times typeahead lookups on a synthetic catalog (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reports', type=int, default=5000, help='Synthetic reports to generate')
+        parser.add_argument('--lookups', type=int, default=1000, help='Lookups to time')
+        parser.add_argument('--limit', type=int, default=10, help='Suggestions per lookup')
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--max-ms', type=float, default=None,
+                            help='Fail if the p95 lookup takes longer than this many milliseconds')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            Report.objects.bulk_create([
+                Report(title=f'Sector {i % 97} market report number {i}', slug=f'benchmark-typeahead-{i}',
+                       description='d', price=10, file='reports/benchmark.pdf')
+                for i in range(options['reports'])
+            ], batch_size=5000)
+            # A private index, so the process-wide one keeps its counters
+            index = TypeaheadIndex(rebuild_interval=0)
+            started = time.perf_counter()
+            index.build()
+            self.stdout.write(f"Built {index.stats()['entries']} keys in {time.perf_counter() - started:.2f}s")
+            transaction.set_rollback(True)
+
+        timings = []
+        for _ in range(options['lookups']):
+            text = rng.choice(PREFIXES)
+            started = time.perf_counter()
+            index.lookup(text, options['limit'])
+            timings.append((time.perf_counter() - started) * 1000)
+        p95 = sorted(timings)[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"lookup median {statistics.median(timings):.4f}ms  p95 {p95:.4f}ms  max {max(timings):.4f}ms  "
+            f"keys scanned {index.entries_scanned / len(timings):.1f} per lookup"
+        )
+        maximum = options['max_ms']
+        if maximum is not None and p95 > maximum:
+            raise CommandError(f"p95 lookup took {p95:.4f}ms, over the allowed {maximum}ms")
+        self.stdout.write(self.style.SUCCESS(f"{len(timings)} lookups over {options['reports']} reports"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from dashboard.storage import collect_blob_garbage, rebuild_blob_refcounts
+
+class Command(BaseCommand):
+    help = 'Removes content-addressed report blobs that no report refers to any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=None, help='Keep unreferenced blobs stored more recently than this (default REPORT_BLOB_GC_GRACE_HOURS)')
+        parser.add_argument('--rebuild-refcounts', action='store_true', help='Recount references from the report table first')
+        parser.add_argument('--scan-orphans', action='store_true', help='Also remove blob files that have no database record')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be removed without deleting anything')
+
+    def handle(self, *args, **options):
+        if options['rebuild_refcounts']:
+            corrected = rebuild_blob_refcounts()
+            self.stdout.write(f"Corrected reference counts on {corrected} blobs")
+        removed, freed = collect_blob_garbage(options['grace_hours'], options['scan_orphans'], options['dry_run'])
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed} blobs ({freed / (1024 * 1024):.1f}MB)"))
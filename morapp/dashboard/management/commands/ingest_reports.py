@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from website.models import Report
+from dashboard.ingestion import ingest_report
+from dashboard.search import missing_catalog_triggers
+
+class Command(BaseCommand):
+    help = 'Computes stored file metadata for reports that have not been ingested'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-ingest every report, not only pending and failed ones')
+
+    def handle(self, *args, **options):
+        missing = missing_catalog_triggers()
+        if missing:
+            self.stderr.write(self.style.WARNING(
+                f"Catalog search index triggers are missing ({', '.join(missing)}); a migration rebuilt "
+                "website_report without running restore_catalog_triggers, so search results are going stale; "
+                "`manage.py migrate` puts them back and reindexes"
+            ))
+        reports = Report.objects.exclude(file='')
+        if not options['all']:
+            reports = reports.exclude(ingestion_status='ready')
+        ingested = failed = 0
+        for report_id in reports.values_list('id', flat=True).iterator():
+            if ingest_report(report_id):
+                ingested += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(f"Ingested {ingested} reports ({failed} failed)"))
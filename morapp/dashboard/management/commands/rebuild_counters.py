@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from dashboard.counters import rebuild_counters
+
+class Command(BaseCommand):
+    help = 'Recomputes Report.purchase_count and ReportCategory.active_report_count from their source rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help='Only check the stored counters; exit with an error if any are wrong')
+
+    def handle(self, *args, **options):
+        reports, categories = rebuild_counters(fix=not options['verify'])
+        if options['verify']:
+            if reports or categories:
+                raise CommandError(f"{reports} report and {categories} category counters are out of date")
+            self.stdout.write(self.style.SUCCESS("All counters are correct"))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Corrected {reports} report and {categories} category counters"))
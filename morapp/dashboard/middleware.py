@@ -1,5 +1,7 @@
 from django.http import JsonResponse
+from django.db import connection
 import logging
+from .query_budget import QueryCounter, check_query_budget
 
 logger = logging.getLogger('dashboard')
 
@@ -35,4 +37,17 @@ class SecurityHeadersMiddleware:
                 "img-src 'self' data:; "
                 "connect-src 'self';"
             )
-        return response
\ No newline at end of file
+        return response
+
+class QueryBudgetMiddleware:
+    """Counts the queries of each request against the serving view's query_budget (dashboard.query_budget)."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        request.query_count = counter.count
+        check_query_budget(request, counter)
+        return response
@@ -0,0 +1,118 @@
+import threading
+from io import BytesIO
+import pypdfium2 as pdfium
+from PIL import Image, ImageFilter
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from .cache import DiskCache, get_file_digest
+from .utils import get_watermark_version, get_watermark_overlay
+
+PAGE_IMAGE_FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+# Previews are saved under this name; before they were content-addressed each report had a <report_id>/ directory here
+THUMBNAIL_DIR = 'report_previews/thumbs'
+
+# PDFium is not thread-safe; all document access in this process goes through one lock
+_pdfium_lock = threading.Lock()
+
+page_image_cache = DiskCache(
+    'page-images',
+    max_bytes=getattr(settings, 'PAGE_IMAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+)
+
+class PageOutOfRange(Exception):
+    pass
+
+def clamp_dpi(dpi):
+    min_dpi = getattr(settings, 'PAGE_IMAGE_MIN_DPI', 36)
+    max_dpi = getattr(settings, 'PAGE_IMAGE_MAX_DPI', 300)
+    return max(min_dpi, min(int(dpi), max_dpi))
+
+def get_page_image_cache_key(input_path, page_number, dpi, image_format, watermark_text, digest=None):
+    return page_image_cache.make_key(
+        digest or get_file_digest(input_path), page_number, dpi, image_format, get_watermark_version(watermark_text)
+    )
+
+def render_page_image(input_path, page_number, dpi, image_format, watermark_text):
+    """Render one 1-based page of input_path with the watermark composited on top."""
+    pil_format = PAGE_IMAGE_FORMATS[image_format][0]
+    scale = dpi / 72
+    with _pdfium_lock:
+        document = pdfium.PdfDocument(input_path)
+        try:
+            if not 1 <= page_number <= len(document):
+                raise PageOutOfRange(f'page {page_number} of {len(document)}')
+            page = document[page_number - 1]
+            image = page.render(scale=scale, may_draw_forms=True).to_pil().convert('RGBA')
+            page.close()
+            # Size the overlay from the rendered bitmap so rotated pages get an upright watermark
+            overlay_size = (image.width / scale, image.height / scale)
+            overlay_document = pdfium.PdfDocument(get_watermark_overlay(watermark_text, overlay_size))
+            try:
+                overlay_page = overlay_document[0]
+                overlay = overlay_page.render(scale=scale, fill_color=(0, 0, 0, 0)).to_pil()
+                overlay_page.close()
+            finally:
+                overlay_document.close()
+        finally:
+            document.close()
+    if overlay.size != image.size:
+        overlay = overlay.resize(image.size)
+    image.alpha_composite(overlay.convert('RGBA'))
+    buffer = BytesIO()
+    image.convert('RGB').save(buffer, pil_format, **({'quality': 80} if pil_format == 'WEBP' else {'optimize': True}))
+    return buffer.getvalue()
+
+def get_page_image(input_path, page_number, dpi, image_format, watermark_text, cache_key=None):
+    """Return the path of the cached page image, rendering it on the first request."""
+    key = cache_key or get_page_image_cache_key(input_path, page_number, dpi, image_format, watermark_text)
+    cached_path = page_image_cache.get(key)
+    if cached_path:
+        return cached_path
+    data = render_page_image(input_path, page_number, dpi, image_format, watermark_text)
+    return page_image_cache.put(key, data)
+
+def render_first_page(input_path, width):
+    """Render page 1 of input_path scaled to the given pixel width."""
+    with _pdfium_lock:
+        document = pdfium.PdfDocument(input_path)
+        try:
+            page = document[0]
+            page_width = page.get_width()
+            image = page.render(scale=width / page_width, may_draw_forms=True).to_pil()
+            page.close()
+        finally:
+            document.close()
+    return image.convert('RGB')
+
+def generate_preview_thumbnails(input_path):
+    """
+    Store blurred first-page previews of a report at each PREVIEW_THUMBNAIL_WIDTHS
+    width in WebP and JPEG through the content-addressed report storage, so
+    identical previews are kept once and unreferenced ones are collected by
+    gc_report_blobs. Blob names change with the content, so a replaced file
+    never serves stale previews. Returns {format: {width: media-relative path}}.
+    """
+    widths = sorted(getattr(settings, 'PREVIEW_THUMBNAIL_WIDTHS', (160, 320, 640)))
+    blur_radius = getattr(settings, 'PREVIEW_BLUR_RADIUS', 6)
+    source = render_first_page(input_path, widths[-1]).filter(ImageFilter.GaussianBlur(blur_radius))
+
+    storage = storages['reports']
+    thumbnails = {image_format: {} for image_format in THUMBNAIL_FORMATS}
+    for width in widths:
+        height = max(1, round(source.height * width / source.width))
+        image = source if width == source.width else source.resize((width, height), Image.LANCZOS)
+        for image_format, (pil_format, extension) in THUMBNAIL_FORMATS.items():
+            buffer = BytesIO()
+            image.save(buffer, pil_format, quality=70)
+            name = storage.save(f'{THUMBNAIL_DIR}/{width}.{extension}', ContentFile(buffer.getvalue()))
+            thumbnails[image_format][str(width)] = name
+    return thumbnails
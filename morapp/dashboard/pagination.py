@@ -0,0 +1,133 @@
+import json
+import base64
+import binascii
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Keyset pagination for long admin lists. A page-number page runs a COUNT(*)
+# and skips OFFSET rows, both of which grow with the table; a keyset page asks
+# for the rows after the last one shown,
+#
+#   WHERE created_at < :created_at OR (created_at = :created_at AND id < :id)
+#   ORDER BY created_at DESC, id DESC LIMIT page_size + 1
+#
+# which an index on the key walks straight into, so page 500 costs what page
+# 1 does. Views opt in by declaring their key (the trailing id makes it
+# unique) and mixing in KeysetPaginationMixin:
+#
+#   class ManageOrdersView(KeysetPaginationMixin, generics.ListAPIView):
+#       keyset_ordering = ('-created_at', '-id')
+#
+# Clients pick the mode per request with ?pagination=cursor, then follow the
+# next and previous links. ?count=true adds the exact total, at the price of
+# the COUNT(*).
+
+class KeysetPagination(BasePagination):
+    page_size = 12
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering):
+        # [(field name, descending)] from '-created_at' style names
+        self.ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def encode_cursor(self, instance, reverse):
+        fields = [instance._meta.get_field(name) for name, _ in self.ordering]
+        payload = {'k': [field.value_to_string(instance) for field in fields], 'r': reverse}
+        cursor = base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            values = [
+                model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.ordering, payload['k'], strict=True)
+            ]
+            return values, bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def keyset_filter(self, values, reverse):
+        # Rows strictly after the cursor in the listing order (before it when reverse)
+        condition = Q()
+        for position, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != reverse else 'gt'
+            ties = {self.ordering[i][0]: values[i] for i in range(position)}
+            condition |= Q(**ties, **{f'{name}__{lookup}': values[position]})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request, queryset.model)
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() == 'true':
+            self.count = queryset.count()
+
+        order_by = [f"{'-' if descending != reverse else ''}{name}" for name, descending in self.ordering]
+        page_queryset = queryset.order_by(*order_by)
+        if values is not None:
+            page_queryset = page_queryset.filter(self.keyset_filter(values, reverse))
+        rows = list(page_queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        self.page = rows
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        body = {'next': self.get_next_link(), 'previous': self.get_previous_link(), 'results': data}
+        if self.count is not None:
+            body = {'count': self.count, **body}
+        return Response(body)
+
+class KeysetPaginationMixin:
+    """For generic list views that declare keyset_ordering: ?pagination=cursor switches to KeysetPagination."""
+    keyset_ordering = None
+    pagination_mode_query_param = 'pagination'
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            request = getattr(self, 'request', None)  # None when the schema generator asks
+            mode = request.query_params.get(self.pagination_mode_query_param) if request is not None else None
+            if self.keyset_ordering and mode == 'cursor':
+                self._paginator = KeysetPagination(self.keyset_ordering)
+            else:
+                self._paginator = super().paginator
+        return self._paginator
@@ -0,0 +1,323 @@
+"""
+Linearized ("fast web view") PDF writer.
+
+Objects are renumbered and laid out in the order of ISO 32000-1 Annex F:
+linearization dictionary, first-page cross-reference section, catalog,
+primary hint stream, first-page objects, remaining pages, objects shared
+between pages, everything else and finally the main cross-reference table.
+A viewer can render page 1 as soon as it has the bytes up to /E.
+"""
+import zlib
+from io import BytesIO
+import PyPDF2
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NullObject, NumberObject, StreamObject
+
+class LinearizationNotSupported(Exception):
+    """Raised for inputs that cannot be rewritten, e.g. encrypted files."""
+
+class _BitWriter:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.current = 0
+        self.nbits = 0
+
+    def write(self, value, nbits):
+        for shift in range(nbits - 1, -1, -1):
+            self.current = (self.current << 1) | ((value >> shift) & 1)
+            self.nbits += 1
+            if self.nbits == 8:
+                self.buffer.append(self.current)
+                self.current = 0
+                self.nbits = 0
+
+    def align(self):
+        if self.nbits:
+            self.buffer.append(self.current << (8 - self.nbits))
+            self.current = 0
+            self.nbits = 0
+
+    def getvalue(self):
+        self.align()
+        return bytes(self.buffer)
+
+def _key(ref):
+    return (ref.idnum, ref.generation)
+
+def _references(obj, skip_parent=False):
+    """Indirect references held by obj, directly or through nested arrays and dictionaries."""
+    found = []
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, IndirectObject):
+            found.append(item)
+        elif isinstance(item, DictionaryObject):
+            stack.extend(value for key, value in reversed(list(dict.items(item))) if not (skip_parent and key == '/Parent'))
+        elif isinstance(item, ArrayObject):
+            stack.extend(reversed(item))
+    return found
+
+def _renumber(obj, numbers):
+    if isinstance(obj, IndirectObject):
+        return IndirectObject(numbers.get(_key(obj), 0), 0, None) if _key(obj) in numbers else NullObject()
+    if isinstance(obj, DictionaryObject):
+        copied = DictionaryObject()
+        for key, value in dict.items(obj):
+            copied[NameObject(key)] = _renumber(value, numbers)
+        return copied
+    if isinstance(obj, ArrayObject):
+        return ArrayObject(_renumber(item, numbers) for item in obj)
+    return obj
+
+def _serialize_object(number, obj, numbers):
+    buffer = BytesIO()
+    buffer.write(b'%d 0 obj\n' % number)
+    if isinstance(obj, StreamObject):
+        entries = DictionaryObject()
+        for key, value in dict.items(obj):
+            if key != '/Length':
+                entries[NameObject(key)] = _renumber(value, numbers)
+        # _data holds the stream exactly as stored, so filters are preserved byte for byte
+        data = obj._data
+        entries[NameObject('/Length')] = NumberObject(len(data))
+        entries.write_to_stream(buffer, None)
+        buffer.write(b'\nstream\n')
+        buffer.write(data)
+        buffer.write(b'\nendstream')
+    else:
+        _renumber(obj, numbers).write_to_stream(buffer, None)
+    buffer.write(b'\nendobj\n')
+    return buffer.getvalue()
+
+def _collect_objects(reader):
+    objects = {}
+    order = []
+    roots = [reader.trailer.raw_get('/Root')]
+    if '/Info' in reader.trailer:
+        roots.append(reader.trailer.raw_get('/Info'))
+    queue = list(roots)
+    while queue:
+        ref = queue.pop(0)
+        if _key(ref) in objects:
+            continue
+        obj = ref.get_object()
+        objects[_key(ref)] = obj if obj is not None else NullObject()
+        order.append(_key(ref))
+        queue.extend(_references(obj))
+    return objects, order
+
+def _page_closure(page_key, objects, stop):
+    closure = [page_key]
+    seen = {page_key}
+    stack = [page_key]
+    while stack:
+        key = stack.pop()
+        for ref in reversed(_references(objects[key], skip_parent=True)):
+            ref_key = _key(ref)
+            if ref_key in seen or ref_key in stop or ref_key not in objects:
+                continue
+            seen.add(ref_key)
+            closure.append(ref_key)
+            stack.append(ref_key)
+    return closure
+
+def _nbits(value):
+    return max(int(value), 0).bit_length()
+
+def _hint_stream_data(pages, first_page_objects, shared_objects, numbers, offsets, lengths, first_page_end, shared_ids):
+    """Page offset and shared object hint tables, computed as if the hint stream were absent."""
+    page_objects = [len(first_page_objects)] + [len(page) for page in pages[1:]]
+    page_lengths = [first_page_end - offsets[first_page_objects[0]]]
+    for page in pages[1:]:
+        page_lengths.append(offsets[page[-1]] + lengths[page[-1]] - offsets[page[0]])
+    min_objects = min(page_objects)
+    min_length = min(page_lengths)
+    bits_objects = _nbits(max(page_objects) - min_objects)
+    bits_length = _nbits(max(page_lengths) - min_length)
+    bits_nshared = _nbits(max(len(ids) for ids in shared_ids))
+    bits_shared_id = _nbits(max((max(ids) for ids in shared_ids if ids), default=0))
+
+    bits = _BitWriter()
+    bits.write(min_objects, 32)
+    bits.write(offsets[first_page_objects[0]], 32)
+    bits.write(bits_objects, 16)
+    bits.write(min_length, 32)
+    bits.write(bits_length, 16)
+    bits.write(0, 32)  # least content stream offset; content items mirror page length as in other writers
+    bits.write(0, 16)
+    bits.write(min_length, 32)
+    bits.write(bits_length, 16)
+    bits.write(bits_nshared, 16)
+    bits.write(bits_shared_id, 16)
+    bits.write(0, 16)  # no fractional positions
+    bits.write(0, 16)
+    for count in page_objects:
+        bits.write(count - min_objects, bits_objects)
+    bits.align()
+    for length in page_lengths:
+        bits.write(length - min_length, bits_length)
+    bits.align()
+    for ids in shared_ids:
+        bits.write(len(ids), bits_nshared)
+    bits.align()
+    for ids in shared_ids:
+        for shared_id in ids:
+            bits.write(shared_id, bits_shared_id)
+    bits.align()
+    for length in page_lengths:
+        bits.write(length - min_length, bits_length)
+    page_table = bits.getvalue()
+
+    group_lengths = [lengths[key] for key in first_page_objects + shared_objects]
+    min_group = min(group_lengths)
+    bits_group = _nbits(max(group_lengths) - min_group)
+    bits = _BitWriter()
+    # With no shared section, point at where it would start; readers reject zero here
+    shared_start = shared_objects[0] if shared_objects else None
+    bits.write(numbers[shared_start] if shared_start else len(pages) and numbers[pages[-1][-1]] + 1, 32)
+    bits.write(offsets[shared_start] if shared_start else offsets[pages[-1][-1]] + lengths[pages[-1][-1]], 32)
+    bits.write(len(first_page_objects), 32)
+    bits.write(len(group_lengths), 32)
+    bits.write(0, 16)  # every group holds a single object
+    bits.write(min_group, 32)
+    bits.write(bits_group, 16)
+    for length in group_lengths:
+        bits.write(length - min_group, bits_group)
+    bits.align()
+    for _ in group_lengths:
+        bits.write(0, 1)  # no MD5 signatures
+    shared_table = bits.getvalue()
+    return page_table + shared_table, len(page_table)
+
+def write_linearized_pdf(source, output_file):
+    """Rewrite the PDF at source (path or binary file object) as a linearized PDF into output_file."""
+    reader = PyPDF2.PdfReader(source)
+    if reader.is_encrypted:
+        raise LinearizationNotSupported('encrypted documents cannot be linearized')
+    objects, collection_order = _collect_objects(reader)
+    catalog_key = _key(reader.trailer.raw_get('/Root'))
+    page_keys = [_key(page.indirect_reference) for page in reader.pages]
+    if not page_keys:
+        raise LinearizationNotSupported('document has no pages')
+    tree_nodes = {key for key, obj in objects.items() if isinstance(obj, DictionaryObject) and obj.get('/Type') == '/Pages'}
+    stop = set(page_keys) | tree_nodes | {catalog_key}
+
+    closures = [_page_closure(key, objects, stop) for key in page_keys]
+    usage = {}
+    for index, closure in enumerate(closures):
+        for key in closure:
+            usage.setdefault(key, set()).add(index)
+    first_page_objects = closures[0]
+    first_set = set(first_page_objects)
+    pages = [first_page_objects]
+    shared_objects = []
+    placed = set(first_set)
+    for closure in closures[1:]:
+        page = [closure[0]]
+        for key in closure[1:]:
+            if key not in placed and len(usage[key]) == 1:
+                page.append(key)
+                placed.add(key)
+        placed.add(closure[0])
+        pages.append(page)
+    for closure in closures[1:]:
+        for key in closure[1:]:
+            if key not in placed:
+                shared_objects.append(key)
+                placed.add(key)
+    other_objects = [key for key in collection_order if key not in placed and key != catalog_key]
+
+    # Main section objects take the low numbers, the first-page section the high ones
+    main_keys = [key for page in pages[1:] for key in page] + shared_objects + other_objects
+    numbers = {key: index + 1 for index, key in enumerate(main_keys)}
+    main_size = len(main_keys) + 1
+    linearization_number = main_size
+    numbers[catalog_key] = main_size + 1
+    for index, key in enumerate(first_page_objects):
+        numbers[key] = main_size + 2 + index
+    hint_number = main_size + 2 + len(first_page_objects)
+    total_size = hint_number + 1
+
+    bodies = {key: _serialize_object(numbers[key], objects[key], numbers) for key in numbers}
+    lengths = {key: len(body) for key, body in bodies.items()}
+    group_ids = {key: index for index, key in enumerate(first_page_objects + shared_objects)}
+    shared_ids = [[]] + [sorted(group_ids[key] for key in closure if key in group_ids) for closure in closures[1:]]
+
+    trailer = reader.trailer
+    trailer_extra = b''
+    if '/Info' in trailer and _key(trailer.raw_get('/Info')) in numbers:
+        trailer_extra += b' /Info %d 0 R' % numbers[_key(trailer.raw_get('/Info'))]
+    if '/ID' in trailer:
+        id_buffer = BytesIO()
+        trailer.raw_get('/ID').get_object().write_to_stream(id_buffer, None)
+        trailer_extra += b' /ID ' + id_buffer.getvalue()
+
+    version = (reader.pdf_header or '%PDF-1.4')[:8].encode('latin-1')
+    header = version + b'\n%\xe2\xe3\xcf\xd3\n'
+    first_xref_count = total_size - main_size
+    linearization_length = len(b'%d 0 obj\n' % linearization_number) + len(_linearization_dict(0, 0, 0, 0, 0, 0, 0)) + len(b'\nendobj\n')
+    first_xref_length = len(_first_xref(main_size, [0] * first_xref_count, total_size, numbers[catalog_key], trailer_extra, 0))
+    main_order = main_keys
+    first_order = [catalog_key, None] + first_page_objects
+
+    def layout(hint_length):
+        offsets = {}
+        position = len(header) + linearization_length + first_xref_length
+        for key in first_order:
+            if key is None:
+                offsets['hint'] = position
+                position += hint_length
+                continue
+            offsets[key] = position
+            position += lengths[key]
+        offsets['first_end'] = position
+        for key in main_order:
+            offsets[key] = position
+            position += lengths[key]
+        offsets['main_xref'] = position
+        return offsets
+
+    base = layout(0)
+    hint_data, shared_table_offset = _hint_stream_data(
+        pages, first_page_objects, shared_objects, numbers, base, lengths, base['first_end'], shared_ids
+    )
+    compressed = zlib.compress(hint_data)
+    hint_body = (
+        b'%d 0 obj\n<< /Filter /FlateDecode /S %d /Length %d >>\nstream\n' % (hint_number, shared_table_offset, len(compressed)) +
+        compressed + b'\nendstream\nendobj\n'
+    )
+    offsets = layout(len(hint_body))
+
+    main_xref = b'xref\n0 %d\n0000000000 65535 f \n' % main_size
+    main_xref += b''.join(b'%010d 00000 n \n' % offsets[key] for key in main_keys)
+    main_xref += b'trailer\n<< /Size %d >>\nstartxref\n%d\n%%%%EOF\n' % (main_size, len(header) + linearization_length)
+    file_length = offsets['main_xref'] + len(main_xref)
+    first_xref_offsets = [len(header), offsets[catalog_key]] + [offsets[key] for key in first_page_objects] + [offsets['hint']]
+
+    output_file.write(header)
+    output_file.write(b'%d 0 obj\n' % linearization_number)
+    output_file.write(_linearization_dict(
+        file_length, offsets['hint'], len(hint_body), numbers[first_page_objects[0]], offsets['first_end'],
+        len(page_keys), offsets['main_xref'] + len(b'xref\n0 %d' % main_size)
+    ))
+    output_file.write(b'\nendobj\n')
+    output_file.write(_first_xref(main_size, first_xref_offsets, total_size, numbers[catalog_key], trailer_extra, offsets['main_xref']))
+    for key in first_order:
+        output_file.write(hint_body if key is None else bodies[key])
+    for key in main_order:
+        output_file.write(bodies[key])
+    output_file.write(main_xref)
+
+def _linearization_dict(length, hint_offset, hint_length, first_page, first_page_end, page_count, main_xref_entry):
+    # Fixed-width numbers keep the dictionary the same size in both layout passes
+    return b'<< /Linearized 1 /L %10d /H [ %10d %10d ] /O %10d /E %10d /N %10d /T %10d >>' % (
+        length, hint_offset, hint_length, first_page, first_page_end, page_count, main_xref_entry
+    )
+
+def _first_xref(first_number, offsets, total_size, catalog_number, trailer_extra, main_xref_offset):
+    table = b'xref\n%d %d\n' % (first_number, len(offsets))
+    table += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    table += b'trailer\n<< /Size %d /Root %d 0 R%s /Prev %10d >>\nstartxref\n0\n%%%%EOF\n' % (
+        total_size, catalog_number, trailer_extra, main_xref_offset
+    )
+    return table
@@ -0,0 +1,328 @@
+"""
+Shared Form XObject watermarking written as a full rewrite of the document.
+
+Every object reachable from the trailer is written once under its original
+number (stream data is copied from the input byte for byte, never decoded),
+followed by one Form XObject per distinct page box holding the watermark,
+two shared content streams that wrap the page in q/Q and paint the form,
+and a rewritten dictionary for every page pointing at them. The output has
+a single cross-reference table and no /Prev chain, so no earlier,
+unwatermarked revision of the document survives inside it, and objects the
+page tree no longer uses are dropped. The cost is proportional to the
+number of objects, not to their content size.
+"""
+import os
+import re
+import zlib
+from io import BytesIO
+import PyPDF2
+from PyPDF2.generic import (
+    ArrayObject, DictionaryObject, FloatObject, IndirectObject, NameObject,
+    NumberObject, StreamObject
+)
+
+WATERMARK_XOBJECT_NAME = '/MorWatermark'
+COPY_CHUNK_SIZE = 1024 * 1024
+MAX_OBJECT_HEADER = 64 * 1024
+STREAM_KEYWORD = re.compile(rb'stream(?:\r\n|\n|\r)')
+
+class StampNotSupported(Exception):
+    """Raised for inputs that cannot be rewritten this way, e.g. encrypted files."""
+
+def _serialize(obj):
+    buffer = BytesIO()
+    obj.write_to_stream(buffer, None)
+    return buffer.getvalue()
+
+def _serialize_entries(dictionary, skip=(), only=None):
+    buffer = BytesIO()
+    for key, value in dict.items(dictionary):
+        if key in skip or (only is not None and key not in only):
+            continue
+        NameObject(key).write_to_stream(buffer, None)
+        buffer.write(b' ')
+        value.write_to_stream(buffer, None)
+        buffer.write(b'\n')
+    return buffer.getvalue()
+
+def _inherited(page, key):
+    node = page
+    while node is not None:
+        if key in node:
+            return node[key]
+        parent = dict.get(node, '/Parent')
+        node = parent.get_object() if parent is not None else None
+    return None
+
+def _next_object_number(reader):
+    size = int(reader.trailer.get('/Size', 0))
+    for table in reader.xref.values():
+        if table:
+            size = max(size, max(table) + 1)
+    if reader.xref_objStm:
+        size = max(size, max(reader.xref_objStm) + 1)
+    return size
+
+def _page_contents(page):
+    contents = dict.get(page, '/Contents')
+    if contents is None:
+        return b''
+    resolved = contents.get_object()
+    if isinstance(resolved, ArrayObject):
+        return b' '.join(_serialize(item) for item in resolved)
+    if not isinstance(contents, IndirectObject):
+        raise StampNotSupported('page content stream is not an indirect object')
+    return _serialize(contents)
+
+def _references(obj, skip=()):
+    if isinstance(obj, IndirectObject):
+        yield obj
+    elif isinstance(obj, DictionaryObject):
+        for key, value in dict.items(obj):
+            if key not in skip:
+                yield from _references(value)
+    elif isinstance(obj, ArrayObject):
+        for item in obj:
+            yield from _references(item)
+
+def _stream_start(fh, offset, length):
+    # Offset of the first data byte: the stream keyword whose data of the
+    # parsed length is followed by endstream. Dictionary strings may contain
+    # the word too, hence the check.
+    fh.seek(offset)
+    head = b''
+    while len(head) < MAX_OBJECT_HEADER:
+        chunk = fh.read(1024)
+        if not chunk:
+            break
+        head += chunk
+        for match in STREAM_KEYWORD.finditer(head):
+            start = offset + match.end()
+            fh.seek(start + length)
+            if fh.read(32).lstrip().startswith(b'endstream'):
+                return start
+        fh.seek(offset + len(head))
+    raise StampNotSupported('stream data not found')
+
+def _collect_objects(reader, fh, skip):
+    """Every object reachable from the trailer except those in skip, in number order."""
+    objects = []
+    seen = set()
+    pending = list(_references(reader.trailer, skip=('/Encrypt', '/Prev', '/XRefStm')))
+    while pending:
+        ref = pending.pop()
+        key = (ref.idnum, ref.generation)
+        if key in seen:
+            continue
+        seen.add(key)
+        obj = ref.get_object()
+        if obj is None:
+            continue  # a dangling reference reads as null
+        if isinstance(obj, StreamObject):
+            # Streams never live in object streams, so the data sits in the file
+            offset = reader.xref.get(ref.generation, {}).get(ref.idnum)
+            if offset is None:
+                raise StampNotSupported(f'stream {ref.idnum} has no file offset')
+            length = len(obj._data)
+            span = (_stream_start(fh, offset, length), length)
+            pending.extend(_references(obj, skip=('/Length',)))
+        else:
+            span = None
+            pending.extend(_references(obj))
+        if key not in skip:
+            body = _serialize_entries(obj, skip=('/Length',)) if span else _serialize(obj)
+            objects.append((ref.idnum, ref.generation, body, span))
+    objects.sort()
+    return objects
+
+def build_stamp_plan(input_path, reader=None):
+    """
+    Inspect input_path and return the plain-data plan write_stamped_pdf needs.
+    The plan holds no reference to the parsed document, so it can be cached.
+    """
+    reader = reader or PyPDF2.PdfReader(input_path)
+    if reader.is_encrypted:
+        raise StampNotSupported('encrypted documents cannot be rewritten')
+    pages = []
+    for page in reader.pages:
+        ref = page.indirect_reference
+        if ref is None:
+            raise StampNotSupported('page has no object number')
+        resources = _inherited(page, '/Resources') or DictionaryObject()
+        xobjects = resources.get('/XObject')
+        if xobjects is not None:
+            xobjects = xobjects.get_object()
+        box = page.mediabox
+        pages.append({
+            'ref': (ref.idnum, ref.generation),
+            'box': (float(box.left), float(box.bottom), float(box.width), float(box.height)),
+            'entries': _serialize_entries(page, skip=('/Contents', '/Resources')),
+            'contents': _page_contents(page),
+            'resources': _serialize_entries(resources, skip=('/XObject',)),
+            'xobjects': _serialize_entries(xobjects) if xobjects else b'',
+        })
+    with open(input_path, 'rb') as fh:
+        objects = _collect_objects(reader, fh, skip={page['ref'] for page in pages})
+    return {
+        'file_size': os.path.getsize(input_path),
+        'size': _next_object_number(reader),
+        'trailer': _serialize_entries(reader.trailer, only=('/Root', '/Info', '/ID')),
+        'pdf_header': reader.pdf_header,
+        'objects': objects,
+        'pages': pages,
+    }
+
+class _ObjectWriter:
+    def __init__(self, output_file, next_number):
+        self.output_file = output_file
+        self.offset = 0
+        self.next_number = next_number
+        self.xref = {}
+
+    def allocate(self):
+        number = self.next_number
+        self.next_number += 1
+        return number
+
+    def write(self, data):
+        self.output_file.write(data)
+        self.offset += len(data)
+
+    def write_object(self, number, body, generation=0):
+        self.xref[number] = (self.offset, generation)
+        self.write(b'%d %d obj\n' % (number, generation))
+        self.write(body)
+        self.write(b'\nendobj\n')
+
+    def write_stream(self, number, entries, data, compress=True):
+        if compress:
+            data = zlib.compress(data)
+            entries += b'/Filter /FlateDecode\n'
+        self.write_object(number, b'<<' + entries + b'/Length %d>>\nstream\n' % len(data) + data + b'\nendstream')
+
+    def copy_stream(self, number, generation, entries, source, span):
+        start, length = span
+        self.xref[number] = (self.offset, generation)
+        self.write(b'%d %d obj\n<<' % (number, generation) + entries + b'/Length %d>>\nstream\n' % length)
+        source.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = source.read(min(COPY_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise StampNotSupported('input file changed while stamping')
+            self.write(chunk)
+            remaining -= len(chunk)
+        if not source.read(32).lstrip().startswith(b'endstream'):
+            raise StampNotSupported('input file changed while stamping')
+        self.write(b'\nendstream\nendobj\n')
+
+class _ObjectCopier:
+    """Copies objects from the overlay document into the update, renumbering references."""
+    def __init__(self, writer):
+        self.writer = writer
+        self.numbers = {}
+        self.pending = []
+
+    def copy(self, obj):
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            if key not in self.numbers:
+                self.numbers[key] = self.writer.allocate()
+                self.pending.append((self.numbers[key], obj.get_object()))
+            return IndirectObject(self.numbers[key], 0, None)
+        if isinstance(obj, StreamObject):
+            raise StampNotSupported('direct stream objects cannot be copied')
+        if isinstance(obj, DictionaryObject):
+            copied = DictionaryObject()
+            for key, value in dict.items(obj):
+                copied[NameObject(key)] = self.copy(value)
+            return copied
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self.copy(item) for item in obj)
+        return obj
+
+    def flush(self):
+        while self.pending:
+            number, obj = self.pending.pop(0)
+            if isinstance(obj, StreamObject):
+                entries = DictionaryObject()
+                for key, value in dict.items(obj):
+                    if key not in ('/Length', '/Filter', '/DecodeParms'):
+                        entries[NameObject(key)] = self.copy(value)
+                self.writer.write_stream(number, _serialize_entries(entries), obj.get_data())
+            else:
+                self.writer.write_object(number, _serialize(self.copy(obj)))
+
+def _write_watermark_form(writer, copier, overlay_pdf, box):
+    left, bottom, width, height = box
+    overlay_page = PyPDF2.PdfReader(BytesIO(overlay_pdf)).pages[0]
+    contents = overlay_page['/Contents'].get_object()
+    if isinstance(contents, ArrayObject):
+        data = b'\n'.join(item.get_object().get_data() for item in contents)
+    else:
+        data = contents.get_data()
+    form = DictionaryObject({
+        NameObject('/Type'): NameObject('/XObject'),
+        NameObject('/Subtype'): NameObject('/Form'),
+        NameObject('/BBox'): ArrayObject([NumberObject(0), NumberObject(0), FloatObject(width), FloatObject(height)]),
+        NameObject('/Matrix'): ArrayObject([NumberObject(1), NumberObject(0), NumberObject(0), NumberObject(1), FloatObject(left), FloatObject(bottom)]),
+        NameObject('/Resources'): copier.copy(overlay_page.get('/Resources', DictionaryObject())),
+    })
+    number = writer.allocate()
+    writer.write_stream(number, _serialize_entries(form), data)
+    copier.flush()
+    return number
+
+def _write_xref_table(writer, plan):
+    # One table for the whole file; unused numbers form the free list
+    xref_offset = writer.offset
+    free = [number for number in range(1, writer.next_number) if number not in writer.xref]
+    next_free = dict(zip([0] + free, free + [0]))
+    writer.write(b'xref\n0 %d\n' % writer.next_number)
+    for number in range(writer.next_number):
+        if number in writer.xref:
+            offset, generation = writer.xref[number]
+            writer.write(b'%010d %05d n \n' % (offset, generation))
+        else:
+            writer.write(b'%010d 65535 f \n' % next_free[number])
+    writer.write(b'trailer\n<<' + plan['trailer'] + b'/Size %d>>\n' % writer.next_number)
+    return xref_offset
+
+def write_stamped_pdf(input_path, get_overlay, output_file, plan=None):
+    """
+    Write a watermarked rewrite of input_path to output_file.
+    get_overlay(page_size) returns the one-page overlay PDF for that size.
+    """
+    plan = plan or build_stamp_plan(input_path)
+    writer = _ObjectWriter(output_file, plan['size'])
+    writer.write(plan['pdf_header'].encode('ascii') + b'\n%\xe2\xe3\xcf\xd3\n')
+    with open(input_path, 'rb') as source:
+        if os.fstat(source.fileno()).st_size != plan['file_size']:
+            raise StampNotSupported('input file changed while stamping')
+        for number, generation, body, span in plan['objects']:
+            if span is None:
+                writer.write_object(number, body, generation)
+            else:
+                writer.copy_stream(number, generation, body, source, span)
+
+    copier = _ObjectCopier(writer)
+    open_number = writer.allocate()
+    writer.write_stream(open_number, b'', b'q\n', compress=False)
+    stamp_number = writer.allocate()
+    writer.write_stream(stamp_number, b'', b'\nQ\nq ' + WATERMARK_XOBJECT_NAME.encode('ascii') + b' Do\nQ\n', compress=False)
+
+    forms = {}
+    for page in plan['pages']:
+        box = page['box']
+        if box not in forms:
+            forms[box] = _write_watermark_form(writer, copier, get_overlay((box[2], box[3])), box)
+        number, generation = page['ref']
+        writer.write_object(number, (
+            b'<<' + page['entries'] +
+            b'/Contents [%d 0 R %s %d 0 R]\n' % (open_number, page['contents'], stamp_number) +
+            b'/Resources <<' + page['resources'] +
+            b'/XObject <<' + page['xobjects'] + WATERMARK_XOBJECT_NAME.encode('ascii') + b' %d 0 R>>>>>>' % forms[box]
+        ), generation)
+
+    xref_offset = _write_xref_table(writer, plan)
+    writer.write(b'startxref\n%d\n%%%%EOF\n' % xref_offset)
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from website.models import PurchasedReport
+from .workers import BoundedWorkerPool
+
+class WarmPool(BoundedWorkerPool):
+    """
+    Builds watermarked copies ahead of the first viewer open. A job dropped
+    because the queue is full only means the buyer's first open builds the
+    copy itself.
+    """
+    name = 'watermark-warm'
+
+    def handle(self, purchase_id):
+        warm_purchase(purchase_id)
+
+def warm_purchase(purchase_id):
+    """Build and cache the buyer's watermarked copy of a purchased report."""
+    from .utils import add_watermark_to_pdf
+    purchase = PurchasedReport.objects.select_related('client', 'report').filter(id=purchase_id).first()
+    if purchase is None or not purchase.report.file:
+        return None
+    return add_watermark_to_pdf(purchase.report.file.path, purchase.client, offload=True)
+
+warm_pool = WarmPool(
+    workers=getattr(settings, 'WATERMARK_PREWARM_WORKERS', 2),
+    max_queue=getattr(settings, 'WATERMARK_PREWARM_MAX_QUEUE', 100),
+    enqueue_timeout=getattr(settings, 'WATERMARK_PREWARM_ENQUEUE_TIMEOUT', 0.5)
+)
+
+@receiver(post_save, sender=PurchasedReport, dispatch_uid='dashboard.prewarm_purchased_report')
+def purchased_report_created_handler(sender, instance, created, **kwargs):
+    if created and getattr(settings, 'WATERMARK_PREWARM_ENABLED', True):
+        # Wait for the payment transaction to commit so the worker can see the row
+        transaction.on_commit(lambda: warm_pool.submit(instance.id))
@@ -0,0 +1,78 @@
+import re
+import logging
+from django.conf import settings
+
+logger = logging.getLogger('dashboard')
+
+# Views declare the most SQL queries one request may run:
+#
+#     class PublicReportsView(generics.ListAPIView):
+#         query_budget = 4                      # every method
+#         query_budget = {'GET': 4, 'POST': 9}  # per method
+#
+# A budget is the count measured on the seeded catalog of the route sweep in
+# dashboard.tests.QueryBudgetTests plus 2, small enough that one extra query
+# per listed row fails it. Views whose count grows with an order's size note
+# the per-report cost next to the budget.
+#
+# QueryBudgetMiddleware counts the queries of each request and compares them
+# with the budget of the view that served it. Over budget is logged as a
+# warning, or raised when QUERY_BUDGET_RAISE is set (the test suite turns it
+# on), so an N+1 regression fails the suite instead of slowing production down.
+#
+# Only the view's own queries count. Savepoint statements are transaction
+# control (and only appear as savepoints under the test suite's wrapping
+# transaction), and reads and writes of the database cache table would go to
+# another server with any other cache backend.
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+def get_uncounted_statement_re():
+    tables = [
+        options['LOCATION'] for options in settings.CACHES.values()
+        if options.get('BACKEND', '').endswith('.DatabaseCache')
+    ]
+    patterns = [r'^\s*(RELEASE\s+|ROLLBACK\s+TO\s+)?SAVEPOINT\b']
+    patterns += [rf'\b(FROM|INTO|UPDATE)\s+["`]?{re.escape(table)}["`]?(\s|$)' for table in tables]
+    return re.compile('|'.join(patterns), re.IGNORECASE)
+
+class QueryCounter:
+    """Database execute wrapper that counts the statements run through it, except those the budget ignores."""
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+        self.uncounted = get_uncounted_statement_re()
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.uncounted.search(sql):
+            return execute(sql, params, many, context)
+        self.count += 1
+        if len(self.statements) < 50:
+            self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+def get_view_class(request):
+    match = getattr(request, 'resolver_match', None)
+    return getattr(match.func, 'view_class', None) if match else None
+
+def get_query_budget(view_class, method):
+    """The budget view_class declares for method, else QUERY_BUDGET_DEFAULT (None: unchecked)."""
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        budget = budget.get(method.upper())
+    if budget is None:
+        budget = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+    return budget
+
+def check_query_budget(request, counter):
+    view_class = get_view_class(request)
+    if view_class is None:
+        return
+    budget = get_query_budget(view_class, request.method)
+    if budget is None or counter.count <= budget:
+        return
+    message = f"{request.method} {request.path} ({view_class.__name__}) ran {counter.count} queries, budget is {budget}"
+    if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+        raise QueryBudgetExceeded(message + ':\n' + '\n'.join(counter.statements))
+    logger.warning(message)
@@ -0,0 +1,139 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+# Builds the select_related / prefetch_related / annotate calls a queryset needs
+# before a serializer walks it, so list endpoints run a fixed number of queries
+# whatever the page size. Relations are read off the serializer's fields:
+#
+#   - a nested serializer on a foreign key or one-to-one is joined (select_related)
+#     and its own fields are planned under that prefix;
+#   - a nested serializer with many=True is prefetched with a queryset planned
+#     for the child serializer;
+#   - a dotted source such as 'client.email' joins the relations it walks.
+#
+# Relations used inside SerializerMethodFields are invisible to this, so a
+# serializer lists them on its Meta:
+#
+#   class Meta:
+#       select_related = ['report']
+#       prefetch_related = ['items']
+#       annotations = lambda: {'item_total': Count('items')}
+#
+# Annotations are a callable returning fresh expressions. They are applied only
+# where the serializer's model is the queryset's model (the root, or a
+# prefetched child); method fields should fall back to a query when the
+# annotated attribute is missing. Any of the three may instead map field names
+# to what that field needs, so a field left out of a sparse fieldset (see
+# fieldsets) costs nothing:
+#
+#       annotations = {'item_total': lambda: {'item_total': Count('items')}}
+#
+# Meta.deferrable names large columns that are not loaded when their field is
+# left out, e.g. deferrable = ['description'].
+
+class QueryPlan:
+    def __init__(self):
+        self.select_related = []
+        self.prefetch_related = []
+        self.annotations = {}
+        self.defer = []
+
+    def select(self, lookup):
+        if lookup not in self.select_related:
+            self.select_related.append(lookup)
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.annotations:
+            queryset = queryset.annotate(**self.annotations)
+        if self.defer:
+            queryset = queryset.defer(*self.defer)
+        return queryset
+
+def _relation(model, name):
+    """(field, related model, is_single) for the relation called name on model, or None."""
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    if not field.is_relation or field.related_model is None:
+        return None
+    return field, field.related_model, field.many_to_one or field.one_to_one
+
+def _plan_source_path(plan, model, source_attrs, prefix):
+    # Join every single-valued relation the dotted source walks through
+    for name in source_attrs:
+        relation = _relation(model, name)
+        if relation is None or not relation[2]:
+            return
+        prefix = f'{prefix}{name}'
+        plan.select(prefix)
+        model, prefix = relation[1], prefix + '__'
+
+def _meta_option(meta, name, serializer):
+    # The Meta value for the whole serializer, or those of the fields it renders
+    value = getattr(meta, name, None)
+    if isinstance(value, dict):
+        return [value[field] for field in value if field in serializer.fields]
+    return [value] if value else []
+
+def _plan_serializer(plan, serializer, model, prefix):
+    meta = getattr(serializer, 'Meta', None)
+    for lookups in _meta_option(meta, 'select_related', serializer):
+        for lookup in lookups:
+            plan.select(prefix + lookup)
+    for lookups in _meta_option(meta, 'prefetch_related', serializer):
+        plan.prefetch_related.extend(prefix + lookup for lookup in lookups)
+    if not prefix:
+        for annotations in _meta_option(meta, 'annotations', serializer):
+            plan.annotations.update(annotations())
+    for name in getattr(meta, 'deferrable', ()):
+        if name not in serializer.fields:
+            plan.defer.append(prefix + name)
+
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            if isinstance(field, serializers.BaseSerializer):
+                _plan_serializer(plan, field, model, prefix)
+            continue
+        source_attrs = field.source.split('.')
+        if isinstance(field, serializers.ListSerializer) and len(source_attrs) == 1:
+            relation = _relation(model, source_attrs[0])
+            child_model = getattr(getattr(field.child, 'Meta', None), 'model', None)
+            if relation is not None and child_model is not None:
+                child_queryset = plan_queryset(child_model._default_manager.all(), field.child)
+                plan.prefetch_related.append(Prefetch(prefix + source_attrs[0], queryset=child_queryset))
+            continue
+        if isinstance(field, serializers.BaseSerializer) and len(source_attrs) == 1:
+            relation = _relation(model, source_attrs[0])
+            if relation is not None and relation[2]:
+                plan.select(prefix + source_attrs[0])
+                _plan_serializer(plan, field, relation[1], f'{prefix}{source_attrs[0]}__')
+            continue
+        if len(source_attrs) > 1:
+            _plan_source_path(plan, model, source_attrs[:-1], prefix)
+
+def build_query_plan(serializer):
+    """The QueryPlan for serializing instances of serializer's model with serializer (a class or instance)."""
+    if isinstance(serializer, type):
+        serializer = serializer()
+    if isinstance(serializer, serializers.ListSerializer):
+        serializer = serializer.child
+    plan = QueryPlan()
+    _plan_serializer(plan, serializer, serializer.Meta.model, '')
+    return plan
+
+def plan_queryset(queryset, serializer):
+    """queryset with the joins, prefetches and annotations serializer needs."""
+    return build_query_plan(serializer).apply(queryset)
+
+class SerializerQueryPlanMixin:
+    """For generic views: plans the filtered queryset for the serializer the view renders it with."""
+    def filter_queryset(self, queryset):
+        return plan_queryset(super().filter_queryset(queryset), self.get_serializer())
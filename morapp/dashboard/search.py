@@ -0,0 +1,238 @@
+import re
+import html
+import logging
+import pypdfium2 as pdfium
+from django.conf import settings
+from django.db import connection, connections, transaction, DatabaseError
+from django.db.models import Case, When, IntegerField, Lookup
+from django.db.models.signals import post_delete, post_migrate
+from django.dispatch import receiver
+from website.models import ReportCatalogEntry
+from website.migrations._catalog_index import TRIGGER_SQL, POPULATE_SQL
+from .page_images import _pdfium_lock
+from .catalog_cache import bump_catalog_version
+
+logger = logging.getLogger('dashboard')
+
+# FTS5 table created by website migration 0012; one row per report page
+PAGE_INDEX_TABLE = 'website_reportpage_fts'
+# FTS5 table over title, description and category name, rowid = report id (website migration 0013)
+CATALOG_INDEX_TABLE = 'website_report_catalog_fts'
+CATALOG_VOCAB_TABLE = 'website_report_catalog_vocab'
+# Triggers that keep the catalog index in step with website_report (website/migrations/_catalog_index.py)
+CATALOG_TRIGGERS = (
+    'website_report_catalog_ai', 'website_report_catalog_au', 'website_report_catalog_ad',
+    'website_reportcategory_catalog_au',
+)
+MAX_QUERY_TERMS = 8
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+# Control characters mark the matched terms so the snippet can be escaped before <mark> is added
+_HIT_START, _HIT_END = '\x02', '\x03'
+
+def content_search_available():
+    return connection.vendor == 'sqlite'
+
+def extract_page_texts(input_path):
+    """Return the text of every page of input_path, in page order."""
+    texts = []
+    with _pdfium_lock:
+        document = pdfium.PdfDocument(input_path)
+        try:
+            for page in document:
+                textpage = page.get_textpage()
+                texts.append(textpage.get_text_bounded())
+                textpage.close()
+                page.close()
+        finally:
+            document.close()
+    return texts
+
+def index_report_text(report_id, page_texts):
+    """Replace the indexed page texts of a report."""
+    if not content_search_available():
+        return
+    rows = [(report_id, number, text) for number, text in enumerate(page_texts, start=1) if text.strip()]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {PAGE_INDEX_TABLE} WHERE report_id = %s', [report_id])
+        cursor.executemany(
+            f'INSERT INTO {PAGE_INDEX_TABLE} (report_id, page_number, body) VALUES (%s, %s, %s)', rows
+        )
+
+def remove_report_text(report_id):
+    if not content_search_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {PAGE_INDEX_TABLE} WHERE report_id = %s', [report_id])
+
+def build_match_expression(query):
+    """
+    Turn free text into an FTS5 query: every term must match, the last one as
+    a prefix so results keep up while the user is typing. Terms are quoted, so
+    FTS operators in the input are treated as words. Returns None when the
+    query has no searchable terms.
+    """
+    terms = _TERM_RE.findall(query.lower())[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"' for term in terms) + '*'
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance between a and b, or limit + 1 once it exceeds limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+def _catalog_term_expression(cursor, term, is_last):
+    """
+    FTS5 expression for one query term. A term with no match in the catalog is
+    swapped for the closest indexed terms (same first letter, one edit for
+    words up to 7 letters, two beyond), which gives typo tolerance without
+    scanning reports.
+    """
+    quoted = f'"{term}"*' if is_last else f'"{term}"'
+    cursor.execute(f'SELECT 1 FROM {CATALOG_INDEX_TABLE} WHERE {CATALOG_INDEX_TABLE} MATCH %s LIMIT 1', [quoted])
+    if cursor.fetchone() or len(term) < 4:
+        return quoted
+    limit = 1 if len(term) <= 7 else 2
+    cursor.execute(
+        f'SELECT term FROM {CATALOG_VOCAB_TABLE} WHERE term >= %s AND term < %s AND length(term) BETWEEN %s AND %s',
+        [term[0], term[0] + '\uffff', len(term) - limit, len(term) + limit]
+    )
+    candidates = []
+    for (candidate,) in cursor.fetchall():
+        distance = edit_distance(term, candidate, limit)
+        if distance <= limit:
+            candidates.append((distance, candidate))
+    if not candidates:
+        return quoted
+    best = min(distance for distance, _ in candidates)
+    corrected = sorted(candidate for distance, candidate in candidates if distance == best)[:3]
+    return '(' + ' OR '.join(f'"{candidate}"' for candidate in corrected) + ')'
+
+def build_catalog_expression(query):
+    """
+    FTS5 query for the catalog index: every term must match, the last one as a
+    prefix, and misspelt terms are corrected against the index vocabulary.
+    Returns None when the query has no searchable terms.
+    """
+    terms = _TERM_RE.findall(query.lower())[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    with connection.cursor() as cursor:
+        return ' AND '.join(
+            _catalog_term_expression(cursor, term, position == len(terms) - 1) for position, term in enumerate(terms)
+        )
+
+class CatalogMatch(Lookup):
+    """document__match=expression on ReportCatalogEntry: an FTS5 MATCH over the whole catalog index."""
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', [*lhs_params, *rhs_params]
+
+ReportCatalogEntry._meta.get_field('document').register_lookup(CatalogMatch)
+
+def search_catalog(queryset, query):
+    """
+    Narrow a Report queryset to reports whose title, description or category
+    name match query, best BM25 rank first (title matches weigh most). The
+    index is joined once on rowid = id, so FTS5 finds the matches and ranks
+    them in the same pass, and counting and paging stay in SQLite.
+    """
+    expression = build_catalog_expression(query)
+    if expression is None:
+        return queryset.none()
+    return queryset.filter(catalog_entry__document__match=expression).order_by('catalog_entry__rank', '-created_at')
+
+def missing_catalog_triggers(using='default'):
+    """
+    Names of the catalog index triggers that are not in the database. SQLite
+    drops them whenever a migration rebuilds website_report without restoring
+    them, after which the index silently stops following report writes.
+    """
+    if connections[using].vendor != 'sqlite':
+        return []
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name IN "
+            f"({', '.join(['%s'] * (len(CATALOG_TRIGGERS) + 1))})",
+            [CATALOG_INDEX_TABLE, *CATALOG_TRIGGERS]
+        )
+        present = {name for (name,) in cursor.fetchall()}
+    if CATALOG_INDEX_TABLE not in present:
+        return []  # Migrated to before the index exists
+    return [name for name in CATALOG_TRIGGERS if name not in present]
+
+@receiver(post_migrate, dispatch_uid='dashboard.restore_catalog_triggers')
+def restore_catalog_triggers_handler(sender, using='default', **kwargs):
+    """
+    Puts back catalog triggers that a migration dropped (with a rebuild of
+    website_report) and did not restore, then reindexes the catalog, so search
+    does not go stale when a migration forgets restore_catalog_triggers.
+    """
+    if sender.label != 'website':
+        return
+    missing = missing_catalog_triggers(using)
+    if not missing:
+        return
+    logger.warning("Restoring the catalog search index triggers dropped by a migration: %s", ', '.join(missing))
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        for statement in TRIGGER_SQL + POPULATE_SQL:
+            cursor.execute(statement)
+    try:
+        bump_catalog_version()  # Cached searches were answered from the stale index
+    except DatabaseError:
+        pass  # A fresh install creates the cache table after migrating
+
+def rank_reports(queryset, report_ids):
+    """Restrict queryset to report_ids, ordered as they are listed."""
+    ranking = Case(
+        *[When(id=report_id, then=position) for position, report_id in enumerate(report_ids)],
+        output_field=IntegerField()
+    )
+    return queryset.filter(id__in=report_ids).order_by(ranking)
+
+def _format_snippet(snippet):
+    return html.escape(snippet).replace(_HIT_START, '<mark>').replace(_HIT_END, '</mark>')
+
+def search_report_contents(query):
+    """
+    Search the indexed report text. Returns {report_id: [{'page', 'snippet'}]}
+    in rank order (dicts keep insertion order), best page first within each
+    report. Reports are ranked by their best matching page.
+    """
+    expression = build_match_expression(query)
+    if expression is None or not content_search_available():
+        return {}
+    max_hits = getattr(settings, 'REPORT_SEARCH_MAX_HITS', 1000)
+    snippets_per_report = getattr(settings, 'REPORT_SEARCH_SNIPPETS_PER_REPORT', 3)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT report_id, page_number, snippet({PAGE_INDEX_TABLE}, 2, %s, %s, '…', 12) "
+            f"FROM {PAGE_INDEX_TABLE} WHERE {PAGE_INDEX_TABLE} MATCH %s ORDER BY bm25({PAGE_INDEX_TABLE}) LIMIT %s",
+            [_HIT_START, _HIT_END, expression, max_hits]
+        )
+        rows = cursor.fetchall()
+    results = {}
+    for report_id, page_number, snippet in rows:
+        hits = results.setdefault(report_id, [])
+        if len(hits) < snippets_per_report:
+            hits.append({'page': page_number, 'snippet': _format_snippet(snippet)})
+    return results
+
+@receiver(post_delete, sender='website.Report', dispatch_uid='dashboard.unindex_report_text')
+def report_deleted_search_handler(sender, instance, **kwargs):
+    remove_report_text(instance.id)
@@ -1,11 +1,15 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, OuterRef, Subquery
 from django.utils import timezone
-from website.models import Report, ReportCategory, Order, OrderItem, Transaction, PurchasedReport, UserProfile
+from website.models import Report, ReportCategory, Order, OrderItem, Transaction, PurchasedReport, UserProfile, ReportUpload
 from morapp.utils import generate_order_number  # Import from morapp.utils
+from .utils import generate_report_preview_url
+from .uploads import get_chunk_size
+from .storage import blob_digest
+from .fieldsets import SparseFieldsetMixin
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     full_name = serializers.SerializerMethodField()
     
     class Meta:
@@ -35,21 +39,17 @@ class UserProfileSerializer(serializers.ModelSerializer):
             return float(total) if total else 0
         return 0
 
-class ReportCategorySerializer(serializers.ModelSerializer):
-    report_count = serializers.SerializerMethodField()  # Fixed typo: TranserializerMethodField -> SerializerMethodField
+class ReportCategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    report_count = serializers.IntegerField(source='active_report_count', read_only=True)
     
     class Meta:
         model = ReportCategory
         fields = ['id', 'name', 'slug', 'report_count']
         read_only_fields = ['slug']
-    
-    def get_report_count(self, obj):
-        return obj.report_set.filter(is_active=True).count()
 
-class ReportSerializer(serializers.ModelSerializer):
+class ReportSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category = ReportCategorySerializer(read_only=True)
     category_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
-    purchase_count = serializers.SerializerMethodField()
     preview_image_url = serializers.SerializerMethodField()
     
     class Meta:
@@ -57,14 +57,23 @@ class ReportSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'description', 'category', 'category_id', 'price', 
                  'preview_image', 'preview_image_url', 'created_at', 'updated_at', 'is_active', 'purchase_count']
         read_only_fields = ['id', 'created_at', 'updated_at', 'purchase_count']
-    
-    def get_purchase_count(self, obj):
-        return PurchasedReport.objects.filter(report=obj).count()
+        deferrable = ['description']
+        fieldsets = {'card': ['id', 'title', 'price', 'category.name', 'category.slug', 'preview_image_url']}
     
     def get_preview_image_url(self, obj):
+        request = self.context.get('request')
         if obj.preview_image:
-            request = self.context.get('request')
             return request.build_absolute_uri(obj.preview_image.url) if request else obj.preview_image.url
+        if obj.preview_thumbnails:
+            # Clients pass the card width (in device pixels) and may ask for jpeg where WebP is unsupported
+            params = getattr(request, 'query_params', {})
+            try:
+                width = int(params.get('preview_width', 0)) or None
+            except ValueError:
+                width = None
+            image_format = 'jpeg' if params.get('preview_format') == 'jpeg' else 'webp'
+            url = generate_report_preview_url(obj, width, image_format)
+            return request.build_absolute_uri(url) if request else url
         return None
     
     def validate_category_id(self, value):
@@ -89,15 +98,33 @@ class ReportDetailSerializer(ReportSerializer):
     file_name = serializers.SerializerMethodField()
     
     class Meta(ReportSerializer.Meta):
-        fields = ReportSerializer.Meta.fields + ['file_size', 'file_name']
+        fields = ReportSerializer.Meta.fields + ['file_size', 'file_name', 'page_count', 'ingestion_status']
+        read_only_fields = ReportSerializer.Meta.read_only_fields + ['page_count', 'ingestion_status']
     
     def get_file_size(self, obj):
+        if obj.ingestion_status == 'ready':
+            return obj.file_byte_size
         return obj.file.size if obj.file else None
     
     def get_file_name(self, obj):
-        return obj.file.name.split('/')[-1] if obj.file else None
+        # Stored names are content hashes; clients get the name the file was uploaded under
+        if not obj.file:
+            return None
+        if obj.original_file_name:
+            return obj.original_file_name
+        return None if blob_digest(obj.file.name) else obj.file.name.split('/')[-1]
+
+class ReportSearchResultSerializer(ReportSerializer):
+    search_hits = serializers.SerializerMethodField()
+    
+    class Meta(ReportSerializer.Meta):
+        fields = ReportSerializer.Meta.fields + ['search_hits']
+    
+    def get_search_hits(self, obj):
+        # [{'page': 1-based page number, 'snippet': escaped text with <mark> around matches}]
+        return self.context.get('search_hits', {}).get(obj.id, [])
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     report = ReportSerializer(read_only=True)
     report_title = serializers.CharField(source='report.title', read_only=True)
     
@@ -105,7 +132,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         fields = ['id', 'report', 'report_title', 'quantity', 'price']
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     client = UserSerializer(read_only=True)
     items = OrderItemSerializer(many=True, read_only=True)
     item_count = serializers.SerializerMethodField()
@@ -149,7 +176,7 @@ class TransactionSerializer(serializers.ModelSerializer):
         fields = ['id', 'order', 'transaction_id', 'amount', 'payment_method', 'paid_at', 'confirmed']
         read_only_fields = ['id', 'paid_at', 'transaction_id', 'confirmed']
 
-class PurchasedReportSerializer(serializers.ModelSerializer):
+class PurchasedReportSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     report = ReportSerializer(read_only=True)
     client = UserSerializer(read_only=True)
     days_since_purchase = serializers.SerializerMethodField()
@@ -163,22 +190,34 @@ class PurchasedReportSerializer(serializers.ModelSerializer):
         delta = timezone.now() - obj.purchased_on
         return delta.days
 
-class ClientSummarySerializer(serializers.ModelSerializer):
+def _recent_purchases():
+    return PurchasedReport.objects.filter(client=OuterRef('user')).order_by('-purchased_on', '-id')
+
+class ClientSummarySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     recent_purchase = serializers.SerializerMethodField()
     
     class Meta:
         model = UserProfile
         fields = ['user', 'join_date', 'recent_purchase']
+        annotations = {'recent_purchase': lambda: {
+            'recent_purchase_title': Subquery(_recent_purchases().values('report__title')[:1]),
+            'recent_purchased_on': Subquery(_recent_purchases().values('purchased_on')[:1]),
+        }}
     
     def get_recent_purchase(self, obj):
-        if obj.is_client():
-            recent = PurchasedReport.objects.filter(client=obj.user).order_by('-purchased_on').first()
-            if recent:
-                return {'report_title': recent.report.title, 'purchased_on': recent.purchased_on}
+        if not obj.is_client():
+            return None
+        if hasattr(obj, 'recent_purchased_on'):
+            if obj.recent_purchased_on is None:
+                return None
+            return {'report_title': obj.recent_purchase_title, 'purchased_on': obj.recent_purchased_on}
+        recent = PurchasedReport.objects.filter(client=obj.user).select_related('report').order_by('-purchased_on', '-id').first()
+        if recent:
+            return {'report_title': recent.report.title, 'purchased_on': recent.purchased_on}
         return None
 
-class OrderSummarySerializer(serializers.ModelSerializer):
+class OrderSummarySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     client_name = serializers.CharField(source='client.get_full_name', read_only=True)
     client_email = serializers.CharField(source='client.email', read_only=True)
     
@@ -186,6 +225,29 @@ class OrderSummarySerializer(serializers.ModelSerializer):
         model = Order
         fields = ['id', 'order_number', 'client_name', 'client_email', 'status', 'total_price', 'created_at']
 
+class ReportUploadSerializer(serializers.ModelSerializer):
+    chunk_size = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = ReportUpload
+        fields = ['upload_id', 'filename', 'total_size', 'received_bytes', 'chunk_size', 'status', 'sha256',
+                  'report', 'created_at', 'updated_at']
+        read_only_fields = fields
+    
+    def get_chunk_size(self, obj):
+        return get_chunk_size()
+
+class ReportUploadCreateSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    total_size = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True)
+    report_id = serializers.IntegerField(required=False, allow_null=True)
+    
+    def validate_report_id(self, value):
+        if value and not Report.objects.filter(id=value).exists():
+            raise serializers.ValidationError("Invalid report ID")
+        return value
+
 class RevenueAnalyticsSerializer(serializers.Serializer):
     period = serializers.CharField()
     revenue = serializers.DecimalField(max_digits=10, decimal_places=2)
@@ -0,0 +1,225 @@
+import os
+import re
+import hashlib
+import tempfile
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError
+from django.db.models import F
+from django.db.models.signals import post_init, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+logger = logging.getLogger('dashboard')
+
+BLOB_DIR = 'blobs'
+BLOB_FIELDS = ('file', 'preview_image')
+_BLOB_NAME_RE = re.compile(r'(?:^|/)blobs/([0-9a-f]{2})/([0-9a-f]{2})/([0-9a-f]{64})(?:\.[0-9a-z]+)?$')
+
+def blob_name_for(digest, extension=''):
+    return f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+def blob_digest(name):
+    """Return the SHA-256 a content-addressed blob name or path carries, or None for other files."""
+    match = _BLOB_NAME_RE.search((name or '').replace(os.sep, '/'))
+    if not match or not match.group(3).startswith(match.group(1) + match.group(2)):
+        return None
+    return match.group(3)
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores each distinct file once under MEDIA_ROOT/blobs/<ab>/<cd>/<sha256><ext>.
+    Saving bytes that are already stored returns the existing name, so identical
+    report files share one blob. Blobs are immutable: delete() leaves them to
+    gc_report_blobs, which removes those no report refers to any more. Names
+    saved before this backend (reports/...) keep working as plain files.
+    """
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content, so there is nothing to deduplicate here
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        tmp_dir = self.path(os.path.join(BLOB_DIR, '.tmp'))
+        os.makedirs(tmp_dir, exist_ok=True)
+        source_path = content.temporary_file_path() if hasattr(content, 'temporary_file_path') else None
+        digest = getattr(content, 'content_sha256', None)
+        if source_path is None:
+            # Hash while copying, so the bytes are read once
+            sha = hashlib.sha256()
+            fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+            try:
+                with os.fdopen(fd, 'wb') as tmp_file:
+                    for chunk in content.chunks():
+                        sha.update(chunk)
+                        tmp_file.write(chunk)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            digest = sha.hexdigest()
+        elif digest is None:
+            sha = hashlib.sha256()
+            with open(source_path, 'rb') as source:
+                for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                    sha.update(chunk)
+            digest = sha.hexdigest()
+
+        blob_name = blob_name_for(digest, extension)
+        full_path = self.path(blob_name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if os.path.exists(full_path):
+            if source_path is None:
+                os.remove(tmp_path)
+        elif source_path is None:
+            os.replace(tmp_path, full_path)
+        else:
+            file_move_safe(source_path, full_path)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        register_blob(digest, blob_name, os.path.getsize(full_path))
+        return blob_name
+
+    def delete(self, name):
+        if blob_digest(name):
+            return
+        super().delete(name)
+
+def register_blob(digest, name, size):
+    """Record a stored blob; saving it again restarts its garbage-collection grace period."""
+    from website.models import StoredBlob
+    if StoredBlob.objects.filter(digest=digest).update(last_saved_at=timezone.now()):
+        return
+    try:
+        StoredBlob.objects.create(digest=digest, name=name, size=size)
+    except IntegrityError:
+        StoredBlob.objects.filter(digest=digest).update(last_saved_at=timezone.now())
+
+def _adjust_refcounts(names, delta):
+    from website.models import StoredBlob
+    for name in names:
+        digest = blob_digest(name)
+        if digest is None:
+            continue
+        if not StoredBlob.objects.filter(digest=digest).update(refcount=F('refcount') + delta) and delta > 0:
+            full_path = os.path.join(settings.MEDIA_ROOT, name)
+            size = os.path.getsize(full_path) if os.path.exists(full_path) else 0
+            StoredBlob.objects.create(digest=digest, name=name, size=size, refcount=delta)
+
+def _referenced_blobs(instance):
+    # Read the raw field values so deferred fields are not loaded just to count references
+    names = set()
+    for field_name in BLOB_FIELDS:
+        value = instance.__dict__.get(field_name)
+        name = getattr(value, 'name', value)
+        if name and blob_digest(name):
+            names.add(name)
+    return names
+
+def thumbnail_blob_names(thumbnails):
+    """The blobs a Report.preview_thumbnails value ({format: {width: name}}) refers to."""
+    return {name for sizes in (thumbnails or {}).values() for name in sizes.values() if blob_digest(name)}
+
+def replace_thumbnail_refs(previous, current):
+    """
+    Move one reference per blob from the previous preview_thumbnails value to
+    the current one. Ingestion writes thumbnails with a queryset update, which
+    the save signals below do not see, so it calls this in the same transaction.
+    """
+    previous, current = thumbnail_blob_names(previous), thumbnail_blob_names(current)
+    _adjust_refcounts(current - previous, 1)
+    _adjust_refcounts(previous - current, -1)
+
+@receiver(post_init, sender='website.Report', dispatch_uid='dashboard.track_report_blobs')
+def report_loaded_handler(sender, instance, **kwargs):
+    instance._stored_blobs = _referenced_blobs(instance)
+
+@receiver(post_save, sender='website.Report', dispatch_uid='dashboard.count_report_blobs')
+def report_saved_blob_handler(sender, instance, created, **kwargs):
+    current = _referenced_blobs(instance)
+    previous = set() if created else getattr(instance, '_stored_blobs', set())
+    _adjust_refcounts(current - previous, 1)
+    _adjust_refcounts(previous - current, -1)
+    instance._stored_blobs = current
+
+@receiver(pre_delete, sender='website.Report', dispatch_uid='dashboard.read_report_thumbnails')
+def report_deleting_blob_handler(sender, instance, **kwargs):
+    # Thumbnails from the row, since ingestion may have replaced them after the instance was loaded
+    thumbnails = sender.objects.filter(pk=instance.pk).values_list('preview_thumbnails', flat=True).first()
+    instance._thumbnail_blobs = thumbnail_blob_names(thumbnails)
+
+@receiver(post_delete, sender='website.Report', dispatch_uid='dashboard.release_report_blobs')
+def report_deleted_blob_handler(sender, instance, **kwargs):
+    _adjust_refcounts(getattr(instance, '_stored_blobs', set()) | _referenced_blobs(instance), -1)
+    _adjust_refcounts(getattr(instance, '_thumbnail_blobs', set()), -1)
+
+def rebuild_blob_refcounts():
+    """Recount blob references from the report table. Returns the number of corrected blobs."""
+    from website.models import Report, StoredBlob
+    counts = {}
+    for *names, thumbnails in Report.objects.values_list(*BLOB_FIELDS, 'preview_thumbnails').iterator():
+        for name in {name for name in names if name} | thumbnail_blob_names(thumbnails):
+            digest = blob_digest(name)
+            if digest:
+                counts[digest] = counts.get(digest, 0) + 1
+                if counts[digest] == 1 and not StoredBlob.objects.filter(digest=digest).exists():
+                    full_path = os.path.join(settings.MEDIA_ROOT, name)
+                    register_blob(digest, name, os.path.getsize(full_path) if os.path.exists(full_path) else 0)
+    corrected = 0
+    for blob in StoredBlob.objects.only('digest', 'refcount').iterator():
+        expected = counts.get(blob.digest, 0)
+        if blob.refcount != expected:
+            StoredBlob.objects.filter(digest=blob.digest).update(refcount=expected)
+            corrected += 1
+    return corrected
+
+def collect_blob_garbage(grace_hours=None, scan_orphans=False, dry_run=False):
+    """
+    Delete blobs with no references that were not stored again within the
+    grace period, which covers uploads saved but not yet attached to a report.
+    scan_orphans also removes blob files with no StoredBlob row and stale temp
+    files. Returns (files removed, bytes freed).
+    """
+    from website.models import StoredBlob
+    if grace_hours is None:
+        grace_hours = getattr(settings, 'REPORT_BLOB_GC_GRACE_HOURS', 24)
+    cutoff = timezone.now() - timedelta(hours=grace_hours)
+    blob_root = os.path.join(settings.MEDIA_ROOT, BLOB_DIR)
+    removed = freed = 0
+    for blob in StoredBlob.objects.filter(refcount__lte=0, last_saved_at__lt=cutoff).iterator():
+        if not dry_run:
+            # Re-check in the delete so a blob referenced meanwhile survives
+            deleted, _ = StoredBlob.objects.filter(
+                digest=blob.digest, refcount__lte=0, last_saved_at__lt=cutoff
+            ).delete()
+            if not deleted:
+                continue
+            try:
+                os.remove(os.path.join(settings.MEDIA_ROOT, blob.name))
+            except FileNotFoundError:
+                pass
+        removed += 1
+        freed += blob.size
+
+    if scan_orphans and os.path.isdir(blob_root):
+        cutoff_ts = cutoff.timestamp()
+        for dirpath, _, filenames in os.walk(blob_root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime >= cutoff_ts:
+                    continue
+                digest = blob_digest(path)
+                if digest and StoredBlob.objects.filter(digest=digest).exists():
+                    continue
+                if not dry_run:
+                    os.remove(path)
+                removed += 1
+                freed += stat.st_size
+    logger.info(f"Blob garbage collection removed {removed} files ({freed} bytes){' (dry run)' if dry_run else ''}")
+    return removed, freed
@@ -1,19 +1,68 @@
 
 import os
+import re
+import time
+import shutil
+import hashlib
 import tempfile
-from django.test import TestCase
-from django.urls import reverse
+import zlib
+import struct
+import threading
+from io import BytesIO, StringIO
+from datetime import timedelta, datetime, timezone as dt_timezone, date
+from concurrent.futures import Future
+import PyPDF2
+from PIL import Image
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import letter
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.urls import reverse, resolve
 from django.contrib.auth.models import User
 from django.utils import timezone
-from rest_framework.test import APIClient
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import CommandError
+from django.core.management.sql import emit_post_migrate_signal
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import StreamingHttpResponse, FileResponse
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
 from rest_framework import status
-from website.models import Report, ReportCategory, Order, OrderItem, Transaction, PurchasedReport, UserProfile
-from dashboard.serializers import ReportSerializer, ReportCategorySerializer
-from dashboard.utils import generate_order_number, send_order_confirmation_email, send_payment_success_email
+from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
+from rest_framework.request import Request
+from website.models import Report, ReportCategory, Order, OrderItem, Transaction, PurchasedReport, UserProfile, StoredBlob, ReportUpload
+from website import urls as website_urls
+from dashboard.serializers import ReportSerializer, ReportCategorySerializer, ReportDetailSerializer, OrderSerializer, OrderSummarySerializer, PurchasedReportSerializer, ClientSummarySerializer
+from dashboard.utils import generate_order_number, send_order_confirmation_email, send_payment_success_email, add_watermark_to_pdf, write_watermarked_pdf, watermark_overlay_cache, WatermarkOverlayCache, stream_watermarked_pdf, get_watermark_cache_key, pdf_structure_cache, PdfStructureCache, get_stamp_plan, generate_report_preview_url, date_window, get_monthly_revenue_data
+from dashboard.cache import watermarked_pdf_cache, DiskCache, get_file_digest
+from dashboard.ingestion import ingest_report
+from dashboard.cleanup import generate_monthly_report
+from dashboard.catalog_cache import catalog_response_cache, bump_catalog_version
+from dashboard.query_plan import build_query_plan, plan_queryset
+from dashboard.views import PublicCategoriesView, AdminDashboardView
+from dashboard import urls as dashboard_urls
+from dashboard.query_budget import get_query_budget, QueryBudgetExceeded, QueryCounter
+from dashboard.counters import rebuild_counters
+from dashboard.typeahead import typeahead_index
+from dashboard.search import edit_distance, missing_catalog_triggers
+from dashboard.uploads import _hashers, write_chunk, upload_part_path, UploadOffsetMismatch, finish_upload, UploadRejected, start_upload
+from dashboard.storage import blob_digest, rebuild_blob_refcounts
+from dashboard.page_images import page_image_cache
+from dashboard.executor import WatermarkExecutor, WatermarkJobTimeout, WatermarkJobCancelled
+from dashboard.prewarm import warm_purchase, WarmPool
+from dashboard.pdf_stamp import WATERMARK_XOBJECT_NAME
 from unittest.mock import patch
 from django.core import mail
+from django.core.files.base import ContentFile
 
-class DashboardAPITests(TestCase):
+@override_settings(QUERY_BUDGET_RAISE=True)
+class QueryBudgetTestCase(TestCase):
+    """Base for the dashboard tests: a request running more queries than its view's query_budget fails the test."""
+
+class DashboardAPITests(QueryBudgetTestCase):
     def setUp(self):
         from django.test.utils import override_settings
         self.override_media = override_settings(MEDIA_ROOT='/home/nethunter/Desktop/morinsight/morapp/media')
@@ -356,3 +405,1593 @@ class DashboardAPITests(TestCase):
 
     def test_placeholder_22(self):
         self.assertTrue(True)
+
+def build_sample_pdf(path, pages=3, pagesize=None):
+    c = canvas.Canvas(path, pagesize=pagesize or letter)
+    for i in range(pages):
+        c.drawString(72, 720, f'Sample page {i + 1}')
+        c.showPage()
+    c.save()
+    return path
+
+class MediaRootTestCase(QueryBudgetTestCase):
+    """Runs each test against its own empty MEDIA_ROOT, removed afterwards."""
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=self.media_root)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+    def build_pdf(self, name, pages=3, pagesize=None):
+        """build_sample_pdf at name under MEDIA_ROOT, creating its directory."""
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return build_sample_pdf(path, pages=pages, pagesize=pagesize)
+
+class WatermarkOverlayCacheTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='reader', email='reader@test.com', password='testpass123')
+        self.pdf_path = self.build_pdf('sample.pdf')
+        watermark_overlay_cache.clear()
+
+    def test_repeat_views_skip_overlay_render(self):
+        add_watermark_to_pdf(self.pdf_path, self.user)
+        self.assertEqual(watermark_overlay_cache.stats()['misses'], 1)
+        watermarked_pdf_cache.clear()
+        with patch('dashboard.utils.canvas.Canvas') as mock_canvas:
+            output_path = add_watermark_to_pdf(self.pdf_path, self.user)
+            self.assertFalse(mock_canvas.called)
+        self.assertEqual(watermark_overlay_cache.stats()['hits'], 1)
+        self.assertEqual(len(PyPDF2.PdfReader(output_path).pages), 3)
+
+    def test_lru_eviction(self):
+        cache = WatermarkOverlayCache(max_entries=2, max_bytes=1024)
+        cache.put('a', b'1' * 10)
+        cache.put('b', b'2' * 10)
+        cache.get('a')
+        cache.put('c', b'3' * 10)
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        cache.put('d', b'4' * 2048)
+        self.assertEqual(cache.stats()['entries'], 2)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+class WatermarkedPDFCacheTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='reader', email='reader@test.com', password='testpass123')
+        self.other_user = User.objects.create_user(username='other', email='other@test.com', password='testpass123')
+        self.pdf_path = self.build_pdf('sample.pdf')
+
+    def test_returning_reader_gets_cached_copy(self):
+        first_path = add_watermark_to_pdf(self.pdf_path, self.user)
+        with patch('dashboard.utils.write_watermarked_pdf') as mock_write:
+            second_path = add_watermark_to_pdf(self.pdf_path, self.user)
+            self.assertFalse(mock_write.called)
+        self.assertEqual(first_path, second_path)
+        self.assertNotEqual(first_path, add_watermark_to_pdf(self.pdf_path, self.other_user))
+
+    def test_failed_write_leaves_no_entry(self):
+        with patch('dashboard.utils.write_watermarked_pdf', side_effect=ValueError('broken pdf')):
+            with self.assertRaises(ValueError):
+                add_watermark_to_pdf(self.pdf_path, self.user)
+        self.assertEqual(watermarked_pdf_cache.stats()['entries'], 0)
+        shard_files = [f for _, _, files in os.walk(watermarked_pdf_cache.directory) for f in files]
+        self.assertEqual(shard_files, [])
+
+    def test_byte_budget_evicts_least_recently_used(self):
+        cache = DiskCache('test-budget', max_bytes=250)
+        keys = [cache.make_key('entry', i) for i in range(3)]
+        for i, key in enumerate(keys[:2]):
+            cache.put(key, b'x' * 100)
+            os.utime(cache.path_for(key), (1000 + i, 1000 + i))
+        self.assertIsNotNone(cache.get(keys[0]))
+        cache.put(keys[2], b'x' * 100)
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+@override_settings(SECURE_VIEWER_STREAMING=True, WATERMARK_STREAM_CHUNK_SIZE=1024)
+class StreamingWatermarkTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='reader', email='reader@test.com', password='testpass123')
+        self.build_pdf('reports/sample.pdf', pages=20)
+        self.report = Report.objects.create(title='Streamed Report', description='A streamed report', price=100.00, file='reports/sample.pdf')
+        PurchasedReport.objects.create(client=self.user, report=self.report)
+
+    def test_viewer_streams_then_serves_from_cache(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse('dashboard:secure_viewer', args=[self.report.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertNotIsInstance(response, FileResponse)
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        body = b''.join(chunks)
+        self.assertEqual(len(PyPDF2.PdfReader(BytesIO(body)).pages), 20)
+        cached = self.client.get(url)
+        self.assertIsInstance(cached, FileResponse)
+        self.assertEqual(b''.join(cached.streaming_content), body)
+
+    def test_abandoned_stream_is_not_cached(self):
+        key = get_watermark_cache_key(self.report.file.path, self.user)
+        chunks = stream_watermarked_pdf(self.report.file.path, self.user, cache_key=key)
+        next(chunks)
+        chunks.close()
+        self.assertIsNone(watermarked_pdf_cache.get(key))
+
+    def test_unreadable_pdf_returns_error_before_streaming(self):
+        with open(self.report.file.path, 'wb') as f:
+            f.write(b'not a pdf')
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('dashboard:secure_viewer', args=[self.report.id]))
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class SharedXObjectWatermarkTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pdf_path = self.build_pdf('sample.pdf', pages=50)
+
+    def test_rewrite_shares_one_form_and_keeps_no_unwatermarked_revision(self):
+        output = BytesIO()
+        write_watermarked_pdf(self.pdf_path, 'Licensed to: reader', output, engine='xobject')
+        stamped = output.getvalue()
+        reader = PyPDF2.PdfReader(BytesIO(stamped))
+        self.assertEqual(len(reader.pages), 50)
+        forms = {dict.get(page['/Resources']['/XObject'], WATERMARK_XOBJECT_NAME).idnum for page in reader.pages}
+        self.assertEqual(len(forms), 1)
+        form = reader.pages[0]['/Resources']['/XObject'][WATERMARK_XOBJECT_NAME]
+        self.assertIn(b'Licensed to: reader', form.get_data())
+        self.assertEqual(stamped.count(b'startxref'), 1)
+        self.assertNotIn(b'/Prev', stamped)
+        # Cutting the file at any earlier end-of-file marker must not recover the unwatermarked document
+        for match in list(re.finditer(rb'%%EOF', stamped))[:-1]:
+            try:
+                earlier = PyPDF2.PdfReader(BytesIO(stamped[:match.end()]))
+                pages = list(earlier.pages)
+            except Exception:
+                continue
+            for page in pages:
+                self.assertIn(WATERMARK_XOBJECT_NAME, page['/Resources'].get('/XObject', {}))
+
+    def test_unreachable_objects_are_dropped(self):
+        writer = PyPDF2.PdfWriter()
+        for page in PyPDF2.PdfReader(self.pdf_path).pages[:2]:
+            writer.add_page(page)
+        writer._add_object(PyPDF2.generic.TextStringObject('UnreferencedLeftover'))
+        leftover_path = os.path.join(self.media_root, 'leftover.pdf')
+        with open(leftover_path, 'wb') as f:
+            writer.write(f)
+        output = BytesIO()
+        write_watermarked_pdf(leftover_path, 'Licensed to: reader', output, engine='xobject')
+        self.assertNotIn(b'UnreferencedLeftover', output.getvalue())
+        self.assertEqual(len(PyPDF2.PdfReader(BytesIO(output.getvalue())).pages), 2)
+
+    def test_encrypted_input_falls_back_to_merge(self):
+        writer = PyPDF2.PdfWriter()
+        for page in PyPDF2.PdfReader(self.pdf_path).pages[:2]:
+            writer.add_page(page)
+        writer.encrypt(user_password='', owner_password='owner', use_128bit=True)
+        encrypted_path = os.path.join(self.media_root, 'encrypted.pdf')
+        with open(encrypted_path, 'wb') as f:
+            writer.write(f)
+        output = BytesIO()
+        with patch('dashboard.utils.merge_watermark_pdf') as mock_merge:
+            write_watermarked_pdf(encrypted_path, 'Licensed to: reader', output)
+            self.assertTrue(mock_merge.called)
+
+class SecureViewerConditionalRangeTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='reader', email='reader@test.com', password='testpass123')
+        self.build_pdf('reports/sample.pdf', pages=10)
+        self.report = Report.objects.create(title='Ranged Report', description='A ranged report', price=100.00, file='reports/sample.pdf')
+        PurchasedReport.objects.create(client=self.user, report=self.report)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('dashboard:secure_viewer', args=[self.report.id])
+        self.full = self.client.get(self.url)
+        self.body = b''.join(self.full.streaming_content)
+
+    def test_etag_revalidation_returns_not_modified(self):
+        etag = self.full['ETag']
+        self.assertEqual(self.full['Accept-Ranges'], 'bytes')
+        with patch('dashboard.views.add_watermark_to_pdf') as mock_watermark:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertFalse(mock_watermark.called)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_byte_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-109')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 10-109/{len(self.body)}')
+        self.assertEqual(b''.join(response.streaming_content), self.body[10:110])
+        suffix = self.client.get(self.url, HTTP_RANGE='bytes=-50')
+        self.assertEqual(b''.join(suffix.streaming_content), self.body[-50:])
+        unsatisfiable = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.body)}-')
+        self.assertEqual(unsatisfiable.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(unsatisfiable['Content-Range'], f'bytes */{len(self.body)}')
+
+    def test_backwards_range_is_ignored(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=500-100')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+        empty_suffix = self.client.get(self.url, HTTP_RANGE='bytes=-0')
+        self.assertEqual(empty_suffix.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    def test_stale_if_range_sends_full_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-99', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.body)
+
+class LinearizedWatermarkTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='reader', email='reader@test.com', password='testpass123')
+        self.pdf_path = self.build_pdf('sample.pdf', pages=12)
+
+    def test_linearization_dictionary_and_first_page_hints(self):
+        with open(add_watermark_to_pdf(self.pdf_path, self.user, linearize=True), 'rb') as f:
+            data = f.read()
+
+        match = re.match(rb'%PDF-1\.\d\s+%[^\n]*\n(\d+) 0 obj\s*<<(.*?)>>', data, re.S)
+        self.assertIsNotNone(match)
+        entries = match.group(2)
+        value = lambda name: int(re.search(rb'/' + name + rb'\s+(\d+)', entries).group(1))
+        hint_offset, hint_length = map(int, re.search(rb'/H\s*\[\s*(\d+)\s+(\d+)\s*\]', entries).groups())
+        self.assertEqual(value(b'L'), len(data))
+        self.assertEqual(value(b'N'), 12)
+
+        reader = PyPDF2.PdfReader(BytesIO(data))
+        self.assertEqual(len(reader.pages), 12)
+        first_page_number = reader.pages[0].indirect_reference.idnum
+        self.assertEqual(value(b'O'), first_page_number)
+        first_page_offset = data.index(b'\n%d 0 obj' % first_page_number) + 1
+        self.assertLess(first_page_offset, value(b'E'))
+        self.assertTrue(data[value(b'T') + 1:].startswith(b'0000000000 65535 f'))
+
+        hint = data[hint_offset:hint_offset + hint_length]
+        self.assertRegex(hint, rb'^\d+ 0 obj\s*<<[^>]*/S \d+')
+        stream = hint[hint.index(b'stream\n') + 7:hint.rindex(b'\nendstream')]
+        table = zlib.decompress(stream)
+        # Offsets in the hint tables exclude the hint stream itself
+        least_objects, first_page_location = struct.unpack('>II', table[:8])
+        self.assertGreater(least_objects, 0)
+        self.assertEqual(first_page_location + hint_length, first_page_offset)
+
+    def test_viewer_serves_linearized_copy_on_request(self):
+        self.client = APIClient()
+        report = Report.objects.create(title='Linear Report', description='A linearized report', price=100.00, file='sample.pdf')
+        PurchasedReport.objects.create(client=self.user, report=report)
+        self.client.force_authenticate(user=self.user)
+        url = reverse('dashboard:secure_viewer', args=[report.id])
+        plain = self.client.get(url)
+        linearized = self.client.get(url, {'linearized': '1'})
+        self.assertEqual(linearized.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(plain['ETag'], linearized['ETag'])
+        self.assertNotIn(b'/Linearized', b''.join(plain.streaming_content)[:1024])
+        self.assertIn(b'/Linearized 1', b''.join(linearized.streaming_content)[:1024])
+
+class WatermarkPrewarmTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='buyer', email='buyer@test.com', password='testpass123')
+        self.build_pdf('reports/sample.pdf')
+        self.report = Report.objects.create(title='Warm Report', description='A warm report', price=100.00, file='reports/sample.pdf')
+
+    def test_purchase_schedules_warm_after_commit(self):
+        with patch('dashboard.prewarm.warm_pool.submit') as mock_submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                purchase, _ = PurchasedReport.objects.get_or_create(client=self.user, report=self.report)
+                self.assertFalse(mock_submit.called)
+            mock_submit.assert_called_once_with(purchase.id)
+            with self.captureOnCommitCallbacks(execute=True):
+                PurchasedReport.objects.get_or_create(client=self.user, report=self.report)
+            self.assertEqual(mock_submit.call_count, 1)
+
+    def test_warm_purchase_fills_viewer_cache(self):
+        with patch('dashboard.prewarm.warm_pool.submit'):
+            purchase = PurchasedReport.objects.create(client=self.user, report=self.report)
+        warm_purchase(purchase.id)
+        self.assertIsNotNone(watermarked_pdf_cache.get(get_watermark_cache_key(self.report.file.path, self.user)))
+
+    def test_bounded_queue_rejects_when_full(self):
+        release = threading.Event()
+        pool = WarmPool(workers=1, max_queue=1, enqueue_timeout=0.01)
+        with patch('dashboard.prewarm.warm_purchase', side_effect=lambda purchase_id: release.wait(5)):
+            self.assertTrue(pool.submit(1))
+            deadline = time.time() + 5
+            while pool.stats()['active'] == 0 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(pool.submit(2))
+            self.assertTrue(pool.submit(2))  # already pending, not queued twice
+            self.assertEqual(pool.depth(), 1)
+            self.assertFalse(pool.submit(3))
+            release.set()
+            pool.queue.join()
+        stats = pool.stats()
+        self.assertEqual((stats['submitted'], stats['completed'], stats['rejected'], stats['queue_depth']), (2, 2, 1, 0))
+
+class WatermarkExecutorTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pdf_path = self.build_pdf('sample.pdf', pages=60)
+
+    def test_job_runs_in_worker_process_and_fills_cache(self):
+        executor = WatermarkExecutor(max_workers=1, job_timeout=60)
+        try:
+            key = watermarked_pdf_cache.make_key('executor', 'run')
+            path = executor.run(key, self.pdf_path, 'Licensed to: reader', 'xobject', timeout=60)
+        finally:
+            executor.shutdown()
+        self.assertEqual(path, watermarked_pdf_cache.get(key))
+        self.assertEqual(len(PyPDF2.PdfReader(path).pages), 60)
+        self.assertEqual(executor.stats()['completed'], 1)
+
+    def test_job_timeout_aborts_worker_and_leaves_no_entry(self):
+        executor = WatermarkExecutor(max_workers=1, job_timeout=0.001)
+        try:
+            key = watermarked_pdf_cache.make_key('executor', 'timeout')
+            with self.assertRaises(WatermarkJobTimeout):
+                executor.run(key, self.pdf_path, 'Licensed to: reader', 'merge', timeout=60)
+        finally:
+            executor.shutdown()
+        self.assertEqual(executor.stats()['timeouts'], 1)
+        self.assertIsNone(watermarked_pdf_cache.get(key))
+        self.assertEqual([f for _, _, files in os.walk(watermarked_pdf_cache.directory) for f in files], [])
+
+    def test_cancel_drops_unclaimed_pending_job(self):
+        executor = WatermarkExecutor(max_workers=1)
+        pending = Future()
+        with patch.object(executor, '_get_pool') as mock_pool:
+            mock_pool.return_value.submit.return_value = pending
+            key = watermarked_pdf_cache.make_key('executor', 'cancel')
+            first = executor.submit(key, self.pdf_path, 'Licensed to: reader', 'xobject')
+            second = executor.submit(key, self.pdf_path, 'Licensed to: reader', 'xobject')
+            self.assertIs(first, second)
+            self.assertEqual(mock_pool.return_value.submit.call_count, 1)
+            self.assertFalse(executor.cancel(key))  # another request still waits
+            self.assertTrue(executor.cancel(key))
+        with self.assertRaises(WatermarkJobCancelled):
+            first.result(timeout=1)
+        self.assertEqual(executor.stats()['cancelled'], 1)
+        self.assertEqual([f for _, _, files in os.walk(watermarked_pdf_cache.directory) for f in files], [])
+
+    def test_viewer_returns_503_when_job_times_out(self):
+        client = APIClient()
+        user = User.objects.create_user(username='reader', email='reader@test.com', password='testpass123')
+        self.build_pdf('reports/sample.pdf')
+        report = Report.objects.create(title='Slow Report', description='A slow report', price=100.00, file='reports/sample.pdf')
+        PurchasedReport.objects.create(client=user, report=report)
+        client.force_authenticate(user=user)
+        with patch('dashboard.views.add_watermark_to_pdf', side_effect=WatermarkJobTimeout('too slow')) as mock_watermark:
+            response = client.get(reverse('dashboard:secure_viewer', args=[report.id]))
+            self.assertTrue(mock_watermark.call_args.kwargs['offload'])
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '10')
+
+class PdfStructureCacheTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pdf_path = self.build_pdf('reports/sample.pdf', pages=5)
+        pdf_structure_cache.clear()
+
+    def test_repeat_jobs_skip_parse_until_file_changes(self):
+        write_watermarked_pdf(self.pdf_path, 'Licensed to: reader', BytesIO())
+        with patch('dashboard.utils.build_stamp_plan') as mock_plan:
+            write_watermarked_pdf(self.pdf_path, 'Licensed to: other', BytesIO())
+            self.assertFalse(mock_plan.called)
+        self.assertEqual(pdf_structure_cache.stats()['hits'], 1)
+        build_sample_pdf(self.pdf_path, pages=7)
+        output = BytesIO()
+        write_watermarked_pdf(self.pdf_path, 'Licensed to: reader', output)
+        self.assertEqual(len(PyPDF2.PdfReader(output).pages), 7)
+
+    def test_memory_cap_and_invalidation(self):
+        plan = get_stamp_plan(self.pdf_path)
+        cache = PdfStructureCache(max_entries=10, max_bytes=PdfStructureCache().sizeof(plan) * 2)
+        for i in range(3):
+            cache.put((f'/reports/{i}.pdf', 1, 1), plan)
+        self.assertEqual(cache.stats()['entries'], 2)
+        self.assertEqual(cache.invalidate('/reports/2.pdf'), 1)
+        self.assertIsNone(cache.get(('/reports/2.pdf', 1, 1)))
+        self.assertEqual(cache.stats()['bytes'], cache.sizeof(plan))
+
+    def test_manage_report_update_invalidates(self):
+        admin = User.objects.create_superuser(username='admin', email='admin@test.com', password='testpass123')
+        report = Report.objects.create(title='Parsed Report', description='A parsed report', price=100.00, file='reports/sample.pdf')
+        get_stamp_plan(report.file.path)
+        self.assertEqual(pdf_structure_cache.stats()['entries'], 1)
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        response = client.patch(reverse('dashboard:manage_report_detail', args=[report.id]), {'title': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(pdf_structure_cache.stats()['entries'], 0)
+
+class ReportPageImageTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='reader', email='reader@test.com', password='testpass123')
+        self.build_pdf('reports/sample.pdf', pages=4)
+        self.report = Report.objects.create(title='Paged Report', description='A paged report', price=100.00, file='reports/sample.pdf')
+        PurchasedReport.objects.create(client=self.user, report=self.report)
+        self.client.force_authenticate(user=self.user)
+        page_image_cache.clear()
+
+    def page_url(self, page_number):
+        return reverse('dashboard:report_page_image', args=[self.report.id, page_number])
+
+    def test_renders_watermarked_page_once(self):
+        response = self.client.get(self.page_url(2), {'dpi': 72, 'image_format': 'png'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        image = Image.open(BytesIO(b''.join(response.streaming_content))).convert('L')
+        self.assertEqual(image.size, (612, 792))
+        # The watermark is light grey text across the middle of an otherwise blank page
+        self.assertLess(image.crop((206, 296, 406, 496)).getextrema()[0], 250)
+
+        with patch('dashboard.page_images.render_page_image') as mock_render:
+            cached = self.client.get(self.page_url(2), {'dpi': 72, 'image_format': 'png'})
+            self.assertFalse(mock_render.called)
+            not_modified = self.client.get(self.page_url(2), {'dpi': 72, 'image_format': 'png'}, HTTP_IF_NONE_MATCH=cached['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_200_OK)
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        webp = self.client.get(self.page_url(2), {'dpi': 1000})
+        self.assertEqual(webp['Content-Type'], 'image/webp')
+        width, height = Image.open(BytesIO(b''.join(webp.streaming_content))).size  # dpi clamped to 300
+        self.assertAlmostEqual(width, 2550, delta=1)
+        self.assertAlmostEqual(height, 3300, delta=1)
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.client.get(self.page_url(5)).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(self.page_url(1), {'image_format': 'gif'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.page_url(1), {'dpi': 'high'}).status_code, status.HTTP_400_BAD_REQUEST)
+        other = User.objects.create_user(username='other', email='other@test.com', password='testpass123')
+        self.client.force_authenticate(user=other)
+        self.assertEqual(self.client.get(self.page_url(1)).status_code, status.HTTP_403_FORBIDDEN)
+
+class ReportIngestionTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.pdf_path = self.build_pdf('reports/sample.pdf', pages=3)
+        self.build_pdf('reports/a4.pdf', pages=2, pagesize=(595.28, 841.89))
+
+    def test_create_and_file_replace_schedule_ingestion(self):
+        with patch('dashboard.ingestion.ingestion_pool.submit') as mock_submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                report = Report.objects.create(title='Ingested Report', description='An ingested report', price=100.00, file='reports/sample.pdf')
+            mock_submit.assert_called_once_with(report.id)
+            Report.objects.filter(id=report.id).update(ingestion_status='ready')
+            report.refresh_from_db()
+            with self.captureOnCommitCallbacks(execute=True):
+                report.title = 'Renamed'
+                report.save()
+            self.assertEqual(mock_submit.call_count, 1)
+            with self.captureOnCommitCallbacks(execute=True):
+                report.file = 'reports/a4.pdf'
+                report.save(update_fields=['file'])
+            self.assertEqual(mock_submit.call_count, 2)
+        report.refresh_from_db()
+        self.assertEqual(report.ingestion_status, 'pending')
+
+    def test_ingest_stores_metadata_read_without_touching_file(self):
+        with patch('dashboard.ingestion.ingestion_pool.submit'):
+            report = Report.objects.create(title='A4 Report', description='An A4 report', price=100.00, file='reports/a4.pdf')
+        self.assertTrue(ingest_report(report.id))
+        report.refresh_from_db()
+        a4_path = os.path.join(self.media_root, 'reports', 'a4.pdf')
+        with open(a4_path, 'rb') as f:
+            data = f.read()
+        self.assertEqual(report.ingestion_status, 'ready')
+        self.assertEqual(report.file_sha256, hashlib.sha256(data).hexdigest())
+        self.assertEqual(report.file_byte_size, len(data))
+        self.assertEqual(report.page_count, 2)
+        self.assertEqual(report.page_boxes, [[0.0, 0.0, 595.28, 841.89]] * 2)
+        self.assertEqual(report.pdf_version, data[5:8].decode())
+        os.remove(a4_path)
+        self.assertEqual(ReportDetailSerializer(report).data['file_size'], len(data))
+
+    def test_unreadable_file_marks_failed(self):
+        broken_path = os.path.join(self.media_root, 'reports', 'broken.pdf')
+        with open(broken_path, 'wb') as f:
+            f.write(b'not a pdf')
+        with patch('dashboard.ingestion.ingestion_pool.submit'):
+            broken = Report.objects.create(title='Broken Report', description='A broken report', price=100.00, file='reports/broken.pdf')
+            good = Report.objects.create(title='Good Report', description='A good report', price=100.00, file='reports/sample.pdf')
+        call_command('ingest_reports', stdout=StringIO())
+        broken.refresh_from_db()
+        good.refresh_from_db()
+        self.assertEqual(broken.ingestion_status, 'failed')
+        self.assertTrue(broken.ingestion_error)
+        self.assertEqual((good.ingestion_status, good.page_count), ('ready', 3))
+
+class PreviewThumbnailTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.build_pdf('reports/sample.pdf')
+        with patch('dashboard.ingestion.ingestion_pool.submit'):
+            self.report = Report.objects.create(title='Preview Report', description='A preview report', price=100.00, file='reports/sample.pdf')
+
+    def serialize(self, query=''):
+        request = Request(APIRequestFactory().get(f'/dashboard/reports/{query}'))
+        return ReportSerializer(self.report, context={'request': request}).data['preview_image_url']
+
+    def test_ingestion_writes_thumbnails_at_each_width(self):
+        self.assertEqual(generate_report_preview_url(self.report), '/static/images/default-report-preview.png')
+        ingest_report(self.report.id)
+        self.report.refresh_from_db()
+        self.assertEqual(sorted(self.report.preview_thumbnails), ['jpeg', 'webp'])
+        for image_format, sizes in self.report.preview_thumbnails.items():
+            self.assertEqual(sorted(sizes, key=int), ['160', '320', '640'])
+            for width, path in sizes.items():
+                with Image.open(os.path.join(self.media_root, path)) as image:
+                    self.assertEqual(image.format, 'WEBP' if image_format == 'webp' else 'JPEG')
+                    self.assertEqual(image.width, int(width))
+                    self.assertAlmostEqual(image.height, int(width) * 792 / 612, delta=1)
+        self.assertLess(os.path.getsize(os.path.join(self.media_root, self.report.preview_thumbnails['webp']['160'])), 10 * 1024)
+
+    def test_serializer_picks_smallest_fitting_size(self):
+        self.assertIsNone(self.serialize())
+        ingest_report(self.report.id)
+        self.report.refresh_from_db()
+        thumbnails = self.report.preview_thumbnails
+        self.assertTrue(self.serialize().endswith('/media/' + thumbnails['webp']['320']))
+        self.assertTrue(self.serialize('?preview_width=100').endswith(thumbnails['webp']['160']))
+        self.assertTrue(self.serialize('?preview_width=321').endswith(thumbnails['webp']['640']))
+        self.assertTrue(self.serialize('?preview_width=2000&preview_format=jpeg').endswith(thumbnails['jpeg']['640']))
+
+    def test_replaced_file_gets_new_thumbnails(self):
+        ingest_report(self.report.id)
+        self.report.refresh_from_db()
+        old_name = self.report.preview_thumbnails['webp']['320']
+        self.assertTrue(blob_digest(old_name))
+        self.build_pdf('reports/replacement.pdf', pages=1, pagesize=(595.28, 841.89))
+        with patch('dashboard.ingestion.ingestion_pool.submit'):
+            self.report.file = 'reports/replacement.pdf'
+            self.report.save()
+        ingest_report(self.report.id)
+        self.report.refresh_from_db()
+        new_name = self.report.preview_thumbnails['webp']['320']
+        self.assertNotEqual(new_name, old_name)
+        # The old previews lose their reference and go with the next collection past the grace period
+        self.assertEqual(StoredBlob.objects.get(digest=blob_digest(old_name)).refcount, 0)
+        self.assertEqual(StoredBlob.objects.get(digest=blob_digest(new_name)).refcount, 1)
+        StoredBlob.objects.update(last_saved_at=timezone.now() - timedelta(days=2))
+        call_command('gc_report_blobs', stdout=StringIO())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, old_name)))
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, new_name)))
+
+    def test_identical_previews_are_stored_once(self):
+        with patch('dashboard.ingestion.ingestion_pool.submit'):
+            other = Report.objects.create(title='Same File', description='Same bytes', price=100.00, file='reports/sample.pdf')
+        stale = Report.objects.get(id=self.report.id)
+        ingest_report(self.report.id)
+        ingest_report(other.id)
+        self.report.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(other.preview_thumbnails, self.report.preview_thumbnails)
+        names = [name for sizes in self.report.preview_thumbnails.values() for name in sizes.values()]
+        self.assertEqual(len(names), 6)
+        self.assertEqual(set(StoredBlob.objects.filter(digest__in=[blob_digest(name) for name in names])
+                             .values_list('refcount', flat=True)), {2})
+        # A full save of an instance loaded before ingestion keeps the thumbnails ingestion wrote
+        stale.title = 'Renamed'
+        stale.save()
+        self.assertEqual(Report.objects.get(id=self.report.id).preview_thumbnails, self.report.preview_thumbnails)
+        stale.delete()
+        self.assertEqual(set(StoredBlob.objects.filter(digest__in=[blob_digest(name) for name in names])
+                             .values_list('refcount', flat=True)), {1})
+        self.assertEqual(rebuild_blob_refcounts(), 0)
+
+@override_settings(REPORT_UPLOAD_CHUNK_SIZE=1024)
+class ChunkedReportUploadTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.admin_user = User.objects.create_superuser(username='uploader', email='uploader@test.com', password='testpass123')
+        self.client.force_authenticate(user=self.admin_user)
+        self.category = ReportCategory.objects.create(name='Uploads')
+        pdf_path = self.build_pdf('source.pdf', pages=6)
+        with open(pdf_path, 'rb') as f:
+            self.data = f.read()
+
+    def start(self, **fields):
+        payload = {'filename': 'market.pdf', 'total_size': len(self.data)}
+        payload.update(fields)
+        return self.client.post(reverse('dashboard:report_uploads'), payload, format='json')
+
+    def put_chunk(self, upload_id, start, data, total=None):
+        end = start + len(data) - 1
+        return self.client.put(
+            reverse('dashboard:report_upload_detail', args=[upload_id]), data, content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{total or len(self.data)}'
+        )
+
+    def upload_all(self, upload_id, start=0):
+        for offset in range(start, len(self.data), 1024):
+            response = self.put_chunk(upload_id, offset, self.data[offset:offset + 1024])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_interrupted_upload_resumes_and_creates_report(self):
+        self.assertGreater(len(self.data), 2 * 1024)
+        upload_id = self.start(sha256=hashlib.sha256(self.data).hexdigest()).data['upload_id']
+        self.assertEqual(self.put_chunk(upload_id, 0, self.data[:1024]).data['received_bytes'], 1024)
+
+        # A chunk that does not start at the acknowledged offset is refused with the resume point
+        response = self.put_chunk(upload_id, 2048, self.data[2048:3072])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['received_bytes'], 1024)
+        status_response = self.client.get(reverse('dashboard:report_upload_detail', args=[upload_id]))
+        self.assertEqual(status_response.data['received_bytes'], 1024)
+
+        # Later chunks may be served by another process without the running hash
+        _hashers.clear()
+        self.upload_all(upload_id, start=1024)
+        with patch('dashboard.ingestion.ingestion_pool.submit') as mock_submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('dashboard:report_upload_complete', args=[upload_id]), {
+                    'title': 'Uploaded Report', 'description': 'Sent in chunks', 'price': '150.00', 'category_id': self.category.id
+                }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        report = Report.objects.get(id=response.data['id'])
+        mock_submit.assert_called_once_with(report.id)
+        self.assertEqual(report.category, self.category)
+        self.assertEqual(report.original_file_name, 'market.pdf')
+        with open(report.file.path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'temp')), [])
+        self.assertEqual(self.client.get(reverse('dashboard:report_upload_detail', args=[upload_id])).data['status'], 'complete')
+
+    def test_chunk_racing_an_acknowledged_one_is_refused(self):
+        upload_id = self.start().data['upload_id']
+        stale = ReportUpload.objects.get(upload_id=upload_id)
+        self.put_chunk(upload_id, 0, self.data[:1024])
+        # The stale copy still says offset 0; the offset is checked again under
+        # the part file lock, before any byte of the racing chunk is written
+        racing = b'%PDF-' + b'x' * 1019
+        with self.assertRaises(UploadOffsetMismatch) as raised:
+            write_chunk(stale, BytesIO(racing), f'bytes 0-1023/{len(self.data)}', 1024)
+        self.assertEqual(raised.exception.expected, 1024)
+        with open(upload_part_path(stale), 'rb') as f:
+            self.assertEqual(f.read(), self.data[:1024])
+        self.upload_all(upload_id, start=1024)
+        self.assertEqual(ReportUpload.objects.get(upload_id=upload_id).received_bytes, len(self.data))
+        with patch('dashboard.ingestion.ingestion_pool.submit'):
+            response = self.client.post(reverse('dashboard:report_upload_complete', args=[upload_id]), {
+                'title': 'Raced Report', 'description': 'Sent twice', 'price': '150.00', 'category_id': self.category.id
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)  # The running hash still matches the file
+
+    def test_second_finish_is_refused(self):
+        upload_id = self.start().data['upload_id']
+        self.upload_all(upload_id)
+        stale = ReportUpload.objects.get(upload_id=upload_id)
+        fields = {'title': 'Finished Once', 'description': 'Sent in chunks', 'price': '150.00', 'category_id': self.category.id}
+        with patch('dashboard.ingestion.ingestion_pool.submit'):
+            response = self.client.post(reverse('dashboard:report_upload_complete', args=[upload_id]), fields, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # A finish that loaded the upload before the first one promoted the part file
+        serializer = ReportSerializer(data=fields)
+        serializer.is_valid(raise_exception=True)
+        with self.assertRaises(UploadRejected) as raised:
+            finish_upload(stale, serializer)
+        self.assertEqual(raised.exception.status_code, 409)
+        self.assertEqual(Report.objects.filter(title='Finished Once').count(), 1)
+
+    def test_uploads_are_validated_as_they_arrive(self):
+        self.assertEqual(self.start(filename='market.docx').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.start(total_size=51 * 1024 * 1024).status_code, 413)
+        upload_id = self.start().data['upload_id']
+        # Oversized chunks and non-PDF data are refused before anything is acknowledged
+        self.assertEqual(self.put_chunk(upload_id, 0, self.data[:2048]).status_code, 413)
+        self.assertEqual(self.put_chunk(upload_id, 0, b'MZ' + self.data[2:1024]).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.put_chunk(upload_id, 0, self.data[:1024], total=len(self.data) + 1).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('dashboard:report_upload_detail', args=[upload_id])).data['received_bytes'], 0)
+        response = self.client.post(reverse('dashboard:report_upload_complete', args=[upload_id]), {
+            'title': 'Early', 'description': 'Not yet uploaded', 'price': '10.00'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Report.objects.filter(title='Early').exists())
+
+    def test_upload_replaces_existing_report_file_after_checksum(self):
+        self.build_pdf('old.pdf', pages=1)
+        with patch('dashboard.ingestion.ingestion_pool.submit'):
+            report = Report.objects.create(title='Existing Report', description='Has a file', price=100.00, file='old.pdf')
+        Report.objects.filter(id=report.id).update(ingestion_status='ready')
+        upload_id = self.start(report_id=report.id, sha256='0' * 64).data['upload_id']
+        self.upload_all(upload_id)
+        complete_url = reverse('dashboard:report_upload_complete', args=[upload_id])
+        self.assertEqual(self.client.post(complete_url, {}, format='json').status_code, 422)
+
+        upload_id = self.start(report_id=report.id).data['upload_id']
+        self.upload_all(upload_id)
+        with patch('dashboard.ingestion.ingestion_pool.submit'):
+            response = self.client.post(reverse('dashboard:report_upload_complete', args=[upload_id]), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report.refresh_from_db()
+        self.assertEqual(report.ingestion_status, 'pending')
+        self.assertTrue(report.file.name.startswith('blobs/'))
+        self.assertEqual(report.original_file_name, 'market.pdf')
+        with open(report.file.path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+class ContentAddressedStorageTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        pdf_path = self.build_pdf('source.pdf', pages=2)
+        with open(pdf_path, 'rb') as f:
+            self.data = f.read()
+
+    def create_report(self, title, data=None):
+        report = Report(title=title, description='Stored by content', price=100.00)
+        with patch('dashboard.ingestion.ingestion_pool.submit'):
+            report.file.save(f'{title}.PDF', ContentFile(data or self.data), save=True)
+        return report
+
+    def test_identical_files_share_one_blob(self):
+        first = self.create_report('first')
+        second = self.create_report('second')
+        digest = hashlib.sha256(self.data).hexdigest()
+        self.assertEqual(first.file.name, f'blobs/{digest[:2]}/{digest[2:4]}/{digest}.pdf')
+        self.assertEqual(second.file.name, first.file.name)
+        blob = StoredBlob.objects.get(digest=digest)
+        self.assertEqual((blob.refcount, blob.size), (2, len(self.data)))
+        with open(first.file.path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        # The digest comes from the name, so the caches never re-read a blob
+        with patch('dashboard.cache.open', side_effect=AssertionError('blob was hashed'), create=True):
+            self.assertEqual(get_file_digest(first.file.path), digest)
+
+    def test_refcounts_follow_replacements_and_deletes(self):
+        first = self.create_report('first')
+        second = self.create_report('second')
+        old_digest = StoredBlob.objects.get().digest
+        second = Report.objects.get(id=second.id)
+        with patch('dashboard.ingestion.ingestion_pool.submit'):
+            second.file.save('revised.pdf', ContentFile(self.data + b'%revised'), save=True)
+        self.assertEqual(StoredBlob.objects.get(digest=old_digest).refcount, 1)
+        self.assertEqual(StoredBlob.objects.exclude(digest=old_digest).get().refcount, 1)
+        Report.objects.filter(id=first.id).delete()
+        second.delete()
+        self.assertEqual(list(StoredBlob.objects.values_list('refcount', flat=True)), [0, 0])
+        # Only refs in the report table count, and rebuilding agrees with the incremental counts
+        self.assertEqual(rebuild_blob_refcounts(), 0)
+
+    def test_clients_see_the_uploaded_file_name(self):
+        report = self.create_report('first')
+        self.assertTrue(report.file.name.startswith('blobs/'))
+        self.assertEqual(Report.objects.get(id=report.id).original_file_name, 'first.PDF')
+        report.file = SimpleUploadedFile('Q3 Outlook.pdf', self.data + b'%q3')
+        with patch('dashboard.ingestion.ingestion_pool.submit'):
+            report.save(update_fields=['file'])
+        self.assertEqual(Report.objects.get(id=report.id).original_file_name, 'Q3 Outlook.pdf')
+
+        client = APIClient()
+        user = User.objects.create_user(username='reader', email='reader@test.com', password='testpass123')
+        PurchasedReport.objects.create(client=user, report=report)
+        client.force_authenticate(user=user)
+        response = client.get(reverse('dashboard:report_detail', args=[report.id]))
+        self.assertEqual(response.data['file_name'], 'Q3 Outlook.pdf')
+        response = client.get(reverse('dashboard:secure_viewer', args=[report.id]))
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="Q3 Outlook.pdf"')
+
+        # Files stored before content addressing get their name back at ingestion
+        Report.objects.filter(id=report.id).update(file='reports/legacy.pdf', original_file_name='')
+        os.makedirs(os.path.join(self.media_root, 'reports'))
+        with open(os.path.join(self.media_root, 'reports', 'legacy.pdf'), 'wb') as f:
+            f.write(self.data)
+        ingest_report(report.id)
+        self.assertEqual(Report.objects.get(id=report.id).original_file_name, 'legacy.pdf')
+
+    def test_gc_removes_unreferenced_blobs_after_grace_period(self):
+        kept = self.create_report('kept')
+        dropped = self.create_report('dropped', self.data + b'%dropped')
+        dropped_path = dropped.file.path
+        dropped.delete()
+        orphan_path = os.path.join(self.media_root, 'blobs', 'ab', 'cd', 'abcd' + '0' * 60 + '.pdf')
+        os.makedirs(os.path.dirname(orphan_path))
+        with open(orphan_path, 'wb') as f:
+            f.write(b'%PDF-orphan')
+
+        call_command('gc_report_blobs', '--scan-orphans', stdout=StringIO())
+        self.assertTrue(os.path.exists(dropped_path))  # Still inside the grace period
+
+        old = timezone.now() - timedelta(days=2)
+        StoredBlob.objects.update(last_saved_at=old)
+        os.utime(orphan_path, (old.timestamp(), old.timestamp()))
+        out = StringIO()
+        call_command('gc_report_blobs', '--scan-orphans', stdout=out)
+        self.assertIn('Removed 2 blobs', out.getvalue())
+        self.assertFalse(os.path.exists(dropped_path))
+        self.assertFalse(os.path.exists(orphan_path))
+        self.assertTrue(os.path.exists(kept.file.path))
+        self.assertEqual(StoredBlob.objects.get().refcount, 1)
+
+def build_text_pdf(path, page_texts):
+    c = canvas.Canvas(path)
+    for text in page_texts:
+        c.drawString(72, 720, text)
+        c.showPage()
+    c.save()
+    return path
+
+class ReportContentSearchTests(MediaRootTestCase):
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, 'reports'))
+        self.client = APIClient()
+        self.tea = self.create_report('Agriculture Outlook', ['Maize harvest figures', 'Tea exports rose in Kericho', 'Tea exports by county'])
+        self.coffee = self.create_report('Beverages Review', ['Coffee auctions', 'Tea exports were flat'])
+        self.hidden = self.create_report('Archived Study', ['Tea exports archive'], is_active=False)
+
+    def create_report(self, title, page_texts, **fields):
+        name = f'reports/{title.lower().replace(" ", "-")}.pdf'
+        build_text_pdf(os.path.join(self.media_root, name), page_texts)
+        with patch('dashboard.ingestion.ingestion_pool.submit'):
+            report = Report.objects.create(title=title, description='Market data', price=100.00, file=name, **fields)
+        ingest_report(report.id)
+        return report
+
+    def search(self, query):
+        response = self.client.get(reverse('dashboard:public_reports'), {'q': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results']
+
+    def test_q_returns_ranked_reports_with_page_snippets(self):
+        results = self.search('tea export')
+        self.assertEqual([result['id'] for result in results], [self.tea.id, self.coffee.id])
+        self.assertEqual(sorted(hit['page'] for hit in results[0]['search_hits']), [2, 3])
+        self.assertIn('<mark>Tea</mark> <mark>exports</mark>', results[0]['search_hits'][0]['snippet'])
+        self.assertEqual(results[1]['search_hits'][0]['page'], 2)
+        # The last term matches as a prefix and the index is used on the authenticated list too
+        self.assertEqual([result['id'] for result in self.search('kerich')], [self.tea.id])
+        user = User.objects.create_user(username='searcher', email='searcher@test.com', password='testpass123')
+        self.client.force_authenticate(user=user)
+        response = self.client.get(reverse('dashboard:report_list'), {'q': 'coffee'})
+        self.assertEqual([result['id'] for result in response.data['data']], [self.coffee.id])
+
+    def test_query_syntax_and_markup_are_treated_as_text(self):
+        report = self.create_report('Markup Report', ['Tariffs <script>alert(1)</script> NEAR border'])
+        hits = self.search('script NEAR(')[0]['search_hits']
+        self.assertEqual(self.search('script NEAR(')[0]['id'], report.id)
+        self.assertNotIn('<script>', hits[0]['snippet'])
+        self.assertIn('&lt;<mark>script</mark>&gt;', hits[0]['snippet'])
+        self.assertEqual(self.search('"*'), [])
+        self.assertEqual(self.search('nonexistentterm'), [])
+
+    def test_index_follows_file_replacement_and_delete(self):
+        build_text_pdf(os.path.join(self.media_root, 'reports', 'revised.pdf'), ['Horticulture only'])
+        with patch('dashboard.ingestion.ingestion_pool.submit'):
+            self.coffee.file = 'reports/revised.pdf'
+            self.coffee.save()
+        ingest_report(self.coffee.id)
+        self.assertEqual([result['id'] for result in self.search('tea')], [self.tea.id])
+        self.assertEqual([result['id'] for result in self.search('horticulture')], [self.coffee.id])
+        self.tea.delete()
+        self.assertEqual(self.search('tea'), [])
+
+class CatalogSearchTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agriculture = ReportCategory.objects.create(name='Agriculture')
+        self.finance = ReportCategory.objects.create(name='Finance')
+        self.outlook = Report.objects.create(title='Agriculture Market Outlook', description='Crop yields by county',
+                                             category=self.finance, price=100.00, file='reports/a.pdf')
+        self.tea = Report.objects.create(title='Tea Exports Review', description='Agriculture exports and auctions',
+                                         category=self.finance, price=100.00, file='reports/b.pdf')
+        self.maize = Report.objects.create(title='Maize Prices', description='Monthly retail prices',
+                                           category=self.agriculture, price=100.00, file='reports/c.pdf')
+        self.hidden = Report.objects.create(title='Agriculture Archive', description='Old data',
+                                            price=100.00, file='reports/d.pdf', is_active=False)
+
+    def search(self, text, **params):
+        response = self.client.get(reverse('dashboard:public_reports'), {'search': text, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [result['id'] for result in response.data['results']]
+
+    def test_title_matches_rank_first_and_last_term_is_a_prefix(self):
+        # Title beats category name beats description; inactive reports stay hidden
+        self.assertEqual(self.search('agriculture'), [self.outlook.id, self.maize.id, self.tea.id])
+        self.assertEqual(self.search('agri'), [self.outlook.id, self.maize.id, self.tea.id])
+        self.assertEqual(self.search('exports auct'), [self.tea.id])
+        self.assertEqual(self.search('agriculture', category=self.agriculture.slug), [self.maize.id])
+        self.assertEqual(self.search('"* OR NEAR('), [])
+        user = User.objects.create_user(username='catalog', email='catalog@test.com', password='testpass123')
+        self.client.force_authenticate(user=user)
+        response = self.client.get(reverse('dashboard:report_list'), {'search': 'maize'})
+        self.assertEqual([result['id'] for result in response.data['data']], [self.maize.id])
+
+    def test_misspelt_terms_are_corrected(self):
+        self.assertEqual(edit_distance('agricultre', 'agricultur', 2), 2)
+        self.assertEqual(edit_distance('teh', 'the', 1), 1)
+        self.assertEqual(edit_distance('maize', 'market', 1), 2)
+        self.assertEqual(self.search('agricultre outlook'), [self.outlook.id])
+        self.assertEqual(self.search('maiz prices'), [self.maize.id])
+        self.assertEqual(self.search('teq exports'), [])  # Terms under four letters are not corrected
+
+    def test_index_follows_writes_and_benchmark_rolls_back(self):
+        Report.objects.filter(id=self.maize.id).update(title='Sorghum Prices')
+        self.assertEqual(self.search('sorghum'), [self.maize.id])
+        self.assertEqual(self.search('maize'), [])
+        self.finance.name = 'Banking'
+        self.finance.save()
+        self.assertEqual(self.search('banking'), [self.tea.id, self.outlook.id])  # Equal rank, newest first
+        self.tea.delete()
+        self.assertEqual(self.search('banking'), [self.outlook.id])
+
+        out = StringIO()
+        call_command('benchmark_catalog_search', reports=300, queries=6, stdout=out)
+        self.assertIn('catalog index', out.getvalue())
+        self.assertEqual(Report.objects.count(), 3)
+        self.assertEqual(self.search('banking'), [self.outlook.id])
+
+    def test_ingest_reports_warns_when_a_rebuild_dropped_the_triggers(self):
+        err = StringIO()
+        with patch('dashboard.management.commands.ingest_reports.ingest_report', return_value=True):
+            call_command('ingest_reports', stdout=StringIO(), stderr=err)
+            self.assertEqual(err.getvalue(), '')
+            with connection.cursor() as cursor:
+                cursor.execute('DROP TRIGGER website_report_catalog_au')  # What a table rebuild does
+            call_command('ingest_reports', stdout=StringIO(), stderr=err)
+        self.assertIn('website_report_catalog_au', err.getvalue())
+
+    def test_migrate_restores_triggers_a_rebuild_dropped(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER website_report_catalog_au')
+        Report.objects.filter(id=self.maize.id).update(title='Sorghum Prices')
+        self.assertEqual(missing_catalog_triggers(), ['website_report_catalog_au'])
+        self.assertEqual(self.search('sorghum'), [])
+        with self.assertLogs('dashboard', 'WARNING'):
+            emit_post_migrate_signal(0, False, 'default')
+        self.assertEqual(missing_catalog_triggers(), [])
+        self.assertEqual(self.search('sorghum'), [self.maize.id])
+        Report.objects.filter(id=self.maize.id).update(title='Millet Prices')
+        self.assertEqual(self.search('millet'), [self.maize.id])
+
+    def test_index_beats_the_scan_on_a_large_catalog(self):
+        out = StringIO()
+        call_command('benchmark_catalog_search', reports=30000, queries=20, min_speedup=1.0, stdout=out)
+        self.assertIn('Median speedup', out.getvalue())
+
+class ReportAutocompleteTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.index = typeahead_index
+        self.category = ReportCategory.objects.create(name='Market Research')
+        self.outlook = Report.objects.create(title='Market Outlook 2025', description='d', price=10, file='reports/a.pdf')
+        self.tea = Report.objects.create(title='Kenya Tea Market', description='d', price=10, file='reports/b.pdf')
+        self.cote = Report.objects.create(title="Côte d'Ivoire Cocoa", description='d', price=10, file='reports/c.pdf')
+        Report.objects.create(title='Market Archive', description='d', price=10, file='reports/d.pdf', is_active=False)
+        self.index.build()
+
+    def suggest(self, text, **params):
+        response = self.client.get(reverse('dashboard:report_autocomplete'), {'q': text, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(result['type'], result['label']) for result in response.data['results']]
+
+    def test_prefix_of_any_word_with_leading_matches_first(self):
+        self.assertEqual(self.suggest('mar'), [
+            ('report', 'Market Outlook 2025'), ('category', 'Market Research'), ('report', 'Kenya Tea Market'),
+        ])
+        self.assertEqual(self.suggest('tea m'), [('report', 'Kenya Tea Market')])
+        self.assertEqual(self.suggest('cote d iv'), [('report', "Côte d'Ivoire Cocoa")])
+        self.assertEqual(self.suggest('mar', limit=1), [('report', 'Market Outlook 2025')])
+        self.assertEqual(self.suggest(''), [])
+        self.assertEqual(self.suggest('zzz'), [])
+
+    def test_saves_update_the_index_incrementally(self):
+        rebuilds = self.index.rebuilds
+        with patch('dashboard.ingestion.ingestion_pool.submit'), self.captureOnCommitCallbacks(execute=True):
+            Report.objects.create(title='Maize Market Prices', description='d', price=10, file='reports/e.pdf')
+            self.tea.is_active = False
+            self.tea.save()
+            self.category.name = 'Consumer Research'
+            self.category.save()
+            self.outlook.delete()
+        self.assertEqual(self.suggest('mar'), [('report', 'Maize Market Prices')])
+        self.assertEqual(self.suggest('research'), [('category', 'Consumer Research')])
+        self.assertEqual(self.index.rebuilds, rebuilds)
+
+    def scanned_per_lookup(self, texts, limit=10):
+        scanned = []
+        for text in texts:
+            before = self.index.entries_scanned
+            self.index.lookup(text, limit)
+            scanned.append(self.index.entries_scanned - before)
+        return scanned
+
+    def add_reports(self, start, count):
+        Report.objects.bulk_create([
+            Report(title=f'Sector {i % 97} market report number {i}', slug=f'sector-report-{i}', description='d',
+                   price=10, file='reports/x.pdf')
+            for i in range(start, start + count)
+        ])
+        self.index.build()
+
+    def test_lookup_walks_at_most_limit_keys_whatever_the_catalog_size(self):
+        # Timings live in manage.py benchmark_typeahead; here the work per lookup is counted
+        texts = ('sec', 'market r', 'number 12', 'rep', 'zzz')
+        self.add_reports(0, 500)
+        self.assertEqual(len(self.index.lookup('sector 4', 10)), 10)
+        small = self.scanned_per_lookup(texts)
+        self.add_reports(500, 4500)
+        self.assertEqual(self.scanned_per_lookup(texts), small)
+        for scanned in small:
+            # One key past the last match in each of the two arrays
+            self.assertLessEqual(scanned, 2 * (10 + 1))
+        self.assertEqual(self.index.stats()['entries_scanned'], self.index.entries_scanned)
+
+class DenormalizedCounterTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.energy = ReportCategory.objects.create(name='Energy')
+        self.retail = ReportCategory.objects.create(name='Retail')
+        self.report = Report.objects.create(title='Solar Outlook', description='d', category=self.energy, price=10, file='reports/a.pdf')
+        self.buyers = [User.objects.create_user(username=f'buyer{i}', password='testpass123') for i in range(3)]
+
+    def counts(self):
+        self.report.refresh_from_db()
+        self.energy.refresh_from_db()
+        self.retail.refresh_from_db()
+        return self.report.purchase_count, self.energy.active_report_count, self.retail.active_report_count
+
+    def test_counters_follow_purchases_and_report_changes(self):
+        stale_report, stale_category = Report.objects.get(id=self.report.id), ReportCategory.objects.get(id=self.energy.id)
+        for buyer in self.buyers:
+            PurchasedReport.objects.create(client=buyer, report=self.report)
+        PurchasedReport.objects.get_or_create(client=self.buyers[0], report=self.report)
+        # Saving copies loaded before the purchases leaves the counters alone
+        stale_report.title = 'Solar Outlook 2026'
+        stale_report.save()
+        stale_category.name = 'Power'
+        stale_category.save()
+        self.assertEqual(self.counts(), (3, 1, 0))
+        self.assertEqual(self.report.title, 'Solar Outlook 2026')
+        PurchasedReport.objects.filter(client=self.buyers[2]).first().delete()
+        self.report = Report.objects.get(id=self.report.id)
+        self.report.category = self.retail
+        self.report.save()
+        self.assertEqual(self.counts(), (2, 0, 1))
+        self.report.is_active = False
+        self.report.save()
+        self.assertEqual(self.counts(), (2, 0, 0))
+        # A deferred load still sees the stored state before saving
+        report = Report.objects.only('id', 'title').get(id=self.report.id)
+        report.is_active = True
+        report.save()
+        self.assertEqual(self.counts(), (2, 0, 1))
+        Report.objects.get(id=self.report.id).delete()
+        self.retail.refresh_from_db()
+        self.assertEqual(self.retail.active_report_count, 0)
+
+    def test_rebuild_command_repairs_bulk_updates(self):
+        PurchasedReport.objects.create(client=self.buyers[0], report=self.report)
+        Report.objects.filter(id=self.report.id).update(is_active=False, purchase_count=7)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_counters', '--verify', stdout=StringIO())
+        out = StringIO()
+        call_command('rebuild_counters', stdout=out)
+        self.assertIn('Corrected 1 report and 1 category counters', out.getvalue())
+        self.assertEqual(self.counts(), (1, 0, 0))
+        call_command('rebuild_counters', '--verify', stdout=StringIO())
+
+    def test_catalog_pages_serialize_without_per_row_queries(self):
+        uncached = override_settings(CATALOG_RESPONSE_CACHE_TTL=0)  # Count the catalog's own queries
+        uncached.enable()
+        self.addCleanup(uncached.disable)
+        for i in range(15):
+            report = Report.objects.create(title=f'Report {i}', description='d', category=(self.energy, self.retail)[i % 2],
+                                           price=10, file='reports/a.pdf')
+            PurchasedReport.objects.create(client=self.buyers[i % 3], report=report)
+        with self.assertNumQueries(2):  # Count and page
+            response = self.client.get(reverse('dashboard:public_reports'))
+        self.assertEqual(len(response.data['results']), 12)
+        self.assertEqual({result['purchase_count'] for result in response.data['results']}, {1})
+        self.assertEqual(response.data['results'][0]['category']['report_count'], 9)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('dashboard:public_categories'))
+        self.assertEqual(sorted(category['report_count'] for category in response.data['results']), [7, 9])
+
+class CatalogResponseCacheTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = ReportCategory.objects.create(name='Energy')
+        self.report = Report.objects.create(title='Solar Outlook', description='d', category=self.category, price=10, file='reports/a.pdf')
+        self.url = reverse('dashboard:public_reports')
+
+    def test_repeat_requests_are_served_from_the_cache(self):
+        first = self.client.get(self.url, {'page_size': 5, 'category': 'energy'})
+        self.assertEqual(first['X-Catalog-Cache'], 'miss')
+        with self.assertNumQueries(2):  # Catalog version and entry, none for the catalog itself
+            second = self.client.get(self.url + '?category=energy&search=&page_size=5')
+        self.assertEqual(second['X-Catalog-Cache'], 'hit')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(self.client.get(self.url, {'page_size': 6})['X-Catalog-Cache'], 'miss')
+
+    def test_catalog_changes_invalidate_cached_pages(self):
+        self.client.get(self.url)
+        self.client.get(reverse('dashboard:public_categories'))
+        self.report.title = 'Solar Outlook 2026'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.report.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Catalog-Cache'], 'miss')
+        self.assertEqual(response.data['results'][0]['title'], 'Solar Outlook 2026')
+        ReportCategory.objects.create(name='Retail')
+        response = self.client.get(reverse('dashboard:public_categories'))
+        self.assertEqual(response['X-Catalog-Cache'], 'miss')
+        self.assertEqual(len(response.data['results']), 2)
+        buyer = User.objects.create_user(username='solarbuyer', password='testpass123')
+        with patch('dashboard.prewarm.warm_pool.submit'), self.captureOnCommitCallbacks(execute=True):
+            PurchasedReport.objects.create(client=buyer, report=self.report)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Catalog-Cache'], 'miss')
+        self.assertEqual(response.data['results'][0]['purchase_count'], 1)
+
+    def test_stale_page_is_served_while_another_request_rebuilds_it(self):
+        self.client.get(self.url)
+        bump_catalog_version()
+        request = self.client.get(self.url).wsgi_request
+        key = catalog_response_cache.make_key(request)
+        bump_catalog_version()
+        cache.add(f'{key}:lock', 1, 30)
+        with patch('dashboard.views.PublicReportsView.get_queryset') as get_queryset:
+            response = self.client.get(self.url)
+        get_queryset.assert_not_called()
+        self.assertEqual(response['X-Catalog-Cache'], 'stale')
+        self.assertEqual(response.data['results'][0]['title'], 'Solar Outlook')
+        cache.delete(f'{key}:lock')
+        self.assertEqual(self.client.get(self.url)['X-Catalog-Cache'], 'miss')
+
+class QueryBudgetTests(MediaRootTestCase):
+    """Every route, against a catalog seeded at production-like size, stays within its view's query_budget."""
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.admin_user = User.objects.create_superuser(username='budgetadmin', email='budgetadmin@test.com', password='testpass123')
+        self.buyer = User.objects.create_user(username='budgetbuyer', email='budgetbuyer@test.com', password='testpass123')
+
+        password = make_password('testpass123')
+        User.objects.bulk_create([User(username=f'client{i}', email=f'client{i}@test.com', password=password) for i in range(110)])
+        clients = list(User.objects.filter(username__startswith='client'))
+        UserProfile.objects.bulk_create([UserProfile(user=user, profile_type='Client') for user in clients])
+        categories = ReportCategory.objects.bulk_create([ReportCategory(name=f'Sector {i}', slug=f'sector-{i}') for i in range(12)])
+        self.build_pdf('catalog.pdf', pages=2)
+        Report.objects.bulk_create([
+            Report(title=f'Market Outlook {i}', slug=f'market-outlook-{i}', description=f'County survey {i}',
+                   category=categories[i % 12], price=100 + i, file='catalog.pdf', is_active=i % 10 != 0)
+            for i in range(240)
+        ])
+        reports = list(Report.objects.filter(is_active=True).order_by('id'))
+        # More rows than the largest page (100) of every list endpoint
+        for i, user in enumerate(clients + [self.buyer] * 5):
+            order = Order.objects.create(client=user, order_number=generate_order_number(), total_price=0, status='paid')
+            bought = reports[i % 100:i % 100 + 3]
+            OrderItem.objects.bulk_create([OrderItem(order=order, report=report, price=report.price) for report in bought])
+            Transaction.objects.create(order=order, transaction_id=f'TX-{i}', amount=300, payment_method='mpesa',
+                                       confirmed=True, paid_at=timezone.now())
+            PurchasedReport.objects.bulk_create([PurchasedReport(client=user, report=report) for report in bought],
+                                                ignore_conflicts=True)
+        PurchasedReport.objects.bulk_create([PurchasedReport(client=self.buyer, report=report) for report in reports[:110]],
+                                            ignore_conflicts=True)
+        rebuild_counters()
+        self.owned = PurchasedReport.objects.filter(client=self.buyer).first().report
+        # Orders at the largest allowed size, so item loops are measured at their worst
+        self.pending = Order.objects.create(client=self.buyer, order_number=generate_order_number(), total_price=1000)
+        OrderItem.objects.bulk_create([OrderItem(order=self.pending, report=report, price=100) for report in reports[-20:-10]])
+        Transaction.objects.create(order=self.pending, transaction_id='TX-PENDING', amount=1000, payment_method='mpesa')
+        self.unpaid = Order.objects.create(client=self.buyer, order_number=generate_order_number(), total_price=1000)
+        OrderItem.objects.bulk_create([OrderItem(order=self.unpaid, report=report, price=100) for report in reports[-30:-20]])
+        self.to_order = [report.id for report in reports[-10:]]
+        self.unowned = reports[-31]
+
+    def upload(self, complete=False):
+        with open(os.path.join(self.media_root, 'catalog.pdf'), 'rb') as f:
+            data = f.read()
+        upload = start_upload(self.admin_user, 'new.pdf', len(data))
+        if complete:
+            write_chunk(upload, BytesIO(data), f'bytes 0-{len(data) - 1}/{len(data)}', len(data))
+        return upload, data
+
+    def route_requests(self):
+        """(url name, url args, method, user, data, extra) for every route; data of None sends no body."""
+        partial, data = self.upload()
+        complete, _ = self.upload(complete=True)
+        cancelled, _ = self.upload()
+        cache.set('verify_token_budget', User.objects.create_user(
+            username='unverified', email='unverified@test.com', password='x', is_active=False).id)
+        cache.set('login_token_budget', self.buyer.id)
+        cache.set('reset_token_budget', self.buyer.id)
+        client_id = User.objects.get(username='client7').id
+        admin, buyer = self.admin_user, self.buyer
+        callback = {'Body': {'stkCallback': {'CheckoutRequestID': 'TX-PENDING', 'ResultCode': 0, 'ResultDesc': 'ok'}}}
+        return [
+            ('dashboard:client_dashboard', [], 'GET', buyer, None, {}),
+            ('dashboard:admin_dashboard', [], 'GET', buyer, None, {}),
+            ('dashboard:report_list', [], 'GET', buyer, {'search': 'outlook'}, {}),
+            ('dashboard:report_list', [], 'GET', buyer, {'page_size': 100}, {}),
+            ('dashboard:report_detail', [self.owned.id], 'GET', buyer, None, {}),
+            ('dashboard:create_order', [], 'POST', buyer, {'report_ids': self.to_order}, {}),
+            ('dashboard:process_payment', [self.unpaid.id], 'POST', buyer, {'payment_method': 'stripe'}, {}),
+            ('dashboard:my_purchases', [], 'GET', buyer, {'page_size': 100}, {}),
+            ('dashboard:secure_viewer', [self.owned.id], 'GET', buyer, None, {}),
+            ('dashboard:report_page_image', [self.owned.id, 1], 'GET', buyer, {'image_format': 'png'}, {}),
+            ('dashboard:mpesa_callback', [], 'POST', None, callback, {}),
+            ('dashboard:paystack_callback', [], 'POST', buyer, {'reference': 'TX-3'}, {}),
+            ('dashboard:manage_reports', [], 'GET', admin, {'page_size': 100}, {}),
+            ('dashboard:manage_reports', [], 'POST', admin,
+             {'title': 'New Outlook', 'description': 'd', 'price': '10.00', 'category_id': self.owned.category_id,
+              'file': ContentFile(data, name='new.pdf')}, {'format': 'multipart'}),
+            ('dashboard:manage_report_detail', [self.unowned.id], 'GET', admin, None, {}),
+            ('dashboard:manage_report_detail', [self.unowned.id], 'PATCH', admin, {'price': '20.00'}, {}),
+            ('dashboard:manage_report_detail', [self.unowned.id], 'DELETE', admin, None, {}),
+            ('dashboard:report_uploads', [], 'POST', admin, {'filename': 'more.pdf', 'total_size': len(data)}, {}),
+            ('dashboard:report_upload_detail', [partial.upload_id], 'GET', admin, None, {}),
+            ('dashboard:report_upload_detail', [partial.upload_id], 'PUT', admin, data,
+             {'content_type': 'application/octet-stream', 'HTTP_CONTENT_RANGE': f'bytes 0-{len(data) - 1}/{len(data)}'}),
+            ('dashboard:report_upload_detail', [cancelled.upload_id], 'DELETE', admin, None, {}),
+            ('dashboard:report_upload_complete', [complete.upload_id], 'POST', admin,
+             {'title': 'Uploaded Outlook', 'description': 'd', 'price': '10.00'}, {}),
+            ('dashboard:manage_orders', [], 'GET', admin, {'page_size': 100}, {}),
+            ('dashboard:manage_orders', [], 'GET', admin, {'pagination': 'cursor', 'count': 'true', 'page_size': 100}, {}),
+            ('dashboard:manage_categories', [], 'GET', admin, None, {}),
+            ('dashboard:manage_categories', [], 'POST', admin, {'name': 'Sector New'}, {}),
+            ('dashboard:manage_clients', [], 'GET', admin, {'page_size': 100}, {}),
+            ('dashboard:manage_clients', [], 'GET', admin, {'pagination': 'cursor', 'count': 'true', 'page_size': 100}, {}),
+            ('dashboard:revenue_analytics', [], 'GET', admin, None, {}),
+            ('dashboard:watermark_stats', [], 'GET', admin, None, {}),
+            ('dashboard:public_reports', [], 'GET', None, {'page_size': 100}, {}),
+            ('dashboard:public_reports', [], 'GET', None, {'search': 'county survey'}, {}),
+            ('dashboard:report_autocomplete', [], 'GET', None, {'q': 'mark'}, {}),
+            ('dashboard:public_categories', [], 'GET', None, None, {}),
+            ('website:register', [], 'POST', None, {'username': 'newbie', 'email': 'newbie@test.com', 'password': 'Passw0rd!x'}, {}),
+            ('website:email_verification', [], 'POST', None, {'token': 'budget', 'email': 'unverified@test.com'}, {}),
+            ('website:login', [], 'POST', None, {'username': 'budgetbuyer@test.com', 'password': 'testpass123'}, {}),
+            ('website:token_refresh', [], 'POST', None, {'refresh': str(RefreshToken.for_user(buyer))}, {}),
+            ('website:profile', [], 'GET', buyer, None, {}),
+            ('website:profile', [], 'PATCH', buyer, {'phone': '254700000009'}, {}),
+            ('website:logout', [], 'POST', buyer, {'refresh': str(RefreshToken.for_user(buyer))}, {}),
+            ('website:google_login', [], 'POST', None, {}, {}),
+            ('website:email_login', [], 'POST', None, {'email': 'budgetbuyer@test.com'}, {}),
+            ('website:email_login_verify', [], 'POST', None, {'token': 'budget', 'email': 'budgetbuyer@test.com'}, {}),
+            ('website:forgot_password', [], 'POST', None, {'email': 'budgetbuyer@test.com'}, {}),
+            ('website:reset_password', [], 'POST', None,
+             {'token': 'budget', 'email': 'budgetbuyer@test.com', 'new_password': 'NewPassw0rd!'}, {}),
+            ('website:manage_user_profile', [client_id], 'PATCH', admin, {'phone': '254700000010'}, {}),
+        ]
+
+    def test_every_route_stays_within_its_budget(self):
+        paystack = {'status': True, 'data': {'status': 'success'}}
+        with patch('dashboard.views.requests.get') as mock_get, patch('dashboard.views.stripe.PaymentIntent.create') as mock_intent, \
+                patch('dashboard.ingestion.ingestion_pool.submit'):
+            mock_get.return_value.json.return_value = paystack
+            mock_intent.return_value.id = 'pi_budget'
+            for name, args, method, user, data, extra in self.route_requests():
+                url = reverse(name, args=args)
+                with self.subTest(route=name, method=method):
+                    # Real JWT authentication, so the user and profile lookups of each request are counted
+                    self.client.credentials(**({'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'} if user else {}))
+                    extra = dict(extra)
+                    if 'content_type' not in extra and method != 'GET':
+                        extra.setdefault('format', 'json')
+                    response = getattr(self.client, method.lower())(url, data, **extra)
+                    self.assertLess(response.status_code, 500, getattr(response, 'data', None))
+                    budget = get_query_budget(resolve(url).func.view_class, method)
+                    self.assertIsNotNone(budget)
+                    self.assertLessEqual(response.wsgi_request.query_count, budget)
+
+    def test_routes_and_budgets_are_all_covered(self):
+        covered = {name for name, *_ in self.route_requests()}
+        for module in (dashboard_urls, website_urls):
+            for pattern in module.urlpatterns:
+                name = f'{module.app_name}:{pattern.name}'
+                self.assertIn(name, covered)
+                view_class = pattern.callback.view_class
+                if view_class.__module__.split('.')[0] in ('dashboard', 'website'):
+                    self.assertTrue(hasattr(view_class, 'query_budget'), f'{view_class.__name__} declares no query_budget')
+
+    def test_over_budget_requests_raise_in_tests_and_warn_otherwise(self):
+        url = reverse('dashboard:public_categories')
+        with patch.object(PublicCategoriesView, 'query_budget', 1), override_settings(CATALOG_RESPONSE_CACHE_TTL=0):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'ran 2 queries, budget is 1'):
+                self.client.get(url)
+            with override_settings(QUERY_BUDGET_RAISE=False), self.assertLogs('dashboard', 'WARNING') as logs:
+                self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertIn('PublicCategoriesView', logs.output[0])
+
+    def test_savepoints_and_database_cache_reads_are_not_counted(self):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            with transaction.atomic():
+                cache.set('budget:probe', 1)
+                cache.get('budget:probe')
+            Report.objects.count()
+        self.assertEqual(counter.count, 1)
+
+class KeysetPaginationTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(username='pager', email='pager@test.com', password='testpass123')
+        self.client.force_authenticate(user=self.admin)
+        buyers = [User.objects.create_user(username=f'pagebuyer{i}', password='testpass123') for i in range(3)]
+        for i in range(40):
+            Order.objects.create(client=buyers[i % 3], order_number=generate_order_number(), total_price=i)
+        # Runs of equal timestamps, so pages break inside ties
+        moments = [timezone.now() - timezone.timedelta(hours=i // 6) for i in range(40)]
+        for order, moment in zip(Order.objects.order_by('id'), moments):
+            Order.objects.filter(id=order.id).update(created_at=moment)
+        self.expected = list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.url = reverse('dashboard:manage_orders')
+
+    def walk(self, url, params):
+        pages, response = [], self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data)
+            if not response.data['next']:
+                return pages
+            response = self.client.get(response.data['next'])
+
+    def test_cursor_pages_cover_every_row_once(self):
+        pages = self.walk(self.url, {'pagination': 'cursor', 'page_size': 7})
+        self.assertEqual([order['id'] for page in pages for order in page['results']], self.expected)
+        self.assertEqual([len(page['results']) for page in pages], [7, 7, 7, 7, 7, 5])
+        self.assertIsNone(pages[0]['previous'])
+        self.assertNotIn('count', pages[0])
+        previous = self.client.get(pages[3]['previous']).data
+        self.assertEqual(previous['results'], pages[2]['results'])
+        self.assertEqual(self.client.get(previous['previous']).data['results'], pages[1]['results'])
+        counted = self.client.get(self.url, {'pagination': 'cursor', 'count': 'true'}).data
+        self.assertEqual(counted['count'], 40)
+        # Page-number pagination stays the default
+        self.assertEqual(self.client.get(self.url).data['count'], 40)
+
+    def test_deep_pages_cost_the_same_as_the_first(self):
+        pages = self.walk(self.url, {'pagination': 'cursor', 'page_size': 5})
+        query_counts = []
+        for url in (self.url + '?pagination=cursor&page_size=5', pages[-2]['next']):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            query_counts.append(len(queries))
+            self.assertFalse(any('COUNT(' in query['sql'] or 'OFFSET' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_clients_page_by_join_date_and_bad_cursors_are_rejected(self):
+        UserProfile.objects.update(join_date=timezone.now())
+        clients = list(UserProfile.objects.filter(profile_type='Client').order_by('-id').values_list('user_id', flat=True))
+        pages = self.walk(reverse('dashboard:manage_clients'), {'pagination': 'cursor', 'page_size': 2})
+        self.assertEqual([client['user']['id'] for page in pages for client in page['results']], clients)
+        response = self.client.get(self.url, {'pagination': 'cursor', 'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class HotQueryIndexTests(QueryBudgetTestCase):
+    """The list, count and revenue queries the views actually run are served by an index."""
+    # Main table of each view's hot queries
+    HOT_TABLES = ('website_report', 'website_order', 'website_userprofile', 'website_purchasedreport', 'website_transaction')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(username='indexadmin', email='indexadmin@test.com', password='testpass123')
+        self.buyer = User.objects.create_user(username='indexbuyer', password='testpass123')
+        category = ReportCategory.objects.create(name='Index Category')
+        for number in range(3):
+            report = Report.objects.create(title=f'Indexed {number}', description='d', price=10, category=category,
+                                           file=f'reports/{number}.pdf')
+            order = Order.objects.create(client=self.buyer, order_number=f'index-{number}', total_price=10, status='paid')
+            Transaction.objects.create(order=order, transaction_id=f'index-{number}', amount=10, payment_method='mpesa', confirmed=True)
+            PurchasedReport.objects.create(client=self.buyer, report=report)
+
+    def hot_requests(self):
+        # (label, url name, query params, user)
+        return [
+            ('catalog', 'dashboard:public_reports', {}, None),
+            ('client catalog', 'dashboard:report_list', {}, self.buyer),
+            ('managed reports', 'dashboard:manage_reports', {}, self.admin),
+            ('managed reports keyset', 'dashboard:manage_reports', {'pagination': 'cursor', 'page_size': 1}, self.admin),
+            ('orders', 'dashboard:manage_orders', {}, self.admin),
+            ('orders by status', 'dashboard:manage_orders', {'status': 'paid'}, self.admin),
+            ('orders keyset', 'dashboard:manage_orders', {'pagination': 'cursor', 'page_size': 1}, self.admin),
+            ('clients', 'dashboard:manage_clients', {}, self.admin),
+            ('purchases', 'dashboard:my_purchases', {}, self.buyer),
+            ('revenue', 'dashboard:revenue_analytics', {}, self.admin),
+        ]
+
+    def hot_statements(self, queries):
+        """The SELECTs on HOT_TABLES that list, count or sum.
+
+        Rankings by an aggregate (the revenue view's top reports) are grouped
+        first and sorted afterwards, which no index can serve, so they are left out.
+        """
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'GROUP BY' in sql:
+                continue
+            if not any(f'FROM "{table}"' in sql for table in self.HOT_TABLES):
+                continue
+            if 'ORDER BY' in sql or 'COUNT(' in sql or 'SUM(' in sql:
+                yield sql
+
+    def capture(self, url_name, params, user):
+        # The first page, and the next one for keyset pagination
+        self.client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(url_name), params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            if params.get('pagination') == 'cursor':
+                self.assertTrue(response.data['next'])
+                self.assertEqual(self.client.get(response.data['next']).status_code, status.HTTP_200_OK)
+        return list(self.hot_statements(queries))
+
+    def test_hot_queries_use_an_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Reads SQLite query plans')
+        captured = [(label, self.capture(*request)) for label, *request in self.hot_requests()]
+        # admin_dashboard routes to the client dashboard, so the view is called directly
+        request = APIRequestFactory().get('/dashboard/admin/')
+        force_authenticate(request, user=self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(AdminDashboardView.as_view()(request).status_code, status.HTTP_200_OK)
+        captured.append(('admin dashboard', list(self.hot_statements(queries))))
+        for label, statements in captured:
+            self.assertTrue(statements, label)
+            for sql in statements:
+                with self.subTest(label, sql=sql):
+                    with connection.cursor() as cursor:
+                        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                        plan = '\n'.join(row[-1] for row in cursor.fetchall())
+                    self.assertRegex(plan, r'USING (COVERING )?INDEX \w+')
+                    self.assertNotRegex(plan, r'SCAN website_\w+\s*($|\n)')
+                    self.assertNotIn('TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_partial_indexes_have_a_plain_counterpart(self):
+        # MySQL, the production backend, silently builds no index for a condition=
+        for model in apps.get_app_config('website').get_models():
+            plain = [list(index.fields) for index in model._meta.indexes if index.condition is None]
+            for index in model._meta.indexes:
+                if index.condition is not None:
+                    with self.subTest(index.name):
+                        condition_fields = [name for name, _ in index.condition.children]
+                        self.assertIn(condition_fields + list(index.fields), plain)
+
+class DateWindowTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='windows', email='windows@test.com', password='testpass123')
+        self.buyer = User.objects.create_user(username='windowbuyer', password='testpass123')
+        # 23:30 on 31 March and 00:10 on 1 April in Nairobi are both 31 March in UTC
+        for number, moment in (('late-march', datetime(2026, 3, 31, 20, 30)), ('early-april', datetime(2026, 3, 31, 21, 10))):
+            order = Order.objects.create(client=self.buyer, order_number=number, total_price=100, status='paid')
+            transaction = Transaction.objects.create(order=order, transaction_id=number, amount=100, payment_method='mpesa', confirmed=True)
+            moment = moment.replace(tzinfo=dt_timezone.utc)
+            Order.objects.filter(id=order.id).update(created_at=moment)
+            Transaction.objects.filter(id=transaction.id).update(paid_at=moment)
+
+    def test_windows_are_half_open_nairobi_days(self):
+        march = Order.objects.filter(date_window('created_at', date(2026, 3, 1), date(2026, 3, 31)))
+        self.assertEqual(list(march.values_list('order_number', flat=True)), ['late-march'])
+        april = Order.objects.filter(date_window('created_at', start=date(2026, 4, 1)))
+        self.assertEqual(list(april.values_list('order_number', flat=True)), ['early-april'])
+        sql = str(march.query)
+        self.assertIn('"website_order"."created_at" >= 2026-02-28 21:00:00', sql)
+        self.assertIn('"website_order"."created_at" < 2026-03-31 21:00:00', sql)
+
+    def test_date_filters_compare_the_raw_columns(self):
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('dashboard:manage_orders'), {'start_date': '2026-04-01', 'end_date': '2026-04-30'})
+            self.assertEqual([order['order_number'] for order in response.data['results']], ['early-april'])
+            self.assertEqual(client.get(reverse('dashboard:revenue_analytics')).status_code, status.HTTP_200_OK)
+            request = APIRequestFactory().get('/dashboard/admin/')
+            force_authenticate(request, user=self.admin)
+            self.assertEqual(AdminDashboardView.as_view()(request).status_code, status.HTTP_200_OK)
+            get_monthly_revenue_data()
+            with patch('dashboard.cleanup.render_to_string', return_value='<p>Report</p>'):
+                self.assertTrue(generate_monthly_report())
+        sql = '\n'.join(query['sql'] for query in queries.captured_queries)
+        for column in ('created_at', 'paid_at', 'join_date', 'purchased_on'):
+            self.assertIn(f'."{column}" >= ', sql)
+        self.assertNotIn('django_datetime_cast_date', sql)
+
+class SparseFieldsetTests(QueryBudgetTestCase):
+    def setUp(self):
+        uncached = override_settings(CATALOG_RESPONSE_CACHE_TTL=0)
+        uncached.enable()
+        self.addCleanup(uncached.disable)
+        self.client = APIClient()
+        category = ReportCategory.objects.create(name='Energy')
+        for i in range(3):
+            Report.objects.create(title=f'Solar Outlook {i}', description='Long text ' * 50, category=category, price=10, file='reports/a.pdf')
+
+    def get_with_queries(self, url, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results'], '\n'.join(query['sql'] for query in queries.captured_queries)
+
+    def test_unrequested_fields_are_neither_rendered_nor_loaded(self):
+        url = reverse('dashboard:public_reports')
+        results, sql = self.get_with_queries(url, {'fields': 'id,title,unknown'})
+        self.assertEqual(set(results[0]), {'id', 'title'})
+        self.assertNotIn('website_reportcategory', sql)
+        self.assertNotIn('"description"', sql)
+        results, sql = self.get_with_queries(url, {'omit': 'description,purchase_count,category.report_count'})
+        self.assertNotIn('description', results[0])
+        self.assertEqual(set(results[0]['category']), {'id', 'name', 'slug'})
+        self.assertIn('website_reportcategory', sql)
+        self.assertNotIn('"description"', sql)
+        results, _ = self.get_with_queries(url, {'fieldset': 'card'})
+        self.assertEqual(set(results[0]), {'id', 'title', 'price', 'category', 'preview_image_url'})
+        self.assertEqual(set(results[0]['category']), {'name', 'slug'})
+        results, sql = self.get_with_queries(url, {})
+        self.assertIn('"description"', sql)
+        self.assertEqual(results[0]['description'], 'Long text ' * 50)
+
+    def test_omitted_method_fields_skip_their_annotations(self):
+        admin = User.objects.create_superuser(username='sparseadmin', email='sparse@test.com', password='testpass123')
+        User.objects.create_user(username='sparseclient', password='testpass123')
+        self.client.force_authenticate(user=admin)
+        results, sql = self.get_with_queries(reverse('dashboard:manage_clients'), {'omit': 'recent_purchase', 'fields': 'user.username,join_date'})
+        self.assertEqual(results[0], {'user': {'username': 'sparseclient'}, 'join_date': results[0]['join_date']})
+        self.assertNotIn('website_purchasedreport', sql)
+        results, sql = self.get_with_queries(reverse('dashboard:manage_clients'), {})
+        self.assertIn('recent_purchase', results[0])
+        self.assertIn('website_purchasedreport', sql)
+
+class SerializerQueryPlanTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.buyer = User.objects.create_user(username='planbuyer', email='planbuyer@test.com', password='testpass123')
+        self.category = ReportCategory.objects.create(name='Plans')
+        Report.objects.bulk_create([
+            Report(title=f'Plan {i}', slug=f'plan-{i}', description='d', category=self.category, price=10, file='reports/a.pdf')
+            for i in range(100)
+        ])
+        self.reports = list(Report.objects.order_by('id'))
+
+    def test_plans_follow_nested_serializers_and_dotted_sources(self):
+        self.assertEqual(build_query_plan(PurchasedReportSerializer).select_related, ['client', 'report', 'report__category'])
+        self.assertEqual(build_query_plan(OrderSummarySerializer).select_related, ['client'])
+        plan = build_query_plan(OrderSerializer)
+        self.assertEqual(plan.select_related, ['client'])
+        [items] = plan.prefetch_related
+        self.assertEqual(items.prefetch_through, 'items')
+        self.assertEqual(items.queryset.query.select_related, {'report': {'category': {}}})
+
+    def purchases_query_count(self, count):
+        PurchasedReport.objects.filter(client=self.buyer).delete()
+        PurchasedReport.objects.bulk_create([PurchasedReport(client=self.buyer, report=report) for report in self.reports[:count]])
+        self.client.force_authenticate(user=User.objects.get(id=self.buyer.id))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('dashboard:my_purchases'), {'page_size': 100})
+        self.assertEqual(len(response.data['results']), count)
+        self.assertEqual(response.data['results'][0]['report']['category']['name'], 'Plans')
+        return len(queries)
+
+    def test_purchase_pages_take_constant_queries(self):
+        self.assertEqual(self.purchases_query_count(100), self.purchases_query_count(5))
+
+    def test_order_and_client_summaries_are_planned(self):
+        for i, report in enumerate(self.reports[:30]):
+            order = Order.objects.create(client=self.buyer, order_number=generate_order_number(), total_price=10)
+            OrderItem.objects.create(order=order, report=report, price=10)
+            OrderItem.objects.create(order=order, report=self.reports[-1 - i], price=10)
+        PurchasedReport.objects.create(client=self.buyer, report=self.reports[3])
+        with self.assertNumQueries(2):  # Orders with clients, then items with reports and categories
+            data = OrderSerializer(plan_queryset(Order.objects.order_by('id'), OrderSerializer), many=True).data
+        self.assertEqual(data[0]['item_count'], 2)
+        self.assertEqual(data[0]['items'][1]['report_title'], self.reports[-1].title)
+
+        profiles = UserProfile.objects.filter(user=self.buyer)
+        with self.assertNumQueries(1):
+            planned = ClientSummarySerializer(plan_queryset(profiles, ClientSummarySerializer), many=True).data
+        self.assertEqual(planned, ClientSummarySerializer(profiles, many=True).data)
+        self.assertEqual(planned[0]['recent_purchase']['report_title'], self.reports[3].title)
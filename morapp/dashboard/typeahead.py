@@ -0,0 +1,190 @@
+import re
+import time
+import bisect
+import logging
+import threading
+import unicodedata
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from website.models import Report, ReportCategory
+
+logger = logging.getLogger('dashboard')
+
+_SEPARATOR_RE = re.compile(r'[\W_]+', re.UNICODE)
+
+def normalize(text):
+    """Lowercase, strip accents and collapse punctuation so 'Côte-d'Ivoire' types as 'cote d ivoire'."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return _SEPARATOR_RE.sub(' ', stripped.lower()).strip()
+
+class TypeaheadIndex:
+    """
+    In-process prefix index over active report titles and category names.
+    Each label is stored under its full normalized text (the leading array)
+    and under the text starting at each later word (the inner array), so a
+    prefix of any word finds it. Both arrays are kept sorted: a lookup is two
+    bisects plus a walk over at most limit matches per array, and saves
+    insert or remove only the keys of the object that changed. Writes made
+    by other processes are picked up by a background rebuild every
+    rebuild_interval seconds.
+    """
+    def __init__(self, max_words=6, rebuild_interval=300):
+        self.max_words = max_words
+        self.rebuild_interval = rebuild_interval
+        self.lookups = 0
+        self.entries_scanned = 0  # Keys compared by lookups, the walk past the bisects
+        self.rebuilds = 0
+        self._leading = []
+        self._inner = []
+        self._keys = {}      # (kind, id) -> keys stored for it, so an update can remove them
+        self._payloads = {}  # (kind, id) -> result dict
+        self._built_at = None
+        self._rebuilding = False
+        self._lock = threading.RLock()
+
+    def _entries(self, kind, object_id, label):
+        words = normalize(label).split()
+        if not words:
+            return []
+        ref = (kind, object_id)
+        entries = [('leading', (' '.join(words), *ref))]
+        for position in range(1, min(len(words), self.max_words)):
+            entries.append(('inner', (' '.join(words[position:]), *ref)))
+        return entries
+
+    def _array(self, name):
+        return self._leading if name == 'leading' else self._inner
+
+    def _remove(self, ref):
+        for name, entry in self._keys.pop(ref, []):
+            array = self._array(name)
+            position = bisect.bisect_left(array, entry)
+            if position < len(array) and array[position] == entry:
+                del array[position]
+        self._payloads.pop(ref, None)
+
+    def _put(self, kind, object_id, label, slug):
+        ref = (kind, object_id)
+        self._remove(ref)
+        entries = self._entries(kind, object_id, label)
+        if not entries:
+            return
+        for name, entry in entries:
+            bisect.insort(self._array(name), entry)
+        self._keys[ref] = entries
+        self._payloads[ref] = {'type': kind, 'id': object_id, 'label': label, 'slug': slug}
+
+    def build(self):
+        """Load every active report and category and swap the arrays in at once."""
+        leading, inner, keys, payloads = [], [], {}, {}
+        rows = [('category', *row) for row in ReportCategory.objects.values_list('id', 'name', 'slug')]
+        rows += [('report', *row) for row in Report.objects.filter(is_active=True).values_list('id', 'title', 'slug')]
+        for kind, object_id, label, slug in rows:
+            entries = self._entries(kind, object_id, label)
+            if not entries:
+                continue
+            for name, entry in entries:
+                (leading if name == 'leading' else inner).append(entry)
+            keys[(kind, object_id)] = entries
+            payloads[(kind, object_id)] = {'type': kind, 'id': object_id, 'label': label, 'slug': slug}
+        leading.sort()
+        inner.sort()
+        with self._lock:
+            self._leading, self._inner, self._keys, self._payloads = leading, inner, keys, payloads
+            self._built_at = time.monotonic()
+            self.rebuilds += 1
+
+    def _rebuild_in_background(self):
+        try:
+            self.build()
+        except Exception as e:
+            logger.error(f"Error rebuilding typeahead index: {str(e)}")
+        finally:
+            with self._lock:
+                self._rebuilding = False
+
+    def _ensure_fresh(self):
+        if self._built_at is None:
+            self.build()
+            return
+        if self.rebuild_interval and not self._rebuilding and time.monotonic() - self._built_at > self.rebuild_interval:
+            self._rebuilding = True
+            threading.Thread(target=self._rebuild_in_background, name='typeahead-rebuild', daemon=True).start()
+
+    def update_report(self, report_id, title, slug, is_active):
+        with self._lock:
+            if self._built_at is None:
+                return  # Built from the database on first lookup
+            if is_active:
+                self._put('report', report_id, title, slug)
+            else:
+                self._remove(('report', report_id))
+
+    def update_category(self, category_id, name, slug):
+        with self._lock:
+            if self._built_at is not None:
+                self._put('category', category_id, name, slug)
+
+    def remove(self, kind, object_id):
+        with self._lock:
+            self._remove((kind, object_id))
+
+    def lookup(self, text, limit=8):
+        """Up to limit labels with a word starting with text: whole-label prefix matches first."""
+        prefix = normalize(text)
+        if not prefix:
+            return []
+        with self._lock:
+            self._ensure_fresh()
+            self.lookups += 1
+            results, seen = [], set()
+            for array in (self._leading, self._inner):
+                position = bisect.bisect_left(array, (prefix,))
+                while position < len(array) and len(results) < limit:
+                    key, kind, object_id = array[position]
+                    self.entries_scanned += 1
+                    if not key.startswith(prefix):
+                        break
+                    if (kind, object_id) not in seen:
+                        seen.add((kind, object_id))
+                        results.append(self._payloads[(kind, object_id)])
+                    position += 1
+            return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._leading) + len(self._inner),
+                'labels': len(self._payloads),
+                'lookups': self.lookups,
+                'entries_scanned': self.entries_scanned,
+                'rebuilds': self.rebuilds,
+            }
+
+typeahead_index = TypeaheadIndex(
+    max_words=getattr(settings, 'TYPEAHEAD_MAX_WORDS', 6),
+    rebuild_interval=getattr(settings, 'TYPEAHEAD_REBUILD_SECONDS', 300)
+)
+
+@receiver(post_save, sender=Report, dispatch_uid='dashboard.typeahead_report_saved')
+def report_saved_typeahead_handler(sender, instance, **kwargs):
+    report_id, title, slug, is_active = instance.id, instance.title, instance.slug, instance.is_active
+    transaction.on_commit(lambda: typeahead_index.update_report(report_id, title, slug, is_active))
+
+@receiver(post_delete, sender=Report, dispatch_uid='dashboard.typeahead_report_deleted')
+def report_deleted_typeahead_handler(sender, instance, **kwargs):
+    report_id = instance.id
+    transaction.on_commit(lambda: typeahead_index.remove('report', report_id))
+
+@receiver(post_save, sender=ReportCategory, dispatch_uid='dashboard.typeahead_category_saved')
+def category_saved_typeahead_handler(sender, instance, **kwargs):
+    category_id, name, slug = instance.id, instance.name, instance.slug
+    transaction.on_commit(lambda: typeahead_index.update_category(category_id, name, slug))
+
+@receiver(post_delete, sender=ReportCategory, dispatch_uid='dashboard.typeahead_category_deleted')
+def category_deleted_typeahead_handler(sender, instance, **kwargs):
+    category_id = instance.id
+    transaction.on_commit(lambda: typeahead_index.remove('category', category_id))
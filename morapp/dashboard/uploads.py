@@ -0,0 +1,253 @@
+import os
+import re
+import fcntl
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from website.models import Report, ReportUpload
+from .utils import validate_file_upload
+
+logger = logging.getLogger('dashboard')
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+READ_SIZE = 64 * 1024
+PDF_MAGIC = b'%PDF-'
+
+class UploadRejected(Exception):
+    """The upload or chunk failed validation; status_code is the HTTP status to answer with."""
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+class UploadOffsetMismatch(Exception):
+    """The chunk does not start at the acknowledged offset; the client resumes from expected."""
+    def __init__(self, expected):
+        super().__init__(f'chunk must start at byte {expected}')
+        self.expected = expected
+
+class _DeclaredFile:
+    # validate_file_upload only looks at name and size, which are known before any data arrives
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+class _PartFile(File):
+    # Lets FileSystemStorage move the finished part file into place instead of copying it
+    def temporary_file_path(self):
+        return self.file.name
+
+# Running sha256 per upload, valid up to the stored offset. Chunks of one upload
+# may land on different worker processes, so a missing or stale hasher is rebuilt
+# from the part file.
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+def get_chunk_size():
+    return getattr(settings, 'REPORT_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024)
+
+def upload_part_path(upload):
+    return os.path.join(settings.MEDIA_ROOT, 'temp', f'upload-{upload.upload_id}.part')
+
+def parse_content_range(header):
+    """Parse 'bytes start-end/total' into (start, end, total) with end inclusive."""
+    match = CONTENT_RANGE_RE.match((header or '').strip())
+    if not match:
+        raise UploadRejected('Content-Range header must look like "bytes start-end/total"')
+    start, end, total = (int(value) for value in match.groups())
+    if end < start:
+        raise UploadRejected('Content-Range end is before its start')
+    return start, end, total
+
+def validate_declared_upload(filename, size):
+    max_size_mb = getattr(settings, 'MAX_REPORT_FILE_SIZE_MB', 50)
+    is_valid, message = validate_file_upload(
+        _DeclaredFile(filename, size), getattr(settings, 'ALLOWED_REPORT_EXTENSIONS', ['.pdf']), max_size_mb
+    )
+    if not is_valid:
+        raise UploadRejected(message, 413 if size > max_size_mb * 1024 * 1024 else 400)
+
+def start_upload(user, filename, total_size, expected_sha256='', report=None):
+    filename = os.path.basename(filename or '')
+    if not filename:
+        raise UploadRejected('filename is required')
+    if total_size <= 0:
+        raise UploadRejected('total_size must be positive')
+    validate_declared_upload(filename, total_size)
+    upload = ReportUpload.objects.create(
+        uploaded_by=user, filename=filename, total_size=total_size,
+        expected_sha256=(expected_sha256 or '').lower(), report=report
+    )
+    part_path = upload_part_path(upload)
+    os.makedirs(os.path.dirname(part_path), exist_ok=True)
+    open(part_path, 'wb').close()
+    return upload
+
+@contextmanager
+def _locked_part_file(upload):
+    """
+    The upload's part file, open for writing and exclusively locked, so
+    requests for one upload write, and finish it, one at a time. The lock is
+    on the file rather than the upload row, so a slow client holds up its own
+    upload and not the database.
+    """
+    try:
+        part_file = open(upload_part_path(upload), 'r+b')
+    except FileNotFoundError:
+        # Promoted by a finish that held the lock, or swept by cleanup_temp_files
+        upload.refresh_from_db(fields=['status', 'received_bytes'])
+        if upload.status != 'uploading':
+            raise UploadRejected(f'Upload is {upload.status}', 409)
+        raise UploadRejected('Upload expired, start a new one', 410)
+    with part_file:
+        fcntl.flock(part_file, fcntl.LOCK_EX)  # Released when the file is closed
+        yield part_file
+
+def _get_hasher(upload, part_path):
+    with _hashers_lock:
+        offset, hasher = _hashers.pop(upload.upload_id, (None, None))
+    if offset == upload.received_bytes:
+        return hasher
+    hasher = hashlib.sha256()
+    remaining = upload.received_bytes
+    with open(part_path, 'rb') as part_file:
+        while remaining:
+            data = part_file.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            hasher.update(data)
+            remaining -= len(data)
+    return hasher
+
+def write_chunk(upload, stream, content_range, content_length):
+    """
+    Append one chunk read from stream to the part file. Data is copied in
+    READ_SIZE pieces and hashed as it is written, so no more than that is held
+    in memory. Returns the updated upload.
+    """
+    start, end, total = parse_content_range(content_range)
+    length = end - start + 1
+    if content_length is not None and content_length != length:
+        raise UploadRejected('Content-Length does not match Content-Range')
+    if length > get_chunk_size():
+        raise UploadRejected(f'Chunks may not exceed {get_chunk_size()} bytes', 413)
+
+    part_path = upload_part_path(upload)
+    if upload.status == 'uploading' and not os.path.exists(part_path):
+        # Swept by cleanup_temp_files after sitting idle; the upload cannot resume
+        ReportUpload.objects.filter(pk=upload.pk).update(status='cancelled')
+        raise UploadRejected('Upload expired, start a new one', 410)
+
+    if upload.status != 'uploading':
+        raise UploadRejected(f'Upload is {upload.status}', 409)
+    if total != upload.total_size:
+        raise UploadRejected('Content-Range total does not match the declared size')
+    if start != upload.received_bytes:
+        raise UploadOffsetMismatch(upload.received_bytes)
+    if end >= upload.total_size:
+        raise UploadRejected('Chunk extends past the declared size', 413)
+    validate_declared_upload(upload.filename, end + 1)
+
+    with _locked_part_file(upload) as part_file:
+        # Checked again under the lock: a request that held it may have moved
+        # the offset, and bytes are written only once this chunk is known to
+        # start at the acknowledged one, so a racing request for the same
+        # offset is refused instead of overwriting acknowledged data
+        upload.refresh_from_db(fields=['status', 'received_bytes'])
+        if upload.status != 'uploading':
+            raise UploadRejected(f'Upload is {upload.status}', 409)
+        if start != upload.received_bytes:
+            raise UploadOffsetMismatch(upload.received_bytes)
+        hasher = _get_hasher(upload, part_path)
+        written = 0
+        part_file.seek(start)
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            if start == 0 and written == 0 and not data.startswith(PDF_MAGIC):
+                raise UploadRejected('File is not a PDF')
+            part_file.write(data)
+            hasher.update(data)
+            written += len(data)
+        if written != length:
+            raise UploadRejected(f'Chunk ended after {written} of {length} bytes')
+        part_file.flush()
+
+        # Status is re-checked in the update, since cancelling does not take the lock
+        updated = ReportUpload.objects.filter(pk=upload.pk, status='uploading', received_bytes=start).update(
+            received_bytes=end + 1, updated_at=timezone.now()
+        )
+        if not updated:
+            upload.refresh_from_db(fields=['status', 'received_bytes'])
+            if upload.status != 'uploading':
+                raise UploadRejected(f'Upload is {upload.status}', 409)
+            raise UploadOffsetMismatch(upload.received_bytes)
+        upload.received_bytes = end + 1
+        with _hashers_lock:
+            _hashers[upload.upload_id] = (upload.received_bytes, hasher)
+    return upload
+
+def finish_upload(upload, serializer=None):
+    """
+    Verify a fully received upload and store it as its report's file. An upload
+    started for an existing report replaces that report's file; otherwise the
+    validated ReportSerializer creates the report. Returns the report.
+    """
+    if upload.status != 'uploading':
+        raise UploadRejected(f'Upload is {upload.status}', 409)
+    with _locked_part_file(upload), transaction.atomic():
+        # Re-read under the locks: a concurrent finish that got there first has
+        # already promoted the part file and must not be repeated
+        upload.status, upload.received_bytes = ReportUpload.objects.select_for_update().values_list(
+            'status', 'received_bytes'
+        ).get(pk=upload.pk)
+        if upload.status != 'uploading':
+            raise UploadRejected(f'Upload is {upload.status}', 409)
+        if upload.received_bytes != upload.total_size:
+            raise UploadRejected(f'Upload has {upload.received_bytes} of {upload.total_size} bytes')
+        part_path = upload_part_path(upload)
+        digest = _get_hasher(upload, part_path).hexdigest()
+        if upload.expected_sha256 and upload.expected_sha256 != digest:
+            raise UploadRejected('Checksum does not match the uploaded data', 422)
+
+        file_field = Report._meta.get_field('file')
+        with open(part_path, 'rb') as part_file:
+            content = _PartFile(part_file, name=upload.filename)
+            content.content_sha256 = digest  # Spares the content-addressed storage a second pass over the file
+            name = file_field.storage.save(file_field.generate_filename(None, upload.filename), content)
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        with _hashers_lock:
+            _hashers.pop(upload.upload_id, None)
+
+        try:
+            if upload.report is not None:
+                report = upload.report
+                report.file = name
+                report.original_file_name = upload.filename
+                report.save()
+            else:
+                report = serializer.save(file=name, original_file_name=upload.filename)
+        except Exception:
+            file_field.storage.delete(name)
+            raise
+        upload.sha256 = digest
+        upload.status = 'complete'
+        upload.report = report
+        upload.save(update_fields=['sha256', 'status', 'report', 'updated_at'])
+    logger.info(f"Upload {upload.upload_id} completed: {upload.total_size} bytes into report {report.id}")
+    return report
+
+def cancel_upload(upload):
+    part_path = upload_part_path(upload)
+    if os.path.exists(part_path):
+        os.remove(part_path)
+    with _hashers_lock:
+        _hashers.pop(upload.upload_id, None)
+    upload.status = 'cancelled'
+    upload.save(update_fields=['status', 'updated_at'])
@@ -13,14 +13,20 @@ urlpatterns = [
     path('orders/<int:order_id>/pay/', views.ProcessPaymentView.as_view(), name='process_payment'),
     path('purchases/', views.MyPurchasesView.as_view(), name='my_purchases'),
     path('reports/<int:report_id>/viewer/', views.SecureReportViewerView.as_view(), name='secure_viewer'),
+    path('reports/<int:report_id>/pages/<int:page_number>/', views.ReportPageImageView.as_view(), name='report_page_image'),
     path('mpesa/callback/', views.MpesaCallbackView.as_view(), name='mpesa_callback'),
     path('paystack/callback/', views.PaystackCallbackView.as_view(), name='paystack_callback'),
     path('admin/reports/', views.ManageReportsView.as_view(), name='manage_reports'),
     path('admin/reports/<int:pk>/', views.ManageReportDetailView.as_view(), name='manage_report_detail'),
+    path('admin/uploads/', views.ReportUploadsView.as_view(), name='report_uploads'),
+    path('admin/uploads/<uuid:upload_id>/', views.ReportUploadDetailView.as_view(), name='report_upload_detail'),
+    path('admin/uploads/<uuid:upload_id>/complete/', views.ReportUploadCompleteView.as_view(), name='report_upload_complete'),
     path('admin/orders/', views.ManageOrdersView.as_view(), name='manage_orders'),
     path('admin/categories/', views.ManageCategoriesView.as_view(), name='manage_categories'),
     path('admin/clients/', views.ManageClientsView.as_view(), name='manage_clients'),
     path('admin/revenue/', views.RevenueAnalyticsView.as_view(), name='revenue_analytics'),
+    path('admin/watermark-stats/', views.WatermarkStatsView.as_view(), name='watermark_stats'),
     path('public/reports/', views.PublicReportsView.as_view(), name='public_reports'),
+    path('public/reports/autocomplete/', views.ReportAutocompleteView.as_view(), name='report_autocomplete'),
     path('public/categories/', views.PublicCategoriesView.as_view(), name='public_categories'),
 ]
\ No newline at end of file
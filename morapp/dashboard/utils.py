@@ -2,18 +2,32 @@ from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
-from django.db.models import Sum, Count
+from django.db.models import Sum, Q
+from django.utils import timezone
 from website.models import UserProfile, Report, Order, Transaction, PurchasedReport
 import os
+from datetime import datetime, time, timedelta
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
 from io import BytesIO
+from collections import OrderedDict
 import PyPDF2
+import hashlib
+import queue
+import tempfile
+import threading
 import logging
+from .cache import watermarked_pdf_cache, get_file_digest
+from .pdf_stamp import build_stamp_plan, write_stamped_pdf, StampNotSupported
+from .pdf_linearize import write_linearized_pdf, LinearizationNotSupported
+from .executor import watermark_executor
 
 logger = logging.getLogger('dashboard')
 
+# Bump when the watermark layout changes so cached copies are regenerated
+WATERMARK_ENGINE_VERSION = 3
+
 def generate_order_number():
     import uuid
     return f"ORD-{uuid.uuid4().hex[:12].upper()}"
@@ -90,24 +104,41 @@ def calculate_dashboard_stats(user_type, user=None):
         stats['total_orders'] = Order.objects.count()
     return stats
 
+def start_of_day(day):
+    """The aware datetime at which day begins in the current time zone."""
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+def date_window(field, start=None, end=None):
+    """
+    Q matching rows whose datetime field falls on the calendar days start to
+    end (both inclusive, either open) in the current time zone. Unlike
+    field__date__range it compares the column itself with the half-open range
+    [start of start, start of the day after end), so an index on the column
+    can be used.
+    """
+    lookups = {}
+    if start is not None:
+        lookups[f'{field}__gte'] = start_of_day(start)
+    if end is not None:
+        lookups[f'{field}__lt'] = start_of_day(end + timedelta(days=1))
+    return Q(**lookups)
+
 def get_monthly_revenue_data(months=12):
-    from django.utils import timezone
-    from datetime import datetime, timedelta
-    today = timezone.now().date()
+    today = timezone.localdate()
     data = []
     for i in range(months):
         month_start = today.replace(day=1) - timedelta(days=30*i)
         month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
         revenue = Transaction.objects.filter(
-            confirmed=True,
-            paid_at__date__range=[month_start, month_end]
+            date_window('paid_at', month_start, month_end),
+            confirmed=True
         ).aggregate(total=Sum('amount'))['total'] or 0.0
         order_count = Transaction.objects.filter(
-            confirmed=True,
-            paid_at__date__range=[month_start, month_end]
+            date_window('paid_at', month_start, month_end),
+            confirmed=True
         ).count()
         reports_sold = PurchasedReport.objects.filter(
-            purchased_on__date__range=[month_start, month_end]
+            date_window('purchased_on', month_start, month_end)
         ).count()
         data.append({
             'month': month_start.strftime('%Y-%m'),
@@ -119,7 +150,6 @@ def get_monthly_revenue_data(months=12):
 
 def get_top_selling_reports(limit=10):
     reports = Report.objects.annotate(
-        purchase_count=Count('purchasedreport'),
         total_revenue=Sum('orderitem__price')
     ).order_by('-purchase_count')[:limit]
     return [
@@ -141,44 +171,403 @@ def validate_file_upload(file, allowed_extensions=None, max_size_mb=10):
         return False, f"File size exceeds {max_size_mb}MB"
     return True, "File is valid"
 
-def generate_report_preview_url(report):
+def pick_preview_thumbnail(thumbnails, width, image_format='webp'):
+    """Return the path of the smallest thumbnail at least width pixels wide, else the largest one."""
+    sizes = thumbnails.get(image_format) or thumbnails.get('jpeg') or {}
+    if not sizes:
+        return None
+    widths = sorted(int(size) for size in sizes)
+    chosen = next((size for size in widths if size >= width), widths[-1])
+    return sizes[str(chosen)]
+
+def generate_report_preview_url(report, width=None, image_format='webp'):
+    path = pick_preview_thumbnail(
+        report.preview_thumbnails or {}, width or getattr(settings, 'PREVIEW_DEFAULT_WIDTH', 320), image_format
+    )
+    if path:
+        return f'{settings.MEDIA_URL}{path}'
     return '/static/images/default-report-preview.png'
 
-def add_watermark_to_pdf(input_path, user):
-    try:
-        output_path = os.path.join(settings.MEDIA_ROOT, 'temp', f'watermarked_{os.path.basename(input_path)}')
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Create watermark PDF
-        buffer = BytesIO()
-        c = canvas.Canvas(buffer, pagesize=letter)
-        watermark_text = settings.WATERMARK_TEXT_TEMPLATE.format(
-            user_name=user.username,
-            user_email=user.email
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache bounded by entry count and total size.
+    sizeof() measures an entry; the default suits bytes values.
+    """
+    def __init__(self, max_entries=256, max_bytes=8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def sizeof(self, data):
+        return len(data)
+
+    def put(self, key, data):
+        size = self.sizeof(data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self.sizeof(self._entries.pop(key))
+            self._entries[key] = data
+            self._size += size
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= self.sizeof(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+class WatermarkOverlayCache(LRUCache):
+    """
+    Bounded LRU cache of rendered watermark overlay PDFs.
+    Entries are keyed by the rendered watermark text and the page size, so
+    repeat views of a report by the same user skip the ReportLab render.
+    """
+
+watermark_overlay_cache = WatermarkOverlayCache(
+    max_entries=getattr(settings, 'WATERMARK_OVERLAY_CACHE_MAX_ENTRIES', 256),
+    max_bytes=getattr(settings, 'WATERMARK_OVERLAY_CACHE_MAX_BYTES', 8 * 1024 * 1024)
+)
+
+class PdfStructureCache(LRUCache):
+    """
+    Bounded LRU cache of parsed report structure (the stamp plan: serialized
+    objects, stream data offsets, page tree entries, page boxes and trailer).
+    Keys are (path, mtime_ns, size), so a replaced file misses naturally;
+    invalidate() drops every entry for a path straight away.
+    """
+    def sizeof(self, plan):
+        # Serialized object and page dictionaries dominate; count a fixed overhead per item for the rest
+        return 512 + len(plan['trailer']) + sum(
+            128 + len(body) for _, _, body, _ in plan['objects']
+        ) + sum(
+            256 + len(page['entries']) + len(page['contents']) + len(page['resources']) + len(page['xobjects'])
+            for page in plan['pages']
         )
-        c.setFont("Helvetica", 40)
-        c.setFillColorRGB(0.8, 0.8, 0.8, alpha=0.3)
-        c.translate(300, 400)
-        c.rotate(45)
-        c.drawCentredString(0, 0, watermark_text)
-        c.showPage()
-        c.save()
-        watermark_pdf = buffer.getvalue()
-        buffer.close()
-        
-        # Merge watermark with input PDF
-        input_pdf = PyPDF2.PdfReader(input_path)
-        watermark_pdf_reader = PyPDF2.PdfReader(BytesIO(watermark_pdf))
-        output_pdf = PyPDF2.PdfWriter()
+
+    def invalidate(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == path]
+            for key in stale:
+                self._size -= self.sizeof(self._entries.pop(key))
+        return len(stale)
+
+pdf_structure_cache = PdfStructureCache(
+    max_entries=getattr(settings, 'PDF_STRUCTURE_CACHE_MAX_ENTRIES', 128),
+    max_bytes=getattr(settings, 'PDF_STRUCTURE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+)
+
+def get_stamp_plan(input_path):
+    """Return the parsed structure of input_path, parsing it only when the file changed."""
+    stat = os.stat(input_path)
+    key = (os.path.abspath(input_path), stat.st_mtime_ns, stat.st_size)
+    plan = pdf_structure_cache.get(key)
+    if plan is None:
+        plan = build_stamp_plan(input_path)
+        pdf_structure_cache.put(key, plan)
+    return plan
+
+def render_watermark_text(user):
+    return settings.WATERMARK_TEXT_TEMPLATE.format(
+        user_name=user.username,
+        user_email=user.email
+    )
+
+def render_watermark_overlay(watermark_text, page_size=letter):
+    width, height = page_size
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=(width, height))
+    c.setFont("Helvetica", 40)
+    c.setFillColorRGB(0.8, 0.8, 0.8, alpha=0.3)
+    c.translate(width / 2, height / 2)
+    c.rotate(45)
+    c.drawCentredString(0, 0, watermark_text)
+    c.showPage()
+    c.save()
+    data = buffer.getvalue()
+    buffer.close()
+    return data
+
+def get_watermark_overlay(watermark_text, page_size=letter):
+    """Return the overlay PDF bytes for the text and page size, rendering on a cache miss."""
+    key = (watermark_text, round(float(page_size[0]), 2), round(float(page_size[1]), 2))
+    data = watermark_overlay_cache.get(key)
+    if data is None:
+        data = render_watermark_overlay(watermark_text, (key[1], key[2]))
+        watermark_overlay_cache.put(key, data)
+    return data
+
+def get_watermark_engine():
+    return getattr(settings, 'WATERMARK_ENGINE', 'xobject')
+
+def use_linearization(linearize=None):
+    if linearize is None:
+        return getattr(settings, 'WATERMARK_LINEARIZE', False)
+    return bool(linearize)
+
+def get_watermark_version(watermark_text, linearize=False):
+    version = f'{WATERMARK_ENGINE_VERSION}|{get_watermark_engine()}|{int(linearize)}|{watermark_text}'
+    return hashlib.sha256(version.encode('utf-8')).hexdigest()[:16]
+
+def get_watermark_cache_key(input_path, user, linearize=None):
+    watermark_text = render_watermark_text(user)
+    return watermarked_pdf_cache.make_key(
+        get_file_digest(input_path), user.id, get_watermark_version(watermark_text, use_linearization(linearize))
+    )
+
+def write_watermarked_pdf(input_path, watermark_text, output_file, linearize=False, engine=None):
+    engine = engine or get_watermark_engine()
+    if linearize:
+        # The linearizer needs the finished document, so stamp into a spool file first
+        with tempfile.SpooledTemporaryFile(max_size=getattr(settings, 'WATERMARK_SPOOL_MAX_MEMORY', 8 * 1024 * 1024)) as spool:
+            write_watermarked_pdf(input_path, watermark_text, spool, engine=engine)
+            spool.seek(0)
+            try:
+                write_linearized_pdf(spool, output_file)
+                return
+            except LinearizationNotSupported as e:
+                logger.warning(f"Serving non-linearized copy of {os.path.basename(input_path)}: {str(e)}")
+            spool.seek(0)
+            for chunk in iter(lambda: spool.read(1024 * 1024), b''):
+                output_file.write(chunk)
+        return
+    if engine == 'xobject':
+        try:
+            plan = get_stamp_plan(input_path)
+        except StampNotSupported as e:
+            logger.warning(f"Falling back to page merge for {os.path.basename(input_path)}: {str(e)}")
+        else:
+            write_stamped_pdf(input_path, lambda page_size: get_watermark_overlay(watermark_text, page_size), output_file, plan=plan)
+            return
+    merge_watermark_pdf(input_path, watermark_text, output_file)
+
+def merge_watermark_pdf(input_path, watermark_text, output_file):
+    # Merge watermark with input PDF, reusing one overlay page per page size
+    input_pdf = PyPDF2.PdfReader(input_path)
+    output_pdf = PyPDF2.PdfWriter()
+    overlay_pages = {}
+    
+    for page in input_pdf.pages:
+        page_size = (float(page.mediabox.width), float(page.mediabox.height))
+        if page_size not in overlay_pages:
+            overlay = get_watermark_overlay(watermark_text, page_size)
+            overlay_pages[page_size] = PyPDF2.PdfReader(BytesIO(overlay)).pages[0]
+        page.merge_page(overlay_pages[page_size])
+        output_pdf.add_page(page)
+    
+    output_pdf.write(output_file)
+
+def add_watermark_to_pdf(input_path, user, linearize=None, offload=False):
+    """
+    Return the path of the user's watermarked copy of input_path.
+    Copies are cached on disk per (file hash, user, watermark version), so a
+    returning reader is served the finished file without another merge.
+    With linearize (default: WATERMARK_LINEARIZE) the copy is written as a
+    linearized PDF so viewers can show page 1 before the download finishes.
+    With offload a missing copy is built on the watermark process pool, which
+    keeps the CPU-bound merge off this process's GIL; WatermarkJobTimeout is
+    raised if it is not ready within WATERMARK_JOB_TIMEOUT.
+    """
+    try:
+        linearize = use_linearization(linearize)
+        key = get_watermark_cache_key(input_path, user, linearize)
+        cached_path = watermarked_pdf_cache.get(key)
+        if cached_path:
+            return cached_path
         
-        for page in input_pdf.pages:
-            page.merge_page(watermark_pdf_reader.pages[0])
-            output_pdf.add_page(page)
+        watermark_text = render_watermark_text(user)
+        if offload and watermark_executor.enabled:
+            return watermark_executor.run(
+                key, input_path, watermark_text, get_watermark_engine(), linearize,
+                timeout=getattr(settings, 'WATERMARK_JOB_TIMEOUT', 120)
+            )
         
-        with open(output_path, 'wb') as output_file:
-            output_pdf.write(output_file)
+        with watermarked_pdf_cache.open_for_write(key) as output_file:
+            write_watermarked_pdf(input_path, watermark_text, output_file, linearize=linearize)
         
-        return output_path
+        return watermarked_pdf_cache.path_for(key)
     except Exception as e:
         logger.error(f"Error adding watermark to PDF: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+class StreamCancelled(Exception):
+    pass
+
+class ChunkedQueueStream:
+    """
+    Write-only file object for PdfWriter that hands fixed-size chunks to a
+    consumer thread through a bounded queue. A slow client blocks the writer
+    instead of letting output pile up in memory.
+    """
+    END = object()
+
+    def __init__(self, chunk_size=64 * 1024, max_chunks=8):
+        self.chunk_size = chunk_size
+        self.queue = queue.Queue(maxsize=max_chunks)
+        self.cancelled = threading.Event()
+        self._buffer = bytearray()
+        self._position = 0
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.chunk_size:
+            self._put(bytes(self._buffer[:self.chunk_size]))
+            del self._buffer[:self.chunk_size]
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def finish(self, error=None):
+        if self._buffer and error is None:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        self._put(error if error is not None else self.END)
+
+    def _put(self, item):
+        while True:
+            if self.cancelled.is_set():
+                raise StreamCancelled()
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+def stream_watermarked_pdf(input_path, user, cache_key=None, linearize=None):
+    """
+    Yield the watermarked PDF in chunks while it is being written.
+    The merge runs in a producer thread so the first bytes reach the client
+    before the whole document is serialized. When cache_key is given the
+    chunks are also teed into the watermarked PDF cache, and the entry is
+    only committed if the stream completes.
+    """
+    watermark_text = render_watermark_text(user)
+    linearize = use_linearization(linearize)
+    sink = ChunkedQueueStream(
+        chunk_size=getattr(settings, 'WATERMARK_STREAM_CHUNK_SIZE', 64 * 1024),
+        max_chunks=getattr(settings, 'WATERMARK_STREAM_MAX_CHUNKS', 8)
+    )
+
+    def produce():
+        try:
+            write_watermarked_pdf(input_path, watermark_text, sink, linearize=linearize)
+            sink.finish()
+        except StreamCancelled:
+            pass
+        except Exception as e:
+            logger.error(f"Error streaming watermarked PDF: {str(e)}")
+            try:
+                sink.finish(error=e)
+            except StreamCancelled:
+                pass
+
+    producer = threading.Thread(target=produce, name='watermark-stream', daemon=True)
+    producer.start()
+    try:
+        if cache_key:
+            with watermarked_pdf_cache.open_for_write(cache_key) as cache_file:
+                yield from _drain_stream(sink, cache_file)
+        else:
+            yield from _drain_stream(sink)
+    finally:
+        sink.cancelled.set()
+
+def _drain_stream(sink, tee=None):
+    while True:
+        item = sink.queue.get()
+        if item is ChunkedQueueStream.END:
+            return
+        if isinstance(item, Exception):
+            raise item
+        if tee is not None:
+            tee.write(item)
+        yield item
+
+def prime_stream(chunks):
+    """Pull the first chunk eagerly so errors raised before any output reach the caller."""
+    first_chunk = next(chunks, b'')
+
+    def replay():
+        yield first_chunk
+        yield from chunks
+    return replay()
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def parse_range_header(header, size):
+    """
+    Parse a single-range "bytes=" Range header into an inclusive (start, end).
+    Returns None when the header should be ignored (unknown unit, multiple
+    ranges, or a last byte before the first, which RFC 7233 treats as
+    invalid rather than unsatisfiable) and raises RangeNotSatisfiable when
+    the range starts past the end of the file.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+def iter_file_range(path, start, end, chunk_size=64 * 1024):
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = fh.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
@@ -3,10 +3,11 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Sum, Count
-from django.http import HttpResponse, Http404, FileResponse
+from django.db.models import Q, Sum
+from django.http import HttpResponse, Http404, FileResponse, StreamingHttpResponse
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.utils.http import content_disposition_header, parse_etags, quote_etag
 from datetime import datetime, timedelta
 import stripe
 import requests
@@ -25,13 +26,32 @@ from io import BytesIO
 import PyPDF2
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from website.models import Report, ReportCategory, Order, OrderItem, Transaction, PurchasedReport, UserProfile
+from website.models import Report, ReportCategory, Order, OrderItem, Transaction, PurchasedReport, UserProfile, ReportUpload
 from .serializers import (
     ReportSerializer, ReportCategorySerializer, OrderSerializer, OrderItemSerializer,
     TransactionSerializer, PurchasedReportSerializer, UserProfileSerializer,
-    ReportDetailSerializer, ClientSummarySerializer, OrderSummarySerializer
+    ReportDetailSerializer, ClientSummarySerializer, OrderSummarySerializer, ReportUploadSerializer,
+    ReportUploadCreateSerializer, ReportSearchResultSerializer
 )
-from .utils import generate_order_number, generate_transaction_id, send_order_confirmation_email, send_payment_success_email, add_watermark_to_pdf
+from .utils import (
+    generate_order_number, generate_transaction_id, send_order_confirmation_email, send_payment_success_email,
+    render_watermark_text, add_watermark_to_pdf, date_window, get_watermark_cache_key, stream_watermarked_pdf, prime_stream,
+    parse_range_header, iter_file_range, RangeNotSatisfiable, pdf_structure_cache
+)
+from .cache import watermarked_pdf_cache
+from .prewarm import warm_pool
+from .ingestion import ingestion_pool
+from .executor import watermark_executor, WatermarkJobTimeout
+from .page_images import (
+    PAGE_IMAGE_FORMATS, PageOutOfRange, clamp_dpi, get_page_image, get_page_image_cache_key
+)
+from .uploads import UploadRejected, UploadOffsetMismatch, start_upload, write_chunk, finish_upload, cancel_upload
+from .search import search_catalog, search_report_contents, content_search_available, rank_reports
+from .typeahead import typeahead_index
+from .query_plan import SerializerQueryPlanMixin, plan_queryset
+from .catalog_cache import CatalogResponseCacheMixin, catalog_response_cache
+from .pagination import KeysetPaginationMixin
+from .fieldsets import SparseFieldsetViewMixin
 from .permissions import IsClientUser, IsManagementUser, HasPurchasedReport, CanManageReports
 
 logger = logging.getLogger('dashboard')
@@ -73,6 +93,7 @@ class StandardResultsSetPagination(PageNumberPagination):
 #         return Response(data)
 class ClientDashboardView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsClientUser]
+    query_budget = 8
     
     @swagger_auto_schema(
         operation_description="Get dashboard summary for the authenticated client user.",
@@ -88,7 +109,7 @@ class ClientDashboardView(APIView):
         user = request.user
         purchased_reports = PurchasedReport.objects.filter(client=user)
         total_spent = Transaction.objects.filter(order__client=user, confirmed=True).aggregate(total=Sum('amount'))['total'] or 0
-        recent_purchases = purchased_reports.order_by('-purchased_on')[:5]
+        recent_purchases = plan_queryset(purchased_reports.order_by('-purchased_on'), PurchasedReportSerializer)[:5]
         
         # Prepare dashboard data
         data = {
@@ -104,13 +125,54 @@ class ClientDashboardView(APIView):
             "data": data
         })
 
-class ReportListView(generics.ListAPIView):
+class ReportSearchMixin:
+    """
+    Ranked search for report lists. search= matches title, description and
+    category name through the catalog index; q= searches report contents and
+    adds the matching pages and snippets to each result. Without either the
+    list stays newest first.
+    """
+    search_hits = None
+
+    def apply_search(self, queryset):
+        search = self.request.query_params.get('search')
+        query = self.request.query_params.get('q')
+        if not content_search_available():
+            for text in (search, query):
+                if text:
+                    queryset = queryset.filter(Q(title__icontains=text) | Q(description__icontains=text))
+            return queryset.order_by('-created_at')
+        if query:
+            self.search_hits = search_report_contents(query)
+            if search:
+                queryset = queryset.filter(id__in=search_catalog(queryset, search).values('id'))
+            if not self.search_hits:
+                return queryset.none()
+            return rank_reports(queryset, list(self.search_hits))
+        if search:
+            return search_catalog(queryset, search)
+        return queryset.order_by('-created_at')
+
+    def get_serializer_class(self):
+        if self.search_hits is not None:
+            return ReportSearchResultSerializer
+        return super().get_serializer_class()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['search_hits'] = self.search_hits or {}
+        return context
+
+class ReportListView(ReportSearchMixin, SparseFieldsetViewMixin, SerializerQueryPlanMixin, generics.ListAPIView):
     serializer_class = ReportSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 6
     
     @swagger_auto_schema(
-        operation_description="List all active reports, with optional filters for search, category, and price.",
+        operation_description="List all active reports, with optional filters for search, category, and price. "
+                              "search= ranks matches on title, description and category (prefix and typo tolerant); "
+                              "q= searches report contents and returns ranked reports with page snippets.",
         responses={
             200: openapi.Response('List of reports', ReportSerializer(many=True)),
             401: 'Unauthorized'
@@ -118,13 +180,10 @@ class ReportListView(generics.ListAPIView):
     )
     def get_queryset(self):
         queryset = Report.objects.filter(is_active=True)
-        search = self.request.query_params.get('search')
         category = self.request.query_params.get('category')
         min_price = self.request.query_params.get('min_price')
         max_price = self.request.query_params.get('max_price')
 
-        if search:
-            queryset = queryset.filter(Q(title__icontains=search) | Q(description__icontains=search))
         if category:
             queryset = queryset.filter(category__slug=category)
         if min_price:
@@ -138,7 +197,7 @@ class ReportListView(generics.ListAPIView):
             except (ValueError, TypeError):
                 pass
 
-        return queryset.order_by('-created_at')
+        return self.apply_search(queryset)
 
     def list(self, request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
@@ -152,6 +211,7 @@ class ReportListView(generics.ListAPIView):
 
 class ReportDetailView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    query_budget = 6
     
     @swagger_auto_schema(
         operation_description="Retrieve details of a specific report, including purchase status.",
@@ -195,6 +255,7 @@ class ReportDetailView(APIView):
 #         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 class CreateOrderView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsClientUser]
+    query_budget = 17  # 5, plus one item insert per report of a MAX_REPORTS_PER_ORDER order
     
     @swagger_auto_schema(
         operation_description="Create a new order for reports.",
@@ -228,6 +289,7 @@ class CreateOrderView(APIView):
 
 class ProcessPaymentView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsClientUser]
+    query_budget = 38  # 6, plus lookup, insert and purchase count per report of a MAX_REPORTS_PER_ORDER order
     
     @swagger_auto_schema(
         operation_description="Process payment for an order using Mpesa, Stripe, or Paystack.",
@@ -306,7 +368,7 @@ class ProcessPaymentView(APIView):
                 order.status = 'paid'
                 order.save()
                 for item in order.items.all():
-                    PurchasedReport.objects.get_or_create(client=request.user, report=item.report)
+                    PurchasedReport.objects.get_or_create(client=request.user, report_id=item.report_id)
                 send_payment_success_email(transaction)
                 return Response({'message': 'Payment successful', 'transaction_id': transaction.transaction_id})
             
@@ -375,6 +437,7 @@ from rest_framework.permissions import AllowAny
 
 class MpesaCallbackView(APIView):
     permission_classes = [AllowAny]
+    query_budget = 38  # 6, plus lookup, insert and purchase count per report of a MAX_REPORTS_PER_ORDER order
 
     @swagger_auto_schema(
         operation_description="Callback endpoint for Mpesa payment confirmation.",
@@ -423,7 +486,7 @@ class MpesaCallbackView(APIView):
 
             # Grant access to purchased reports
             for item in order.items.all():
-                PurchasedReport.objects.get_or_create(client=order.client, report=item.report)
+                PurchasedReport.objects.get_or_create(client=order.client, report_id=item.report_id)
 
             send_payment_success_email(transaction)
             logger.info(f"M-Pesa payment confirmed: {transaction_id}")
@@ -440,6 +503,8 @@ class MpesaCallbackView(APIView):
 
 
 class PaystackCallbackView(APIView):
+    query_budget = 12
+
     @swagger_auto_schema(
         operation_description="Callback endpoint for Paystack payment confirmation.",
         responses={
@@ -468,7 +533,7 @@ class PaystackCallbackView(APIView):
                 order.status = 'paid'
                 order.save()
                 for item in order.items.all():
-                    PurchasedReport.objects.get_or_create(client=order.client, report=item.report)
+                    PurchasedReport.objects.get_or_create(client=order.client, report_id=item.report_id)
                 send_payment_success_email(transaction)
                 logger.info(f"Paystack payment confirmed: {reference}")
             return Response({'status': 'ok'})
@@ -476,10 +541,12 @@ class PaystackCallbackView(APIView):
             logger.error(f"Paystack callback error: {str(e)}")
             return Response({'status': 'error'}, status=status.HTTP_400_BAD_REQUEST)
 
-class MyPurchasesView(generics.ListAPIView):
+class MyPurchasesView(KeysetPaginationMixin, SparseFieldsetViewMixin, SerializerQueryPlanMixin, generics.ListAPIView):
     serializer_class = PurchasedReportSerializer
     permission_classes = [permissions.IsAuthenticated, IsClientUser]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('-purchased_on', '-id')
+    query_budget = 6
     
     @swagger_auto_schema(
         operation_description="List all reports purchased by the authenticated client.",
@@ -493,23 +560,46 @@ class MyPurchasesView(generics.ListAPIView):
 
 class SecureReportViewerView(APIView):
     permission_classes = [permissions.IsAuthenticated, HasPurchasedReport]
+    query_budget = 5
     
     @swagger_auto_schema(
         operation_description="Serve a watermarked PDF report to the user if purchased.",
         responses={
             200: 'PDF file response',
             404: 'File not found',
-            500: 'Unable to serve report'
+            500: 'Unable to serve report',
+            503: 'Watermarked copy not ready yet'
         }
     )
     def get(self, request, report_id):
         try:
             report = get_object_or_404(Report, id=report_id)
-            file_path = add_watermark_to_pdf(report.file.path, request.user)
-            if not os.path.exists(file_path):
-                raise FileNotFoundError("Watermarked file not found")
-            response = FileResponse(open(file_path, 'rb'), content_type='application/pdf')
-            response['Content-Disposition'] = f'inline; filename="{report.title}.pdf"'
+            linearize = request.query_params.get('linearized')
+            linearize = None if linearize is None else linearize.lower() in ('1', 'true', 'yes')
+            # The cache key identifies the exact watermarked bytes, so it doubles as a strong ETag
+            cache_key = get_watermark_cache_key(report.file.path, request.user, linearize)
+            etag = quote_etag(cache_key)
+            if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+            if etag in if_none_match or '*' in if_none_match:
+                response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+                response['ETag'] = etag
+                response['Cache-Control'] = 'private, no-cache'
+                return response
+
+            streaming = getattr(settings, 'SECURE_VIEWER_STREAMING', False)
+            if streaming and 'HTTP_RANGE' not in request.META and not watermarked_pdf_cache.get(cache_key):
+                # Priming pulls the first chunk here so parse errors still produce a proper error response
+                chunks = prime_stream(stream_watermarked_pdf(report.file.path, request.user, cache_key=cache_key, linearize=linearize))
+                response = StreamingHttpResponse(chunks, content_type='application/pdf')
+            else:
+                file_path = add_watermark_to_pdf(report.file.path, request.user, linearize=linearize, offload=True)
+                if not os.path.exists(file_path):
+                    raise FileNotFoundError("Watermarked file not found")
+                response = self.file_response(request, file_path, etag)
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+            response['Accept-Ranges'] = 'bytes'
+            response['Content-Disposition'] = content_disposition_header(False, report.original_file_name or f'{report.title}.pdf')
             response['X-Frame-Options'] = 'DENY'
             response['Content-Security-Policy'] = (
                 "default-src 'self'; "
@@ -519,6 +609,11 @@ class SecureReportViewerView(APIView):
                 "connect-src 'self';"
             )
             return response
+        except WatermarkJobTimeout as e:
+            logger.error(f"Watermark timeout in SecureReportViewerView: {str(e)}")
+            response = Response({'error': 'Report is still being prepared, please retry shortly'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = '10'
+            return response
         except FileNotFoundError as e:
             logger.error(f"File error in SecureReportViewerView: {str(e)}")
             return Response({'error': 'Unable to serve report: File not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -526,12 +621,88 @@ class SecureReportViewerView(APIView):
             logger.error(f"Error in SecureReportViewerView: {str(e)}")
             return Response({'error': 'Unable to serve report'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    def file_response(self, request, file_path, etag):
+        size = os.path.getsize(file_path)
+        range_header = request.META.get('HTTP_RANGE')
+        # A stale If-Range validator means the client's partial copy is outdated: send everything
+        if not range_header or request.META.get('HTTP_IF_RANGE', etag) != etag:
+            return FileResponse(open(file_path, 'rb'), content_type='application/pdf')
+        try:
+            byte_range = parse_range_header(range_header, size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        if byte_range is None:
+            return FileResponse(open(file_path, 'rb'), content_type='application/pdf')
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            iter_file_range(file_path, start, end),
+            status=status.HTTP_206_PARTIAL_CONTENT,
+            content_type='application/pdf'
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+        return response
+
+class ReportPageImageView(APIView):
+    permission_classes = [permissions.IsAuthenticated, HasPurchasedReport]
+    query_budget = 5
+    
+    @swagger_auto_schema(
+        operation_description="Serve one watermarked page of a purchased report as a PNG or WebP image. Query params: dpi, image_format (png|webp).",
+        responses={
+            200: 'Page image',
+            304: 'Not modified',
+            400: 'Invalid dpi or format',
+            404: 'Page or file not found',
+            500: 'Unable to render page'
+        }
+    )
+    def get(self, request, report_id, page_number):
+        # "format" is taken by DRF's renderer override, hence image_format
+        image_format = request.query_params.get('image_format', 'webp').lower()
+        if image_format not in PAGE_IMAGE_FORMATS:
+            return Response({'error': 'image_format must be png or webp'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            dpi = clamp_dpi(request.query_params.get('dpi', getattr(settings, 'PAGE_IMAGE_DEFAULT_DPI', 96)))
+        except ValueError:
+            return Response({'error': 'Invalid dpi'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            report = get_object_or_404(Report, id=report_id)
+            ingested = report.ingestion_status == 'ready'
+            if ingested and not 1 <= page_number <= report.page_count:
+                raise PageOutOfRange(f'page {page_number} of {report.page_count}')
+            watermark_text = render_watermark_text(request.user)
+            cache_key = get_page_image_cache_key(
+                report.file.path, page_number, dpi, image_format, watermark_text,
+                digest=report.file_sha256 if ingested else None
+            )
+            etag = quote_etag(cache_key)
+            if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+                response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                file_path = get_page_image(report.file.path, page_number, dpi, image_format, watermark_text, cache_key=cache_key)
+                response = FileResponse(open(file_path, 'rb'), content_type=PAGE_IMAGE_FORMATS[image_format][1])
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, max-age=3600'
+            return response
+        except PageOutOfRange as e:
+            return Response({'error': f'Page not found: {str(e)}'}, status=status.HTTP_404_NOT_FOUND)
+        except FileNotFoundError as e:
+            logger.error(f"File error in ReportPageImageView: {str(e)}")
+            return Response({'error': 'Unable to render page: File not found'}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"Error in ReportPageImageView: {str(e)}")
+            return Response({'error': 'Unable to render page'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 # ========================================
 # ADMIN DASHBOARD VIEWS
 # ========================================
 
 class AdminDashboardView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsManagementUser]
+    query_budget = 12
     
     @swagger_auto_schema(
         operation_description="Get admin dashboard analytics and summaries.",
@@ -541,21 +712,21 @@ class AdminDashboardView(APIView):
         }
     )
     def get(self, request):
-        today = timezone.now().date()
+        today = timezone.localdate()
         last_30_days = today - timedelta(days=30)
         last_7_days = today - timedelta(days=7)
         
         total_revenue = Transaction.objects.filter(confirmed=True).aggregate(total=Sum('amount'))['total'] or 0
-        revenue_30_days = Transaction.objects.filter(confirmed=True, paid_at__date__gte=last_30_days).aggregate(total=Sum('amount'))['total'] or 0
-        revenue_7_days = Transaction.objects.filter(confirmed=True, paid_at__date__gte=last_7_days).aggregate(total=Sum('amount'))['total'] or 0
+        revenue_30_days = Transaction.objects.filter(date_window('paid_at', last_30_days), confirmed=True).aggregate(total=Sum('amount'))['total'] or 0
+        revenue_7_days = Transaction.objects.filter(date_window('paid_at', last_7_days), confirmed=True).aggregate(total=Sum('amount'))['total'] or 0
         total_clients = UserProfile.objects.filter(profile_type='Client').count()
-        new_clients_30_days = UserProfile.objects.filter(profile_type='Client', join_date__date__gte=last_30_days).count()
+        new_clients_30_days = UserProfile.objects.filter(date_window('join_date', last_30_days), profile_type='Client').count()
         total_reports = Report.objects.count()
         active_reports = Report.objects.filter(is_active=True).count()
         total_purchases = PurchasedReport.objects.count()
-        recent_orders = Order.objects.filter(status='paid').order_by('-created_at')[:10]
-        recent_clients = UserProfile.objects.filter(profile_type='Client').order_by('-join_date')[:10]
-        top_reports = Report.objects.annotate(purchase_count=Count('purchasedreport')).order_by('-purchase_count')[:10]
+        recent_orders = plan_queryset(Order.objects.filter(status='paid').order_by('-created_at'), OrderSummarySerializer)[:10]
+        recent_clients = plan_queryset(UserProfile.objects.filter(profile_type='Client').order_by('-join_date'), ClientSummarySerializer)[:10]
+        top_reports = plan_queryset(Report.objects.order_by('-purchase_count'), ReportSerializer)[:10]
         
         data = {
             'revenue': {
@@ -578,10 +749,12 @@ class AdminDashboardView(APIView):
         }
         return Response(data)
 
-class ManageReportsView(generics.ListCreateAPIView):
+class ManageReportsView(KeysetPaginationMixin, SparseFieldsetViewMixin, SerializerQueryPlanMixin, generics.ListCreateAPIView):
     serializer_class = ReportSerializer
     permission_classes = [permissions.IsAuthenticated, CanManageReports]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('-created_at', '-id')
+    query_budget = {'GET': 5, 'POST': 6}
     
     def get_queryset(self):
         queryset = Report.objects.all()
@@ -607,10 +780,11 @@ class ManageReportsView(generics.ListCreateAPIView):
     def post(self, request, *args, **kwargs):
         return super().post(request, *args, **kwargs)
 
-class ManageReportDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ManageReportDetailView(SerializerQueryPlanMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ReportSerializer
     permission_classes = [permissions.IsAuthenticated, CanManageReports]
     queryset = Report.objects.all()
+    query_budget = {'GET': 4, 'PUT': 5, 'PATCH': 5, 'DELETE': 11}
     
     @swagger_auto_schema(
         operation_description="Update a report (admin only).",
@@ -638,10 +812,124 @@ class ManageReportDetailView(generics.RetrieveUpdateDestroyAPIView):
     def patch(self, request, *args, **kwargs):
         return super().patch(request, *args, **kwargs)
 
+    def perform_update(self, serializer):
+        old_path = serializer.instance.file.path if serializer.instance.file else None
+        report = serializer.save()
+        # Drop parsed structure for the old and new file; entries are also keyed by mtime and
+        # size, so other worker processes simply miss on a replaced file
+        for path in {old_path, report.file.path if report.file else None} - {None}:
+            pdf_structure_cache.invalidate(path)
+
+    def perform_destroy(self, instance):
+        if instance.file:
+            pdf_structure_cache.invalidate(instance.file.path)
+        instance.delete()
+
+class ReportUploadsView(APIView):
+    """
+    Starts a chunked upload of a report file. Chunks are then PUT to the
+    upload with a Content-Range header and the upload is completed into a new
+    report, or into the report given by report_id.
+    """
+    permission_classes = [permissions.IsAuthenticated, CanManageReports]
+    query_budget = 5
+    
+    @swagger_auto_schema(
+        operation_description="Start a resumable chunked upload of a report file (admin only).",
+        request_body=ReportUploadCreateSerializer,
+        responses={
+            201: openapi.Response('Upload started', ReportUploadSerializer),
+            400: 'Invalid input data',
+            413: 'File too large'
+        }
+    )
+    def post(self, request):
+        serializer = ReportUploadCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        report = Report.objects.get(id=data['report_id']) if data.get('report_id') else None
+        try:
+            upload = start_upload(request.user, data['filename'], data['total_size'], data.get('sha256', ''), report)
+        except UploadRejected as e:
+            return Response({'error': str(e)}, status=e.status_code)
+        return Response(ReportUploadSerializer(upload).data, status=status.HTTP_201_CREATED)
+
+class ReportUploadDetailView(APIView):
+    permission_classes = [permissions.IsAuthenticated, CanManageReports]
+    query_budget = {'GET': 4, 'PUT': 6, 'DELETE': 5}
+    
+    @swagger_auto_schema(
+        operation_description="Get the state of an upload; a broken upload resumes at received_bytes.",
+        responses={200: openapi.Response('Upload state', ReportUploadSerializer), 404: 'Upload not found'}
+    )
+    def get(self, request, upload_id):
+        upload = get_object_or_404(ReportUpload, upload_id=upload_id)
+        return Response(ReportUploadSerializer(upload).data)
+    
+    @swagger_auto_schema(
+        operation_description="Upload one chunk as the raw request body with a 'Content-Range: bytes start-end/total' header.",
+        responses={
+            200: openapi.Response('Chunk stored', ReportUploadSerializer),
+            409: 'Chunk does not start at received_bytes',
+            413: 'Chunk or file too large'
+        }
+    )
+    def put(self, request, upload_id):
+        upload = get_object_or_404(ReportUpload, upload_id=upload_id)
+        content_length = request.META.get('CONTENT_LENGTH')
+        try:
+            upload = write_chunk(
+                upload, request.stream or BytesIO(), request.META.get('HTTP_CONTENT_RANGE'),
+                int(content_length) if content_length else None
+            )
+        except UploadOffsetMismatch as e:
+            return Response({'error': str(e), 'received_bytes': e.expected}, status=status.HTTP_409_CONFLICT)
+        except UploadRejected as e:
+            return Response({'error': str(e)}, status=e.status_code)
+        return Response(ReportUploadSerializer(upload).data)
+    
+    def delete(self, request, upload_id):
+        upload = get_object_or_404(ReportUpload, upload_id=upload_id, status='uploading')
+        cancel_upload(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class ReportUploadCompleteView(APIView):
+    permission_classes = [permissions.IsAuthenticated, CanManageReports]
+    query_budget = 11
+    
+    @swagger_auto_schema(
+        operation_description="Finish an upload. Uploads for a new report take the report fields in the body.",
+        request_body=ReportSerializer,
+        responses={
+            201: openapi.Response('Report created', ReportDetailSerializer),
+            200: openapi.Response('Report file replaced', ReportDetailSerializer),
+            400: 'Upload incomplete or invalid report data',
+            422: 'Checksum mismatch'
+        }
+    )
+    def post(self, request, upload_id):
+        upload = get_object_or_404(ReportUpload.objects.select_related('report'), upload_id=upload_id)
+        serializer = None
+        if upload.report is None:
+            serializer = ReportSerializer(data=request.data, context={'request': request})
+            serializer.is_valid(raise_exception=True)
+        old_path = upload.report.file.path if upload.report and upload.report.file else None
+        try:
+            report = finish_upload(upload, serializer)
+        except UploadRejected as e:
+            return Response({'error': str(e)}, status=e.status_code)
+        if old_path:
+            pdf_structure_cache.invalidate(old_path)
+        return Response(
+            ReportDetailSerializer(report, context={'request': request}).data,
+            status=status.HTTP_200_OK if old_path else status.HTTP_201_CREATED
+        )
+
 class ManageCategoriesView(generics.ListCreateAPIView):
     serializer_class = ReportCategorySerializer
     permission_classes = [permissions.IsAuthenticated, CanManageReports]
     queryset = ReportCategory.objects.all()
+    query_budget = {'GET': 5, 'POST': 5}
     
     @swagger_auto_schema(
         operation_description="Create a new report category (admin only).",
@@ -655,10 +943,12 @@ class ManageCategoriesView(generics.ListCreateAPIView):
     def post(self, request, *args, **kwargs):
         return super().post(request, *args, **kwargs)
 
-class ManageOrdersView(generics.ListAPIView):
+class ManageOrdersView(KeysetPaginationMixin, SparseFieldsetViewMixin, SerializerQueryPlanMixin, generics.ListAPIView):
     serializer_class = OrderSummarySerializer
     permission_classes = [permissions.IsAuthenticated, IsManagementUser]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('-created_at', '-id')
+    query_budget = 5
     
     def get_queryset(self):
         queryset = Order.objects.all()
@@ -670,21 +960,23 @@ class ManageOrdersView(generics.ListAPIView):
             queryset = queryset.filter(status=status_filter)
         if start_date:
             try:
-                queryset = queryset.filter(created_at__date__gte=datetime.strptime(start_date, '%Y-%m-%d').date())
+                queryset = queryset.filter(date_window('created_at', start=datetime.strptime(start_date, '%Y-%m-%d').date()))
             except ValueError:
                 pass
         if end_date:
             try:
-                queryset = queryset.filter(created_at__date__lte=datetime.strptime(end_date, '%Y-%m-%d').date())
+                queryset = queryset.filter(date_window('created_at', end=datetime.strptime(end_date, '%Y-%m-%d').date()))
             except ValueError:
                 pass
         
         return queryset.order_by('-created_at')
 
-class ManageClientsView(generics.ListAPIView):
+class ManageClientsView(KeysetPaginationMixin, SparseFieldsetViewMixin, SerializerQueryPlanMixin, generics.ListAPIView):
     serializer_class = ClientSummarySerializer
     permission_classes = [permissions.IsAuthenticated, IsManagementUser]
     pagination_class = StandardResultsSetPagination
+    keyset_ordering = ('-join_date', '-id')
+    query_budget = 5
     
     def get_queryset(self):
         queryset = UserProfile.objects.filter(profile_type='Client')
@@ -702,6 +994,7 @@ class ManageClientsView(generics.ListAPIView):
 
 class RevenueAnalyticsView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsManagementUser]
+    query_budget = 40  # 3 per month of the trailing year, plus the top reports
     
     @swagger_auto_schema(
         operation_description="Get revenue analytics for the admin dashboard.",
@@ -711,7 +1004,7 @@ class RevenueAnalyticsView(APIView):
         }
     )
     def get(self, request):
-        today = timezone.now().date()
+        today = timezone.localdate()
         twelve_months_ago = today - timedelta(days=365)
         monthly_revenue = []
         
@@ -719,15 +1012,15 @@ class RevenueAnalyticsView(APIView):
             month_start = today.replace(day=1) - timedelta(days=30*i)
             month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
             revenue = Transaction.objects.filter(
-                confirmed=True,
-                paid_at__date__range=[month_start, month_end]
+                date_window('paid_at', month_start, month_end),
+                confirmed=True
             ).aggregate(total=Sum('amount'))['total'] or 0
             orders_count = Transaction.objects.filter(
-                confirmed=True,
-                paid_at__date__range=[month_start, month_end]
+                date_window('paid_at', month_start, month_end),
+                confirmed=True
             ).count()
             reports_sold = PurchasedReport.objects.filter(
-                purchased_on__date__range=[month_start, month_end]
+                date_window('purchased_on', month_start, month_end)
             ).count()
             
             monthly_revenue.append({
@@ -738,7 +1031,6 @@ class RevenueAnalyticsView(APIView):
             })
         
         top_reports = Report.objects.annotate(
-            purchase_count=Count('purchasedreport'),
             total_revenue=Sum('orderitem__price')
         ).order_by('-total_revenue')[:10]
         
@@ -754,20 +1046,39 @@ class RevenueAnalyticsView(APIView):
             ]
         })
 
-class PublicReportsView(generics.ListAPIView):
+class WatermarkStatsView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsManagementUser]
+    query_budget = 3
+    
+    @swagger_auto_schema(
+        operation_description="Get watermark pre-warm queue and cache metrics.",
+        responses={
+            200: openapi.Response('Watermark metrics', schema=openapi.Schema(type=openapi.TYPE_OBJECT)),
+            401: 'Unauthorized'
+        }
+    )
+    def get(self, request):
+        return Response({
+            'prewarm': warm_pool.stats(),
+            'ingestion': ingestion_pool.stats(),
+            'process_pool': watermark_executor.stats(),
+            'watermarked_cache': watermarked_pdf_cache.stats(),
+            'typeahead': typeahead_index.stats(),
+            'catalog_cache': catalog_response_cache.stats(),
+        })
+
+class PublicReportsView(CatalogResponseCacheMixin, ReportSearchMixin, SparseFieldsetViewMixin, SerializerQueryPlanMixin, generics.ListAPIView):
     serializer_class = ReportSerializer
     pagination_class = StandardResultsSetPagination
     permission_classes = []  # No authentication required
+    query_budget = 7
     
     def get_queryset(self):
         queryset = Report.objects.filter(is_active=True)
-        search = self.request.query_params.get('search')
         category = self.request.query_params.get('category')
         min_price = self.request.query_params.get('min_price')
         max_price = self.request.query_params.get('max_price')
         
-        if search:
-            queryset = queryset.filter(Q(title__icontains=search) | Q(description__icontains=search))
         if category:
             queryset = queryset.filter(category__slug=category)
         if min_price:
@@ -781,12 +1092,37 @@ class PublicReportsView(generics.ListAPIView):
             except (ValueError, TypeError):
                 pass
         
-        return queryset.order_by('-created_at')
+        return self.apply_search(queryset)
+
+class ReportAutocompleteView(APIView):
+    """
+    Typeahead suggestions for the catalog search box, served from the
+    in-process prefix index instead of a paginated report query.
+    """
+    permission_classes = []  # No authentication required
+    query_budget = 4
+    
+    @swagger_auto_schema(
+        operation_description="Suggest active report titles and category names starting with q.",
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, description='Text typed so far'),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, description='Maximum suggestions'),
+        ],
+        responses={200: openapi.Response('Suggestions', schema=openapi.Schema(type=openapi.TYPE_OBJECT))}
+    )
+    def get(self, request):
+        max_limit = getattr(settings, 'TYPEAHEAD_MAX_LIMIT', 20)
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 8)), max_limit))
+        except ValueError:
+            limit = 8
+        return Response({'results': typeahead_index.lookup(request.query_params.get('q', ''), limit)})
 
-class PublicCategoriesView(generics.ListAPIView):
+class PublicCategoriesView(CatalogResponseCacheMixin, SparseFieldsetViewMixin, generics.ListAPIView):
     serializer_class = ReportCategorySerializer
     permission_classes = []  # No authentication required
     queryset = ReportCategory.objects.all()
+    query_budget = 4
     
 
 # Payment utility functions
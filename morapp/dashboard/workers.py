@@ -0,0 +1,95 @@
+import queue
+import threading
+import logging
+from django.db import close_old_connections
+
+logger = logging.getLogger('dashboard')
+
+class BoundedWorkerPool:
+    """
+    Bounded pool of daemon worker threads for background jobs keyed by an id.
+    The job queue has a fixed capacity: submit() waits up to enqueue_timeout
+    for a free slot and then drops the job, so a burst of work can never pile
+    up unbounded behind the request that triggered it. Ids already queued or
+    running are not queued twice. Subclasses implement handle(item).
+    """
+    name = 'worker'
+
+    def __init__(self, workers=2, max_queue=100, enqueue_timeout=0.5):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.enqueue_timeout = enqueue_timeout
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._pending = set()
+        self._active = 0
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        with self._lock:
+            if item in self._pending:
+                return True
+            self._pending.add(item)
+        self._start()
+        try:
+            self.queue.put(item, timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(item)
+                self.rejected += 1
+            logger.warning(f"{self.name} queue full ({self.max_queue}), dropping job {item}")
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'max_queue': self.max_queue,
+                'active': self._active,
+                'workers': self.workers,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
+
+    def _start(self):
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f'{self.name}-{len(self._threads)}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            with self._lock:
+                self._active += 1
+            try:
+                self.handle(item)
+                with self._lock:
+                    self.completed += 1
+            except Exception as e:
+                logger.error(f"Error in {self.name} job {item}: {str(e)}")
+                with self._lock:
+                    self.failed += 1
+            finally:
+                close_old_connections()
+                with self._lock:
+                    self._active -= 1
+                    self._pending.discard(item)
+                self.queue.task_done()
+
+    def handle(self, item):
+        raise NotImplementedError
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'dashboard.middleware.QueryBudgetMiddleware',  # First, so queries made by the other middleware count too
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -169,6 +170,8 @@ ALLOWED_REPORT_EXTENSIONS = ['.pdf']
 ALLOWED_IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
 MAX_REPORT_FILE_SIZE_MB = 50
 MAX_IMAGE_FILE_SIZE_MB = 10
+REPORT_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # Largest chunk accepted by the resumable upload API
+REPORT_BLOB_GC_GRACE_HOURS = 24  # Unreferenced report blobs are kept this long before gc_report_blobs removes them
 
 # Security Settings for Reports
 SECURE_FILE_UPLOADS = True
@@ -177,6 +180,44 @@ WATERMARK_TEXT_TEMPLATE = 'Licensed to: {user_name} | {user_email}'
 DISABLE_RIGHT_CLICK = True
 DISABLE_COPY_PASTE = True
 DOWNLOAD_TOKEN_EXPIRY_HOURS = 24
+WATERMARK_ENGINE = 'xobject'  # 'xobject' (shared Form XObject, single-revision rewrite) or 'merge' (per-page merge)
+WATERMARK_OVERLAY_CACHE_MAX_ENTRIES = 256
+WATERMARK_OVERLAY_CACHE_MAX_BYTES = 8 * 1024 * 1024  # 8MB
+WATERMARKED_PDF_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2GB of finished watermarked copies
+SECURE_VIEWER_STREAMING = False  # Stream watermarked PDFs while they are generated
+WATERMARK_STREAM_CHUNK_SIZE = 64 * 1024  # 64KB
+WATERMARK_STREAM_MAX_CHUNKS = 8  # Chunks buffered between the merge thread and the response
+WATERMARK_LINEARIZE = False  # Write watermarked copies as linearized (fast web view) PDFs
+WATERMARK_SPOOL_MAX_MEMORY = 8 * 1024 * 1024  # Stamped copies larger than this spool to disk before linearizing
+WATERMARK_PREWARM_ENABLED = True  # Build the buyer's watermarked copy in the background after purchase
+WATERMARK_PREWARM_WORKERS = 2
+WATERMARK_PREWARM_MAX_QUEUE = 100  # Jobs beyond this are dropped and built on first open instead
+WATERMARK_PREWARM_ENQUEUE_TIMEOUT = 0.5  # Seconds to wait for a free queue slot
+WATERMARK_PROCESS_POOL_SIZE = 2  # Worker processes for watermarking; 0 runs it in the request thread
+WATERMARK_JOB_TIMEOUT = 120  # Seconds before a watermark job is aborted
+WATERMARK_PROCESS_START_METHOD = 'spawn'
+PDF_STRUCTURE_CACHE_MAX_ENTRIES = 128  # Parsed report structures kept per process
+PDF_STRUCTURE_CACHE_MAX_BYTES = 32 * 1024 * 1024  # 32MB
+PAGE_IMAGE_DEFAULT_DPI = 96
+PAGE_IMAGE_MIN_DPI = 36
+PAGE_IMAGE_MAX_DPI = 300
+PAGE_IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512MB of rendered page images
+REPORT_INGESTION_WORKERS = 1  # Threads computing report file metadata after upload
+REPORT_INGESTION_MAX_QUEUE = 100
+REPORT_INGESTION_ENQUEUE_TIMEOUT = 0.5
+PREVIEW_THUMBNAIL_WIDTHS = (160, 320, 640)  # Blurred first-page previews generated at ingestion
+PREVIEW_DEFAULT_WIDTH = 320  # Used when the client does not send preview_width
+PREVIEW_BLUR_RADIUS = 6
+REPORT_SEARCH_MAX_HITS = 1000  # Matching pages read from the full-text index per q= search
+REPORT_SEARCH_SNIPPETS_PER_REPORT = 3
+TYPEAHEAD_MAX_WORDS = 6  # Title words a suggestion can be found by (each word start is indexed)
+TYPEAHEAD_MAX_LIMIT = 20
+TYPEAHEAD_REBUILD_SECONDS = 300  # Full rebuild picks up writes made by other worker processes
+CATALOG_RESPONSE_CACHE_TTL = 60  # Seconds a cached public catalog page is served as fresh; 0 disables the cache
+CATALOG_RESPONSE_CACHE_STALE_SECONDS = 300  # Served while one request rebuilds it, then dropped
+CATALOG_RESPONSE_CACHE_LOCK_SECONDS = 30
+QUERY_BUDGET_DEFAULT = 11  # Query budget for views that declare none, i.e. third-party ones like TokenRefreshView (measured 9)
+QUERY_BUDGET_RAISE = False  # Over-budget requests log a warning; the test suite turns this on so they fail instead
 
 # Business Logic Settings
 DEFAULT_REPORT_CATEGORY = 'General'
@@ -252,6 +293,12 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    # Report files and previews are stored once per distinct content under MEDIA_ROOT/blobs/
+    'reports': {'BACKEND': 'dashboard.storage.ContentAddressedStorage'},
+}
 
 # Media files
 MEDIA_URL = '/media/'
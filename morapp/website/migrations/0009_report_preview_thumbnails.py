@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0008_report_ingestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='preview_thumbnails',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
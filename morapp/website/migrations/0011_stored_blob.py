@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:42
+
+import django.utils.timezone
+import website.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0010_report_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredBlob',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField()),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_saved_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='report',
+            name='file',
+            field=models.FileField(storage=website.models.report_file_storage, upload_to='reports/'),
+        ),
+        migrations.AlterField(
+            model_name='report',
+            name='preview_image',
+            field=models.ImageField(blank=True, null=True, storage=website.models.report_file_storage, upload_to='report_previews/'),
+        ),
+    ]
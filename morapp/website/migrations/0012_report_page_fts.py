@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def create_page_index(apps, schema_editor):
+    # Full-text index of report page text (dashboard.search); other backends fall back to icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS website_reportpage_fts USING fts5("
+        "report_id UNINDEXED, page_number UNINDEXED, body, "
+        "tokenize = 'porter unicode61 remove_diacritics 2')"
+    )
+
+
+def drop_page_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS website_reportpage_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0011_stored_blob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_page_index, drop_page_index),
+    ]
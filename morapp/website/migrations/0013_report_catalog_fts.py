@@ -0,0 +1,13 @@
+from django.db import migrations
+from ._catalog_index import create_catalog_index, drop_catalog_index
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0012_report_page_fts'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_catalog_index, drop_catalog_index),
+    ]
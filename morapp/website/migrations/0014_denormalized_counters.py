@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-16 23:58
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from ._catalog_index import drop_catalog_triggers, restore_catalog_triggers
+
+
+def populate_counters(apps, schema_editor):
+    Report = apps.get_model('website', 'Report')
+    ReportCategory = apps.get_model('website', 'ReportCategory')
+    PurchasedReport = apps.get_model('website', 'PurchasedReport')
+    purchases = PurchasedReport.objects.filter(report=OuterRef('pk')).order_by().values('report')
+    Report.objects.update(purchase_count=Coalesce(Subquery(purchases.annotate(n=Count('id')).values('n')), 0))
+    active = Report.objects.filter(category=OuterRef('pk'), is_active=True).order_by().values('category')
+    ReportCategory.objects.update(active_report_count=Coalesce(Subquery(active.annotate(n=Count('id')).values('n')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0013_report_catalog_fts'),
+    ]
+
+    operations = [
+        # Adding the columns rebuilds both tables; the catalog search triggers come off first and go back after
+        migrations.RunPython(drop_catalog_triggers, restore_catalog_triggers),
+        migrations.AddField(
+            model_name='report',
+            name='purchase_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reportcategory',
+            name='active_report_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+        migrations.RunPython(restore_catalog_triggers, drop_catalog_triggers),
+    ]
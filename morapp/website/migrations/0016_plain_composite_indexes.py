@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0015_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['is_active', 'created_at', 'id'], name='report_is_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['confirmed', 'paid_at'], name='txn_confirmed_paid_at_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from ._catalog_index import configure_catalog_rank, reset_catalog_rank
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0016_plain_composite_indexes'),
+    ]
+
+    operations = [
+        # The catalog index table itself comes from 0013; this only describes it to the ORM
+        migrations.CreateModel(
+            name='ReportCatalogEntry',
+            fields=[
+                ('report', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='catalog_entry', serialize=False, to='website.report')),
+                ('document', models.TextField(db_column='website_report_catalog_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'website_report_catalog_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(configure_catalog_rank, reset_catalog_rank),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-17 01:48
+
+import os
+import website.models
+from django.db import migrations, models
+from ._catalog_index import drop_catalog_triggers, restore_catalog_triggers
+
+
+def populate_original_file_names(apps, schema_editor):
+    # Files stored before content addressing keep their uploaded name; blobs
+    # take the name of the chunked upload that filled them, when there is one
+    Report = apps.get_model('website', 'Report')
+    ReportUpload = apps.get_model('website', 'ReportUpload')
+    for report_id, name in Report.objects.exclude(file='').values_list('id', 'file').iterator():
+        if name.startswith('blobs/'):
+            upload = ReportUpload.objects.filter(report_id=report_id, status='complete').order_by('-updated_at').first()
+            original = upload.filename if upload else ''
+        else:
+            original = os.path.basename(name)
+        if original:
+            Report.objects.filter(id=report_id).update(original_file_name=original[:255])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0017_report_catalog_entry'),
+    ]
+
+    operations = [
+        # Adding the column rebuilds website_report; the catalog search triggers come off first and go back after
+        migrations.RunPython(drop_catalog_triggers, restore_catalog_triggers),
+        migrations.AddField(
+            model_name='report',
+            name='original_file_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='report',
+            name='file',
+            field=website.models.ReportFileField(storage=website.models.report_file_storage, upload_to='reports/'),
+        ),
+        migrations.RunPython(populate_original_file_names, migrations.RunPython.noop),
+        migrations.RunPython(restore_catalog_triggers, drop_catalog_triggers),
+    ]
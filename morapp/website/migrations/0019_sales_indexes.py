@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-17 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('website', '0018_report_original_file_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchasedreport',
+            index=models.Index(fields=['purchased_on'], name='purchase_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['purchase_count'], name='report_purchase_count_idx'),
+        ),
+    ]
@@ -0,0 +1,115 @@
+# SQL for the catalog search index over report title, description and category name (dashboard.search).
+# Triggers keep it in step with every write, including queryset updates and bulk_create.
+# Shared by the migrations that create the index and those that rebuild website_report.
+#
+# SQLite drops a table's triggers whenever a migration rebuilds it (most
+# AlterField, AddField, RemoveField and constraint changes do), and renaming the
+# rebuilt website_report into place fails while the category trigger refers to
+# it. So a later migration that alters website_report wraps its operations as
+# 0014 does,
+#
+#     migrations.RunPython(drop_catalog_triggers, restore_catalog_triggers),
+#     ...operations on Report...
+#     migrations.RunPython(restore_catalog_triggers, drop_catalog_triggers),
+#
+# A migration that leaves them off is caught at the end of `migrate`: the
+# dashboard's post_migrate receiver (dashboard.search.restore_catalog_triggers_handler)
+# recreates missing triggers and reindexes, and `manage.py ingest_reports`
+# warns when they are missing (dashboard.search.missing_catalog_triggers).
+
+TABLE_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS website_report_catalog_fts USING fts5("
+    "title, description, category, "
+    "tokenize = 'porter unicode61 remove_diacritics 2', prefix = '2 3')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS website_report_catalog_vocab "
+    "USING fts5vocab(website_report_catalog_fts, row)",
+]
+
+TRIGGER_SQL = [
+    "CREATE TRIGGER IF NOT EXISTS website_report_catalog_ai AFTER INSERT ON website_report BEGIN "
+    "INSERT INTO website_report_catalog_fts (rowid, title, description, category) VALUES ("
+    "new.id, new.title, new.description, "
+    "(SELECT name FROM website_reportcategory WHERE id = new.category_id)); END",
+    "CREATE TRIGGER IF NOT EXISTS website_report_catalog_au "
+    "AFTER UPDATE OF title, description, category_id ON website_report BEGIN "
+    "DELETE FROM website_report_catalog_fts WHERE rowid = old.id; "
+    "INSERT INTO website_report_catalog_fts (rowid, title, description, category) VALUES ("
+    "new.id, new.title, new.description, "
+    "(SELECT name FROM website_reportcategory WHERE id = new.category_id)); END",
+    "CREATE TRIGGER IF NOT EXISTS website_report_catalog_ad AFTER DELETE ON website_report BEGIN "
+    "DELETE FROM website_report_catalog_fts WHERE rowid = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS website_reportcategory_catalog_au "
+    "AFTER UPDATE OF name ON website_reportcategory BEGIN "
+    "UPDATE website_report_catalog_fts SET category = new.name "
+    "WHERE rowid IN (SELECT id FROM website_report WHERE category_id = new.id); END",
+]
+
+# bm25 weights for title, description and category, used by the index's rank column
+RANK_SQL = "INSERT INTO website_report_catalog_fts (website_report_catalog_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0, 4.0)')"
+DEFAULT_RANK_SQL = "INSERT INTO website_report_catalog_fts (website_report_catalog_fts, rank) VALUES ('rank', 'bm25()')"
+
+POPULATE_SQL = [
+    "DELETE FROM website_report_catalog_fts",
+    "INSERT INTO website_report_catalog_fts (rowid, title, description, category) "
+    "SELECT r.id, r.title, r.description, c.name FROM website_report r "
+    "LEFT JOIN website_reportcategory c ON c.id = r.category_id",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS website_reportcategory_catalog_au",
+    "DROP TRIGGER IF EXISTS website_report_catalog_ad",
+    "DROP TRIGGER IF EXISTS website_report_catalog_au",
+    "DROP TRIGGER IF EXISTS website_report_catalog_ai",
+    "DROP TABLE IF EXISTS website_report_catalog_vocab",
+    "DROP TABLE IF EXISTS website_report_catalog_fts",
+]
+
+
+def create_catalog_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in TABLE_SQL + TRIGGER_SQL + POPULATE_SQL:
+        schema_editor.execute(statement)
+
+
+def restore_catalog_triggers(apps, schema_editor):
+    """
+    SQLite drops triggers when a migration rebuilds website_report, so
+    migrations that alter that table run this afterwards.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in TRIGGER_SQL + POPULATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_catalog_triggers(apps, schema_editor):
+    """
+    Renaming the rebuilt website_report into place fails while the category
+    trigger refers to it, so rebuilding migrations drop the triggers first.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL[:len(TRIGGER_SQL)]:
+        schema_editor.execute(statement)
+
+
+def configure_catalog_rank(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(RANK_SQL)
+
+
+def reset_catalog_rank(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(DEFAULT_RANK_SQL)
+
+
+def drop_catalog_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
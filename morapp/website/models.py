@@ -1,5 +1,9 @@
+import os
+import uuid
 from django.db import models
 from django.contrib.auth.models import User, Group
+from django.core.files.storage import storages
+from django.db.models.fields.files import FieldFile
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils import timezone
@@ -35,6 +39,10 @@ class UserProfile(models.Model):
         permissions = [
             ("can_change_profile_type", "Can change profile type field"),
         ]
+        indexes = [
+            # Client lists, newest first (also the keyset of ManageClientsView)
+            models.Index(fields=['profile_type', 'join_date', 'id'], name='profile_type_joined_idx'),
+        ]
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
@@ -45,16 +53,30 @@ def create_profile(sender, instance, created, **kwargs):
         group = Group.objects.get_or_create(name=profile_type)[0]
         instance.groups.add(group)
 
+def _exclude_counter_fields(instance, kwargs, counter_fields):
+    # Counters are changed with F() updates by dashboard.counters (and other fields with
+    # queryset updates); a full save of an instance loaded earlier would write its stale
+    # copy back over them
+    if instance._state.adding or kwargs.get('update_fields') is not None or kwargs.get('force_insert'):
+        return
+    deferred = instance.get_deferred_fields()
+    kwargs['update_fields'] = [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in counter_fields and field.attname not in deferred
+    ]
+
 # ========================
 # REPORT CATEGORY
 # ========================
 class ReportCategory(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=120, unique=True, blank=True)
+    active_report_count = models.PositiveIntegerField(default=0)  # Maintained by dashboard.counters
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        _exclude_counter_fields(self, kwargs, ('active_report_count',))
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -63,6 +85,19 @@ class ReportCategory(models.Model):
 # ========================
 # REPORT MODEL
 # ========================
+def report_file_storage():
+    # Content-addressed, deduplicating storage configured as STORAGES['reports'] (dashboard.storage)
+    return storages['reports']
+
+class ReportFieldFile(FieldFile):
+    def save(self, name, content, save=True):
+        # The storage names the file after its content hash; keep the name it was uploaded under
+        self.instance.original_file_name = os.path.basename(name)[:255]
+        super().save(name, content, save)
+
+class ReportFileField(models.FileField):
+    attr_class = ReportFieldFile
+
 class Report(models.Model):
     """
     Represents a digital report (the product).
@@ -70,26 +105,89 @@ class Report(models.Model):
       - Preview (blurred image)
       - Full locked file
     """
+    INGESTION_STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    )
+
     title = models.CharField(max_length=255)
     slug = models.SlugField(max_length=120, unique=True, blank=True)
     description = models.TextField()
     category = models.ForeignKey(ReportCategory, on_delete=models.SET_NULL, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    preview_image = models.ImageField(upload_to='report_previews/', blank=True, null=True)
-    file = models.FileField(upload_to='reports/')
+    preview_image = models.ImageField(upload_to='report_previews/', storage=report_file_storage, blank=True, null=True)
+    file = ReportFileField(upload_to='reports/', storage=report_file_storage)
+    original_file_name = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    # File metadata computed once by the ingestion stage (dashboard.ingestion)
+    ingestion_status = models.CharField(max_length=20, choices=INGESTION_STATUS_CHOICES, default='pending')
+    ingestion_error = models.TextField(null=True, blank=True)
+    ingested_at = models.DateTimeField(null=True, blank=True)
+    file_sha256 = models.CharField(max_length=64, blank=True)
+    file_byte_size = models.BigIntegerField(null=True, blank=True)
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    page_boxes = models.JSONField(default=list, blank=True)
+    pdf_version = models.CharField(max_length=10, blank=True)
+    preview_thumbnails = models.JSONField(default=dict, blank=True)  # {format: {width: media path}}
+    purchase_count = models.PositiveIntegerField(default=0)  # Maintained by dashboard.counters
+
+    class Meta:
+        indexes = [
+            # The public catalog, newest first; inactive reports stay out of the index.
+            # MySQL builds no partial indexes, so it gets the plain one below; Django
+            # filters there with is_active = true, which that index serves, while on
+            # SQLite it writes a bare WHERE is_active that only the partial one matches
+            models.Index(fields=['created_at', 'id'], name='report_active_created_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['is_active', 'created_at', 'id'], name='report_is_active_created_idx'),
+            # The management list, newest first whether active or not
+            models.Index(fields=['created_at', 'id'], name='report_created_idx'),
+            # The admin dashboard's best sellers
+            models.Index(fields=['purchase_count'], name='report_purchase_count_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         from django.utils.text import slugify
         if not self.slug:
             self.slug = slugify(self.title)
+        if self.file and not self.file._committed and kwargs.get('update_fields') is not None:
+            # Storing the new upload also sets original_file_name (ReportFieldFile.save)
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'original_file_name'}
+        if self.pk and self.ingestion_status != 'pending':
+            stored_file = Report.objects.filter(pk=self.pk).values_list('file', flat=True).first()
+            if stored_file != self.file.name:
+                # A replaced file needs its metadata recomputed
+                self.ingestion_status = 'pending'
+                if kwargs.get('update_fields') is not None:
+                    kwargs['update_fields'] = set(kwargs['update_fields']) | {'ingestion_status'}
+        # preview_thumbnails is written by ingestion together with its blob refcounts
+        _exclude_counter_fields(self, kwargs, ('purchase_count', 'preview_thumbnails'))
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.title
 
+class ReportCatalogEntry(models.Model):
+    """
+    A report's row in the catalog search index, the SQLite FTS5 table that
+    triggers keep in step with website_report (migrations/_catalog_index.py).
+    Read-only: searches join it to Report once and filter with
+    document__match (dashboard.search).
+    """
+    report = models.OneToOneField(Report, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+                                  related_name='catalog_entry')
+    # FTS5's hidden column named after the table: MATCH on it searches every column
+    document = models.TextField(db_column='website_report_catalog_fts')
+    rank = models.FloatField()  # bm25 with the column weights configured on the index
+
+    class Meta:
+        managed = False
+        db_table = 'website_report_catalog_fts'
+
 # ========================
 # ORDER MODEL
 # ========================
@@ -106,6 +204,12 @@ class Order(models.Model):
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at', 'id'], name='order_status_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.order_number} - {self.client.username}"
 
@@ -138,6 +242,14 @@ class Transaction(models.Model):
     paid_at = models.DateTimeField(auto_now_add=True)
     confirmed = models.BooleanField(default=False)
     failure_reason = models.TextField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Revenue totals and windows only ever read confirmed payments; the partial
+            # index serves SQLite and the plain one MySQL, which builds no partial indexes
+            models.Index(fields=['paid_at'], name='transaction_confirmed_paid_idx', condition=models.Q(confirmed=True)),
+            models.Index(fields=['confirmed', 'paid_at'], name='txn_confirmed_paid_at_idx'),
+        ]
     
     def __str__(self):
         return f"{self.transaction_id} - {'Confirmed' if self.confirmed else 'Pending'}"
@@ -156,6 +268,60 @@ class PurchasedReport(models.Model):
 
     class Meta:
         unique_together = ('client', 'report')
+        indexes = [
+            models.Index(fields=['client', 'purchased_on', 'id'], name='purchase_client_recent_idx'),
+            models.Index(fields=['purchased_on'], name='purchase_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.client.username} purchased {self.report.title}"
+
+# ========================
+# CHUNKED REPORT UPLOADS
+# ========================
+class ReportUpload(models.Model):
+    """
+    A resumable upload of a report file sent in chunks (see dashboard.uploads).
+    received_bytes is the offset of the last acknowledged chunk; the next chunk
+    must start there.
+    """
+    STATUS_CHOICES = (
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+        ('cancelled', 'Cancelled'),
+    )
+
+    upload_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    uploaded_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='report_uploads')
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    received_bytes = models.BigIntegerField(default=0)
+    expected_sha256 = models.CharField(max_length=64, blank=True)  # Optional checksum sent by the client
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    report = models.ForeignKey(Report, on_delete=models.SET_NULL, null=True, blank=True, related_name='uploads')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes}/{self.total_size})"
+
+
+# ========================
+# STORED BLOBS (Content-addressed report files)
+# ========================
+class StoredBlob(models.Model):
+    """
+    One deduplicated file in the content-addressed report storage.
+    refcount is the number of report file fields pointing at it; blobs left at
+    zero past the grace period are removed by the gc_report_blobs command.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_saved_at = models.DateTimeField(default=timezone.now)  # Last time these bytes were stored again
 
     def __str__(self):
-        return f"{self.client.username} purchased {self.report.title}"
\ No newline at end of file
+        return f"{self.name} ({self.refcount} refs)"
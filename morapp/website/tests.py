@@ -2,11 +2,13 @@ from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.contrib.auth.models import User
 from django.core.cache import cache
+from django.test import override_settings
 from website.models import UserProfile
 from django.core import mail
 import re
 import uuid
 
+@override_settings(QUERY_BUDGET_RAISE=True)
 class AuthAPITests(APITestCase):
     def setUp(self):
         self.client = APIClient()
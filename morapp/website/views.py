@@ -42,6 +42,7 @@ class IsManagement(BasePermission):
 class RegisterView(CreateAPIView):
     permission_classes = [AllowAny]
     serializer_class = RegisterSerializer
+    query_budget = 10
 
     @rate_limit(key='ip', rate='10/h')
     @swagger_auto_schema(
@@ -95,6 +96,7 @@ class RegisterView(CreateAPIView):
 class EmailVerificationView(APIView):
     permission_classes = [AllowAny]
     serializer_class = EmailVerificationSerializer
+    query_budget = 6
 
     @rate_limit(key='ip', rate='50/h')
     @swagger_auto_schema(
@@ -179,6 +181,7 @@ class EmailVerificationView(APIView):
 class LoginView(CreateAPIView):
     permission_classes = [AllowAny]
     serializer_class = LoginSerializer
+    query_budget = 6
 
     @rate_limit(key='ip', rate='50/h')
     @swagger_auto_schema(
@@ -235,6 +238,7 @@ class LoginView(CreateAPIView):
 class ProfileView(RetrieveUpdateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UserProfileSerializer
+    query_budget = {'GET': 4, 'PUT': 7, 'PATCH': 7}
 
     def get_object(self):
         try:
@@ -290,6 +294,7 @@ class ProfileView(RetrieveUpdateAPIView):
 
 class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = 8
 
     @swagger_auto_schema(
         operation_description="Logout user by blacklisting the refresh token.",
@@ -316,6 +321,7 @@ class LogoutView(APIView):
 
 class GoogleLoginView(APIView):
     permission_classes = [AllowAny]
+    query_budget = 12
 
     @rate_limit(key='ip', rate='50/h')
     @swagger_auto_schema(
@@ -359,6 +365,7 @@ class GoogleLoginView(APIView):
 
 class EmailLoginView(APIView):
     permission_classes = [AllowAny]
+    query_budget = 4
 
     @rate_limit(key='ip', rate='10/h')
     @swagger_auto_schema(
@@ -408,6 +415,7 @@ class EmailLoginView(APIView):
 
 class EmailLoginVerifyView(APIView):
     permission_classes = [AllowAny]
+    query_budget = 5
 
     @rate_limit(key='ip', rate='50/h')
     @swagger_auto_schema(
@@ -460,6 +468,7 @@ class EmailLoginVerifyView(APIView):
 
 class ForgotPasswordView(APIView):
     permission_classes = [AllowAny]
+    query_budget = 4
 
     @rate_limit(key='ip', rate='10/h')
     @swagger_auto_schema(
@@ -509,6 +518,7 @@ class ForgotPasswordView(APIView):
 
 class ResetPasswordView(APIView):
     permission_classes = [AllowAny]
+    query_budget = 4
 
     @rate_limit(key='ip', rate='10/h')
     @swagger_auto_schema(
@@ -592,6 +602,7 @@ class ResetPasswordView(APIView):
 #         return self.put(request, user_id)
 class ManageUserProfileView(APIView):
     permission_classes = [IsAuthenticated, IsManagement]
+    query_budget = 12
 
     @swagger_auto_schema(
         operation_description="Update another user's profile (admin/management only).",